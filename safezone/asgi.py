@@ -3,6 +3,23 @@ ASGI config for safezone project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+ASGI worker mode: the Procfile serves the site through uvicorn with
+
+    uvicorn safezone.asgi:application --host 0.0.0.0 --port $PORT --workers 4
+
+``gunicorn safezone.wsgi:application`` still serves everything but the live
+seat stream, which answers 501 there. The middleware stack is async-capable, so the async views in
+scheduler/views_async.py (the /async/ pages and /api/async/ lists) run on
+the event loop end to end; every other view runs in a thread per request.
+The live seat stream (/api/seats/stream/) needs this mode: each open
+stream is a coroutine rather than a worker. With more than one worker
+process, set SEAT_STREAM_BACKEND=scheduler.seats.PostgresBackend so
+bookings made in one process reach streams held by the others.
+Each request's database work happens on its own thread there, so leave
+DB_CONN_MAX_AGE at its default of 0 and use DB_POOL rather than persistent
+connections.
+``manage.py bench_async`` compares the two modes under a mixed load.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -0,0 +1,155 @@
+"""
+Who a user is and what they may do, resolved once per request.
+
+``access_for(user)`` returns the user's role, trainer and member profile
+ids and permission set. It is read from one SQL statement and then cached
+on the user object for the rest of the request and, if every process shares
+the cache (see caching.py), in the cache for later ones. signals.py drops the
+cached copy when a profile, the user or their permissions change. AccessBackend answers ``user.has_perm()`` from the
+same data, so ``permission_required`` and PermissionRequiredMixin use it too.
+"""
+import uuid
+
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import caching
+from .models import User
+
+
+CACHE_PREFIX = 'access:'
+# Changes to a group or a permission reach every user who has it, so they
+# move this generation instead of deleting keys one by one.
+GENERATION_KEY = CACHE_PREFIX + 'generation'
+# Backstop for writes that bypass the signals.
+CACHE_TIMEOUT = 60 * 15
+
+
+class Access:
+    __slots__ = ('user_id', 'role', 'is_active', 'is_staff', 'is_superuser', 'trainer_id', 'member_id', 'permissions')
+
+    def __init__(self, user_id=None, role=None, is_active=False, is_staff=False, is_superuser=False,
+                 trainer_id=None, member_id=None, permissions=frozenset()):
+        self.user_id = user_id
+        self.role = role
+        self.is_active = is_active
+        self.is_staff = is_staff
+        self.is_superuser = is_superuser
+        self.trainer_id = trainer_id
+        self.member_id = member_id
+        self.permissions = permissions
+
+    def __repr__(self):
+        return f"<Access user={self.user_id} trainer={self.trainer_id} member={self.member_id}>"
+
+    @property
+    def is_trainer(self):
+        return self.trainer_id is not None
+
+    @property
+    def is_member(self):
+        return self.member_id is not None
+
+    def has_perm(self, perm):
+        if not self.is_active:
+            return False
+        return self.is_superuser or perm in self.permissions
+
+    def has_perms(self, perms):
+        return all(self.has_perm(perm) for perm in perms)
+
+
+ANONYMOUS = Access()
+
+
+def _key(user_id):
+    return f'{CACHE_PREFIX}{user_id}'
+
+
+def load(user_id):
+    """Build the Access for ``user_id`` from the database in one statement; None if there is no such user."""
+    columns = ('role', 'is_active', 'is_staff', 'is_superuser', 'trainerprofile__id', 'memberprofile__id')
+    # Always the primary: the result is cached until the next change, so a
+    # lagging replica would keep serving old permissions.
+    users = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id)
+    # Each half yields one row per permission, or a single row of NULLs;
+    # both LEFT JOIN the profiles, so a user without permissions still comes back.
+    rows = users.values_list(
+        *columns, 'user_permissions__content_type__app_label', 'user_permissions__codename',
+    ).union(users.values_list(
+        *columns, 'groups__permissions__content_type__app_label', 'groups__permissions__codename',
+    ))
+    access = None
+    permissions = set()
+    for role, is_active, is_staff, is_superuser, trainer_id, member_id, app_label, codename in rows:
+        if access is None:
+            access = Access(user_id, role, is_active, is_staff, is_superuser, trainer_id, member_id)
+        if codename is not None:
+            permissions.add(f'{app_label}.{codename}')
+    if access is not None:
+        access.permissions = frozenset(permissions)
+    return access
+
+
+def access_for(user):
+    """The Access for ``user``: memoised on the user object, then the shared cache, then load()."""
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS
+    try:
+        return user._access
+    except AttributeError:
+        pass
+    if not caching.is_shared():
+        # Invalidation would only reach this process's copy.
+        user._access = load(user.pk) or ANONYMOUS
+        return user._access
+
+    key = _key(user.pk)
+    cached = cache.get_many([key, GENERATION_KEY])
+    generation = cached.get(GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(GENERATION_KEY, generation, None):
+            generation = cache.get(GENERATION_KEY, generation)
+    entry = cached.get(key)
+    if entry is not None and entry[0] == generation:
+        access = entry[1]
+    else:
+        access = load(user.pk) or ANONYMOUS
+        cache.set(key, (generation, access), CACHE_TIMEOUT)
+    user._access = access
+    return access
+
+
+# INVALIDATION
+
+def _now_and_on_commit(func):
+    # Now, for this connection's next read; after commit, in case another
+    # request cached the old rows while the transaction was open.
+    func()
+    transaction.on_commit(func)
+
+
+def invalidate(user_ids):
+    """Forget the cached Access of the given users."""
+    keys = [_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        _now_and_on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_all():
+    """Forget every cached Access, for changes to groups and permissions."""
+    _now_and_on_commit(lambda: cache.set(GENERATION_KEY, uuid.uuid4().hex, None))
+
+
+class AccessBackend(ModelBackend):
+    """ModelBackend whose permission lookups come from access_for() instead of two queries per user object."""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if user_obj.is_superuser:
+            # Every permission in the project; User.has_perm() never gets here for them.
+            return super().get_all_permissions(user_obj, obj)
+        return set(access_for(user_obj).permissions)
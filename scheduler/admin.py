@@ -2,7 +2,7 @@ from django.contrib import admin
 from .models import (
     User, TrainerProfile, MemberProfile,
     WorkoutType, Location, FitnessClass,
-    Schedule, Booking, WorkoutLog, Notification
+    Schedule, ScheduleSeries, Booking, WorkoutLog, Notification, ScheduleChange
 )
 
 # -------------------- Booking Inline --------------------
@@ -48,9 +48,16 @@ class BookingInlineForSchedule(admin.TabularInline):
 
 @admin.register(Schedule)
 class ScheduleAdmin(admin.ModelAdmin):
-    list_display = ('fitness_class', 'start_time', 'end_time')
+    list_display = ('fitness_class', 'start_time', 'end_time', 'booked_count', 'attended_count', 'cancelled_count')
+    readonly_fields = ('booked_count', 'attended_count', 'cancelled_count', 'no_show_count')
     inlines = [BookingInlineForSchedule]
 
+# -------------------- ScheduleSeries Admin --------------------
+@admin.register(ScheduleSeries)
+class ScheduleSeriesAdmin(admin.ModelAdmin):
+    list_display = ('fitness_class', 'trainer', 'location', 'frequency', 'start_time', 'until')
+    list_filter = ('frequency',)
+
 # -------------------- Other Models --------------------
 admin.site.register(User)
 admin.site.register(WorkoutType)
@@ -70,3 +77,10 @@ class NotificationAdmin(admin.ModelAdmin):
     search_fields = ('title', 'user__username', 'message')
     list_filter = ('is_read', 'created_at')
     ordering = ('-created_at',)
+
+# -------------------- ScheduleChange Admin --------------------
+@admin.register(ScheduleChange)
+class ScheduleChangeAdmin(admin.ModelAdmin):
+    list_display = ('schedule_id', 'kind', 'old_start', 'new_start', 'created_at', 'processed_at')
+    list_filter = ('kind', 'processed_at')
+    ordering = ('-created_at',)
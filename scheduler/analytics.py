@@ -0,0 +1,292 @@
+"""
+Attendance analytics from daily rollup tables.
+
+ClassDailyAttendance, TrainerDailyAttendance, LocationHourlyAttendance and
+MemberDailyAttendance hold, per day of class, how many bookings are in
+each status (plus, for members, how many workouts they logged). Booking,
+WorkoutLog and Schedule writes add their changes to the affected rows in
+the same transaction through record_bookings(), record_workouts() and
+record_regrouping(). Rebuilding replaces whole days of rows, which writes
+racing it would trip over, so rebuild() is only for repairs and
+``manage.py backfill_analytics``. The reports below read only these
+tables, never the Booking table.
+"""
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import datetime, time, timedelta
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import ExtractHour, Greatest, TruncDate
+from django.utils import timezone
+
+
+# Booking status -> rollup column that counts it.
+STATUS_COLUMNS = {
+    'booked': 'booked',
+    'attended': 'attended',
+    'no_show': 'no_show',
+    'cancelled': 'cancelled',
+    'waitlisted': 'waitlisted',
+}
+
+# Schedule fields that decide which rollup rows its bookings count in.
+SCHEDULE_KEYS = frozenset({
+    'start_time', 'fitness_class', 'fitness_class_id', 'trainer', 'trainer_id', 'location', 'location_id',
+})
+
+BATCH_SIZE = 1000
+
+
+def _model(name):
+    return apps.get_model('scheduler', name)
+
+
+def _day_bounds(first_day, last_day):
+    start = timezone.make_aware(datetime.combine(first_day, time.min))
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min))
+    return start, end
+
+
+def rollup_keys(start_time, location_id, trainer_id, fitness_class_id):
+    """What decides which rollup rows a schedule's bookings count in."""
+    return fitness_class_id, trainer_id, location_id, timezone.localtime(start_time)
+
+
+def schedule_keys(schedule_ids):
+    """{schedule id: rollup_keys()} for the given schedules."""
+    rows = _model('Schedule').objects.filter(pk__in=schedule_ids).order_by()
+    return {
+        pk: rollup_keys(start_time, location_id, trainer_id, fitness_class_id)
+        for pk, start_time, location_id, trainer_id, fitness_class_id in rows.values_list(
+            'pk', 'start_time', 'location_id', 'trainer_id', 'fitness_class_id'
+        )
+    }
+
+
+# INCREMENTAL UPDATES
+
+def _apply(changes):
+    """Add {(model, key items): {column: delta}} to the rollup rows, creating missing ones."""
+    for (model_name, key), columns in changes.items():
+        columns = {column: delta for column, delta in columns.items() if delta}
+        if not columns:
+            continue
+        model, key = _model(model_name), dict(key)
+        # Never below zero, even if a write slipped past the signals.
+        updates = {
+            column: F(column) + delta if delta > 0 else Greatest(F(column) + delta, Value(0))
+            for column, delta in columns.items()
+        }
+        if model.objects.filter(**key).update(**updates):
+            continue
+        initial = {column: delta for column, delta in columns.items() if delta > 0}
+        if not initial:
+            # Nothing counted there, so nothing to take away.
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**key, **initial)
+        except IntegrityError:
+            # Another transaction created the row first.
+            model.objects.filter(**key).update(**updates)
+
+
+def _booking_changes(changes, deltas, keys):
+    """Add {(schedule_id, member_id, status): delta} to ``changes``, with the schedules' rollup ``keys``."""
+    for (schedule_id, member_id, status), delta in deltas.items():
+        if not delta or status not in STATUS_COLUMNS or schedule_id not in keys:
+            continue
+        fitness_class_id, trainer_id, location_id, start = keys[schedule_id]
+        day, column = start.date(), STATUS_COLUMNS[status]
+        changes['ClassDailyAttendance', (('fitness_class_id', fitness_class_id), ('day', day))][column] += delta
+        changes['TrainerDailyAttendance', (('trainer_id', trainer_id), ('day', day))][column] += delta
+        changes['LocationHourlyAttendance', (('location_id', location_id), ('day', day), ('hour', start.hour))][column] += delta
+        changes['MemberDailyAttendance', (('member_id', member_id), ('day', day))][column] += delta
+
+
+def record_bookings(deltas):
+    """Apply a {(schedule_id, member_id, status): delta} mapping of booking transitions."""
+    deltas = {key: delta for key, delta in deltas.items() if delta and key[2] in STATUS_COLUMNS}
+    if not deltas:
+        return
+    changes = defaultdict(Counter)
+    _booking_changes(changes, deltas, schedule_keys({schedule_id for schedule_id, _, _ in deltas}))
+    _apply(changes)
+
+
+def record_regrouping(before):
+    """
+    Move the bookings of schedules whose rollup keys changed from ``before``
+    ({schedule id: rollup_keys()} taken before the change) to the rows their
+    keys give now.
+    """
+    after = schedule_keys(before)
+    moved = [pk for pk, keys in before.items() if pk in after and after[pk] != keys]
+    if not moved:
+        return
+    bookings = Counter(
+        _model('Booking').objects.filter(schedule_id__in=moved).order_by()
+        .values_list('schedule_id', 'member_id', 'status')
+    )
+    changes = defaultdict(Counter)
+    _booking_changes(changes, {key: -n for key, n in bookings.items()}, before)
+    _booking_changes(changes, bookings, after)
+    _apply(changes)
+
+
+def record_workouts(deltas):
+    """Apply a {(member_id, date): delta} mapping of logged workouts."""
+    _apply({
+        ('MemberDailyAttendance', (('member_id', member_id), ('day', day))): {'workouts': delta}
+        for (member_id, day), delta in deltas.items()
+    })
+
+
+# Schedules being deleted in this context: schedule_deleting() takes their
+# bookings off in one go, so booking_deleted() skips them as the cascade runs.
+_departing = ContextVar('departing_schedules', default=frozenset())
+
+
+def schedule_deleting(schedule):
+    bookings = _model('Booking').objects.filter(schedule_id=schedule.pk).values_list('member_id', 'status')
+    deltas = Counter()
+    for member_id, status in bookings:
+        deltas[schedule.pk, member_id, status] -= 1
+    record_bookings(deltas)
+    _departing.set(_departing.get() | {schedule.pk})
+
+
+def schedule_deleted(schedule):
+    _departing.set(_departing.get() - {schedule.pk})
+
+
+def booking_deleted(booking):
+    if booking.schedule_id in _departing.get():
+        return
+    rolled_up = getattr(booking, '_rolled_up', None) or (booking.schedule_id, booking.member_id, booking.status)
+    record_bookings({rolled_up: -1})
+
+
+# REBUILDS
+
+def rebuild(first_day, last_day):
+    """Recompute every rollup row for the days first_day..last_day from Booking and WorkoutLog."""
+    tz = timezone.get_current_timezone()
+    start, end = _day_bounds(first_day, last_day)
+    bookings = (
+        _model('Booking').objects
+        .filter(schedule__start_time__gte=start, schedule__start_time__lt=end)
+        .annotate(day=TruncDate('schedule__start_time', tzinfo=tz))
+        .order_by()
+    )
+    counts = {column: Count('pk', filter=Q(status=status)) for status, column in STATUS_COLUMNS.items()}
+    dimensions = {
+        'ClassDailyAttendance': {'fitness_class_id': F('schedule__fitness_class_id')},
+        'TrainerDailyAttendance': {'trainer_id': F('schedule__trainer_id')},
+        'LocationHourlyAttendance': {
+            'location_id': F('schedule__location_id'), 'hour': ExtractHour('schedule__start_time', tzinfo=tz),
+        },
+    }
+
+    with transaction.atomic():
+        for model_name, keys in dimensions.items():
+            model = _model(model_name)
+            model.objects.filter(day__range=(first_day, last_day)).delete()
+            rows = bookings.values('day', **keys).annotate(**counts)
+            model.objects.bulk_create((model(**row) for row in rows.iterator()), batch_size=BATCH_SIZE)
+
+        members = {}
+        for row in bookings.values('member_id', 'day').annotate(**counts).iterator():
+            members[row['member_id'], row['day']] = row
+        workouts = (
+            _model('WorkoutLog').objects.filter(date__range=(first_day, last_day))
+            .values('member_id', 'date').annotate(n=Count('pk')).order_by()
+        )
+        for row in workouts.iterator():
+            members.setdefault((row['member_id'], row['date']), {'member_id': row['member_id'], 'day': row['date']})
+            members[row['member_id'], row['date']]['workouts'] = row['n']
+        model = _model('MemberDailyAttendance')
+        model.objects.filter(day__range=(first_day, last_day)).delete()
+        model.objects.bulk_create((model(**row) for row in members.values()), batch_size=BATCH_SIZE)
+
+
+def history_bounds():
+    """(first day, last day) with bookings or workouts, or None when there are none."""
+    Schedule, WorkoutLog = _model('Schedule'), _model('WorkoutLog')
+    first_start = Schedule.objects.order_by('start_time').values_list('start_time', flat=True).first()
+    last_start = Schedule.objects.order_by('-start_time').values_list('start_time', flat=True).first()
+    first_log = WorkoutLog.objects.order_by('date').values_list('date', flat=True).first()
+    last_log = WorkoutLog.objects.order_by('-date').values_list('date', flat=True).first()
+    firsts = [day for day in (first_start and timezone.localdate(first_start), first_log) if day]
+    lasts = [day for day in (last_start and timezone.localdate(last_start), last_log) if day]
+    if not firsts:
+        return None
+    return min(firsts), max(lasts)
+
+
+# REPORTS
+
+def _rate(part, whole):
+    return round(part / whole, 3) if whole else None
+
+
+def _totals(queryset, *group_by, columns=tuple(STATUS_COLUMNS.values()), having=None):
+    """
+    Rows of ``group_by`` values with each column summed over the days.
+    ``having`` filters on the sums, named ``<column>_sum``.
+    """
+    # Aggregates may not take the name of a model field, so rename afterwards.
+    rows = queryset.values(*group_by).annotate(**{f'{column}_sum': Sum(column) for column in columns}).order_by()
+    if having:
+        rows = rows.filter(**having)
+    return [
+        {**{name: row[name] for name in group_by}, **{column: row[f'{column}_sum'] for column in columns}}
+        for row in rows
+    ]
+
+
+def class_attendance(first_day, last_day):
+    """Per class: bookings by status and the share of held seats that were attended."""
+    rows = _totals(
+        _model('ClassDailyAttendance').objects.filter(day__range=(first_day, last_day)),
+        'fitness_class_id', 'fitness_class__name',
+    )
+    report = [{**row, 'attendance_rate': _rate(row['attended'], row['attended'] + row['no_show'])} for row in rows]
+    return sorted(report, key=lambda row: (row['attendance_rate'] is None, -(row['attendance_rate'] or 0)))
+
+
+def trainer_attendance(first_day, last_day):
+    """Per trainer, like class_attendance()."""
+    rows = _totals(
+        _model('TrainerDailyAttendance').objects.filter(day__range=(first_day, last_day)),
+        'trainer_id', 'trainer__user__username',
+    )
+    report = [{**row, 'attendance_rate': _rate(row['attended'], row['attended'] + row['no_show'])} for row in rows]
+    return sorted(report, key=lambda row: (row['attendance_rate'] is None, -(row['attendance_rate'] or 0)))
+
+
+def member_no_shows(first_day, last_day, limit=20):
+    """The members who most often miss classes they held a seat for."""
+    rows = _totals(
+        _model('MemberDailyAttendance').objects.filter(day__range=(first_day, last_day)),
+        'member_id', 'member__user__username', columns=(*STATUS_COLUMNS.values(), 'workouts'),
+        # On the totals: days without a no-show still count towards the rate.
+        having={'no_show_sum__gt': 0},
+    )
+    report = [{**row, 'no_show_rate': _rate(row['no_show'], row['attended'] + row['no_show'])} for row in rows]
+    return sorted(report, key=lambda row: (-row['no_show_rate'], -row['no_show']))[:limit]
+
+
+def busiest_hours(first_day, last_day, location_id=None, limit=10):
+    """Location and start hour with the most seats held (booked, attended or no-show)."""
+    rollups = _model('LocationHourlyAttendance').objects.filter(day__range=(first_day, last_day))
+    if location_id is not None:
+        rollups = rollups.filter(location_id=location_id)
+    rows = (
+        rollups.values('location_id', 'location__name', 'hour')
+        .annotate(seats=Sum(F('booked') + F('attended') + F('no_show')))
+        .order_by('-seats', 'location_id', 'hour')
+    )
+    return list(rows[:limit])
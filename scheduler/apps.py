@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SchedulerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scheduler'
+
+    def ready(self):
+        from . import caching, instrumentation, signals  # noqa: F401
+        if instrumentation.config()['ENABLED']:
+            instrumentation.install()
@@ -0,0 +1,31 @@
+"""
+Whether the default cache is one that every process serving the site shares.
+
+The local-memory and dummy backends live inside a single process. Entries
+that are invalidated by signals, such as permissions, must not be kept there
+when the site runs several workers: a change would only reach the worker that
+made it, and the others would keep answering from their old copy. Modules
+holding such entries ask is_shared() and go to the database otherwise.
+Configure a shared backend (Redis, Memcached, the database) in CACHES;
+``manage.py check --deploy`` warns while there is none.
+"""
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared(alias='default'):
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared():
+        return []
+    return [checks.Warning(
+        "The default cache is local to each process, so permissions are not cached between requests "
+        "and dashboard counts are recounted every 30 seconds.",
+        hint="Set CACHES to a backend every worker shares, such as Redis or Memcached.",
+        id='scheduler.W001',
+    )]
@@ -1,22 +1,27 @@
 from django.urls import reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.contrib import messages
-from django.shortcuts import get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from .models import Booking, MemberProfile, Schedule
+from .models import Booking
 from .forms import BookingForm
+from .pagination import KeysetPaginationMixin
+from .access import access_for
+from .replicas import ReplicaReadMixin
+from .reservations import ReservationError, save_booking, waitlist_place
 from .models import WorkoutLog
 from .forms import WorkoutLogForm
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, HttpResponseRedirect
 from .models import FitnessClass
 from .forms import FitnessClassForm
 from django.http import HttpResponseForbidden
 
 ## LIST 
-class FitnessClassListView(LoginRequiredMixin, ListView):
+class FitnessClassListView(LoginRequiredMixin, ReplicaReadMixin, KeysetPaginationMixin, ListView):
     model = FitnessClass
     template_name = 'classes/class_list.html'
     context_object_name = 'classes'
+    queryset = FitnessClass.objects.select_related('trainer__user', 'workout_type')
+    keyset_ordering = ('id',)
 
 
 # CREATE 
@@ -27,8 +32,7 @@ class FitnessClassCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy('classes_list')
 
     def dispatch(self, request, *args, **kwargs):
-        is_trainer = hasattr(request.user, "trainerprofile")
-        if not (request.user.is_superuser or is_trainer):
+        if not (request.user.is_superuser or access_for(request.user).is_trainer):
             return HttpResponseForbidden("Only staff can create classes.")
         return super().dispatch(request, *args, **kwargs)
 
@@ -41,8 +45,7 @@ class FitnessClassUpdateView(LoginRequiredMixin, UpdateView):
     success_url = reverse_lazy('classes_list')
 
     def dispatch(self, request, *args, **kwargs):
-        is_trainer = hasattr(request.user, "trainerprofile")
-        if not (request.user.is_superuser or is_trainer):
+        if not (request.user.is_superuser or access_for(request.user).is_trainer):
             return HttpResponseForbidden("Only staff can edit classes.")
         return super().dispatch(request, *args, **kwargs)
 
@@ -54,21 +57,22 @@ class FitnessClassDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('classes_list')
 
     def dispatch(self, request, *args, **kwargs):
-        is_trainer = hasattr(request.user, "trainerprofile")
-        if not (request.user.is_superuser or is_trainer):
+        if not (request.user.is_superuser or access_for(request.user).is_trainer):
             return HttpResponseForbidden("Only staff can delete classes.")
         return super().dispatch(request, *args, **kwargs)
 
-class WorkoutLogListView(LoginRequiredMixin, ListView):
+class WorkoutLogListView(LoginRequiredMixin, ReplicaReadMixin, KeysetPaginationMixin, ListView):
     model = WorkoutLog
     template_name = 'logs/log_list.html'
     context_object_name = 'logs'
+    keyset_ordering = ('-date', '-id')
 
     def get_queryset(self):
         user = self.request.user
+        logs = WorkoutLog.objects.select_related('member__user')
         if user.is_staff:
-            return WorkoutLog.objects.all()
-        return WorkoutLog.objects.filter(member__user=user)
+            return logs.all()
+        return logs.filter(member__user=user)
 
 
 class WorkoutLogCreateView(LoginRequiredMixin, CreateView):
@@ -79,7 +83,7 @@ class WorkoutLogCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         if not self.request.user.is_staff:
-            form.instance.member = self.request.user.memberprofile
+            form.instance.member_id = access_for(self.request.user).member_id
         return super().form_valid(form)
 
 
@@ -108,11 +112,22 @@ class WorkoutLogDeleteView(LoginRequiredMixin, DeleteView):
         return super().dispatch(request, *args, **kwargs)
 
 
-class BookingListView(LoginRequiredMixin, ListView):
+class BookingListView(LoginRequiredMixin, ReplicaReadMixin, KeysetPaginationMixin, ListView):
     model = Booking
     template_name = 'booking/booking_list_cbv.html'
     context_object_name = 'bookings'
     ordering = ['-booked_at']
+    keyset_ordering = ('-booked_at', '-id')
+    # Columns booking/booking_list_cbv.html reads.
+    queryset = Booking.objects.select_related(
+        'member__user', 'schedule__fitness_class', 'schedule__trainer__user', 'schedule__location'
+    ).only(
+        'booked_at', 'status',
+        'member__user__first_name', 'member__user__last_name',
+        'schedule__start_time', 'schedule__end_time', 'schedule__fitness_class__name',
+        'schedule__trainer__user__first_name', 'schedule__trainer__user__last_name',
+        'schedule__location__name',
+    )
 
 class BookingCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     model = Booking
@@ -122,16 +137,16 @@ class BookingCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView)
     permission_required = 'scheduler.add_booking'
 
     def form_valid(self, form):
-        booking = form.save(commit=False)
-        member = form.cleaned_data.get('member')
-        schedule = form.cleaned_data.get('schedule')
-        if member:
-            booking.member = get_object_or_404(MemberProfile, id=member.id)
-        if schedule:
-            booking.schedule = get_object_or_404(Schedule, id=schedule.id)
-        booking.save()
-        messages.success(self.request, "Booking created successfully.")
-        return super().form_valid(form)
+        try:
+            self.object = save_booking(form.save(commit=False), waitlist=True)
+        except ReservationError as e:
+            form.add_error('schedule', str(e))
+            return self.form_invalid(form)
+        if self.object.status == 'waitlisted':
+            messages.info(self.request, f"This class is full. Added to the waitlist at place {waitlist_place(self.object)}.")
+        else:
+            messages.success(self.request, "Booking created successfully.")
+        return HttpResponseRedirect(self.get_success_url())
 
 class BookingUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     model = Booking
@@ -141,8 +156,13 @@ class BookingUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView)
     permission_required = 'scheduler.change_booking'
 
     def form_valid(self, form):
+        try:
+            self.object = save_booking(form.save(commit=False))
+        except ReservationError as e:
+            form.add_error('schedule', str(e))
+            return self.form_invalid(form)
         messages.success(self.request, "Booking updated successfully.")
-        return super().form_valid(form)
+        return HttpResponseRedirect(self.get_success_url())
 
 class BookingDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
     model = Booking
@@ -3,7 +3,25 @@ from django.forms.widgets import CheckboxInput, Select
 from .models import TrainerProfile, MemberProfile, FitnessClass, Location, Schedule, Booking # Импортируем ваши модели
 from django.core.exceptions import ValidationError
 from django import forms
-from .models import WorkoutLog
+import datetime
+from .models import WorkoutLog, ScheduleSeries
+from .reservations import SEAT_HOLDING_STATUSES, AlreadyBooked, ScheduleFull, seats_taken
+
+
+# Choice querysets that join what each option's label (__str__) prints, so a
+# form renders with one query per choice field instead of several per option.
+# Schedules and classes stay whole: the chosen one is validated and saved.
+_NAMES = ('user__username', 'user__first_name', 'user__last_name')
+MEMBER_CHOICES = MemberProfile.objects.select_related('user').only(*_NAMES)
+TRAINER_CHOICES = TrainerProfile.objects.select_related('user').only(*_NAMES)
+FITNESS_CLASS_CHOICES = FitnessClass.objects.select_related('workout_type')
+SCHEDULE_CHOICES = Schedule.objects.select_related('fitness_class', 'trainer__user')
+
+
+def use_choices(form, **querysets):
+    for name, queryset in querysets.items():
+        if name in form.fields:
+            form.fields[name].queryset = queryset
 
 
 class DateInput(DateInput):
@@ -109,6 +127,68 @@ class ScheduleForm(BaseStyledModelForm):
             'end_time': DateTimeLocalInput(),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        use_choices(self, fitness_class=FITNESS_CLASS_CHOICES, trainer=TRAINER_CHOICES)
+
+class ScheduleSeriesForm(BaseStyledModelForm):
+    WEEKDAY_CHOICES = [(str(i), name) for i, name in enumerate(
+        ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    )]
+
+    weekdays = forms.MultipleChoiceField(
+        choices=WEEKDAY_CHOICES,
+        required=False,
+        widget=forms.SelectMultiple,
+        help_text="Weekly only. Leave empty to repeat on the first occurrence's weekday.",
+    )
+    exceptions = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 2}),
+        help_text="Dates to skip, one YYYY-MM-DD per line.",
+    )
+
+    class Meta:
+        model = ScheduleSeries
+        fields = ['fitness_class', 'trainer', 'location', 'start_time', 'frequency',
+                  'interval', 'weekdays', 'until', 'count', 'exceptions']
+        widgets = {
+            'start_time': DateTimeLocalInput(),
+            'until': DateInput(),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        use_choices(self, fitness_class=FITNESS_CLASS_CHOICES, trainer=TRAINER_CHOICES)
+
+    def clean_weekdays(self):
+        return ','.join(self.cleaned_data['weekdays'])
+
+    def clean_exceptions(self):
+        dates = []
+        for line in self.cleaned_data['exceptions'].split():
+            try:
+                dates.append(datetime.date.fromisoformat(line).isoformat())
+            except ValueError:
+                raise ValidationError(f"'{line}' is not a YYYY-MM-DD date.")
+        return dates
+
+
+class ScheduleFollowingForm(forms.Form):
+    """Edit one occurrence of a series together with every later one."""
+    trainer = forms.ModelChoiceField(queryset=TRAINER_CHOICES)
+    location = forms.ModelChoiceField(queryset=Location.objects.all())
+    start_time = forms.DateTimeField(widget=DateTimeLocalInput(), help_text="Later occurrences move by the same amount.")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            if isinstance(field.widget, Select):
+                field.widget.attrs['class'] = 'form-select'
+            else:
+                field.widget.attrs['class'] = 'form-control'
+
+
 class BookingForm(forms.ModelForm):
     class Meta:
         model = Booking
@@ -116,6 +196,7 @@ class BookingForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        use_choices(self, member=MEMBER_CHOICES, schedule=SCHEDULE_CHOICES)
         for field in self.fields.values():
             field.widget.attrs['class'] = 'form-control'
 
@@ -125,12 +206,16 @@ class BookingForm(forms.ModelForm):
         schedule = cleaned_data.get('schedule')
 
         if member and schedule:
-            if Booking.objects.filter(member=member, schedule=schedule).exists():
-                raise ValidationError("You are already registered for this class.")
+            others = Booking.objects.filter(member=member, schedule=schedule).exclude(pk=self.instance.pk)
+            if others.exists():
+                raise ValidationError(str(AlreadyBooked()))
 
-            current_bookings = Booking.objects.filter(schedule__fitness_class=schedule.fitness_class).count()
-            if current_bookings >= schedule.fitness_class.capacity:
-                raise ValidationError("This class is fully booked. No more spots are available.")
+            # Early feedback only; save_booking() repeats the check under a lock.
+            # New bookings for a full class go on the waitlist instead.
+            status = cleaned_data.get('status', self.instance.status)
+            if self.instance.pk and status in SEAT_HOLDING_STATUSES:
+                if seats_taken(schedule, exclude=self.instance.pk) >= schedule.fitness_class.capacity:
+                    raise ValidationError(str(ScheduleFull()))
 
         return cleaned_data
 
@@ -0,0 +1,222 @@
+"""
+Per-request timing: query count, SQL time, the slowest statements,
+template render time and total time, reported as a Server-Timing header, a
+slow-request log line and, for a sample of requests, a cProfile dump when
+they turn out slow.
+
+Configured with the INSTRUMENTATION setting; see DEFAULTS. When it is
+enabled, SchedulerConfig.ready() calls install() to time template rendering;
+otherwise nothing is patched and the middleware removes itself.
+"""
+import cProfile
+import heapq
+import itertools
+import json
+import logging
+import random
+import re
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Add a Server-Timing header to every response.
+    'SERVER_TIMING': True,
+    # Log requests slower than this, or with more queries than this.
+    'SLOW_REQUEST_MS': 500,
+    'MAX_QUERIES': 50,
+    # How many of the slowest statements a slow-request log line lists.
+    'SLOWEST_QUERIES': 5,
+    # Fraction of requests run under cProfile; a profile is written to
+    # PROFILE_DIR only if the request is then slow.
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_DIR': None,
+}
+
+_current = ContextVar('request_metrics', default=None)
+_sequence = itertools.count()
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class RequestMetrics:
+    def __init__(self, keep_slowest):
+        self.started = time.perf_counter()
+        self.total_ms = None
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+        self.keep_slowest = keep_slowest
+        self._slowest = []
+
+    def add_query(self, sql, ms):
+        self.queries += 1
+        self.sql_ms += ms
+        entry = (ms, next(_sequence), sql[:500])
+        if len(self._slowest) < self.keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif self._slowest and ms > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        return [{'ms': round(ms, 2), 'sql': sql} for ms, _, sql in sorted(self._slowest, reverse=True)]
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+
+    @property
+    def app_ms(self):
+        return max(self.total_ms - self.sql_ms - self.template_ms, 0.0)
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.sql_ms:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_ms:.1f}',
+            f'app;dur={self.app_ms:.1f}',
+            f'total;dur={self.total_ms:.1f}',
+        ])
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, (time.perf_counter() - start) * 1000)
+
+
+def _install_query_recorder():
+    """
+    Wrap every connection of the calling thread, once. The wrapper stays
+    for the connection's lifetime and records only while a request's
+    metrics are current.
+    """
+    for connection in connections.all():
+        if _record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_record_query)
+
+
+_template_render = Template.render
+
+
+def install():
+    """Time template rendering from now on; idempotent."""
+    if Template.render is not _timed_render:
+        Template.render = _timed_render
+
+
+def _timed_render(self, context):
+    metrics = _current.get()
+    if metrics is None:
+        return _template_render(self, context)
+    # {% include %} and {% extends %} render nested templates; time only the outermost.
+    metrics.template_depth += 1
+    start = time.perf_counter()
+    try:
+        return _template_render(self, context)
+    finally:
+        metrics.template_depth -= 1
+        if not metrics.template_depth:
+            metrics.template_ms += (time.perf_counter() - start) * 1000
+
+
+class InstrumentationMiddleware:
+    """Put first in MIDDLEWARE so the timings cover the rest of the stack."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        options = config()
+        metrics = RequestMetrics(options['SLOWEST_QUERIES'])
+        token = _current.set(metrics)
+        profile = None
+        if options['PROFILE_DIR'] and random.random() < options['PROFILE_SAMPLE_RATE']:
+            profile = cProfile.Profile()
+        try:
+            _install_query_recorder()
+            if profile is not None:
+                profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profile is not None:
+                    profile.disable()
+        finally:
+            _current.reset(token)
+        return self.report(request, response, metrics, options, profile)
+
+    async def __acall__(self, request):
+        options = config()
+        metrics = RequestMetrics(options['SLOWEST_QUERIES'])
+        token = _current.set(metrics)
+        try:
+            # The async ORM runs queries in this request's sync thread, not on the event loop.
+            await sync_to_async(_install_query_recorder)()
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        # cProfile follows a single thread, so async requests are not profiled.
+        return self.report(request, response, metrics, options, None)
+
+    def report(self, request, response, metrics, options, profile):
+        metrics.finish()
+
+        request.metrics = metrics
+        if options['SERVER_TIMING']:
+            response['Server-Timing'] = metrics.server_timing()
+        slow = metrics.total_ms >= options['SLOW_REQUEST_MS'] or metrics.queries > options['MAX_QUERIES']
+        if slow:
+            dump = self.dump_profile(profile, request, options['PROFILE_DIR']) if profile else None
+            self.log_slow_request(request, response, metrics, dump)
+        return response
+
+    @staticmethod
+    def dump_profile(profile, request, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        path = directory / f"{datetime.now():%Y%m%d-%H%M%S-%f}-{request.method}-{slug[:80]}.prof"
+        profile.dump_stats(path)
+        return str(path)
+
+    @staticmethod
+    def log_slow_request(request, response, metrics, profile_path):
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(metrics.total_ms, 1),
+            'sql_ms': round(metrics.sql_ms, 1),
+            'template_ms': round(metrics.template_ms, 1),
+            'queries': metrics.queries,
+            'slowest': metrics.slowest,
+            'profile': profile_path,
+        }
+        logger.warning("slow request %s", json.dumps(record), extra={'request_metrics': record})
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from scheduler import analytics
+
+
+def day(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the attendance rollup tables from Booking and WorkoutLog, a chunk of days per "
+        "transaction. Defaults to the whole history; safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=day, help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument('--end', type=day, help="Last day to rebuild (YYYY-MM-DD).")
+        parser.add_argument('--chunk-days', type=int, default=7, help="Days rebuilt per transaction.")
+
+    def handle(self, *args, start=None, end=None, chunk_days=7, **options):
+        if chunk_days < 1:
+            raise CommandError("--chunk-days must be at least 1.")
+        if start is None or end is None:
+            bounds = analytics.history_bounds()
+            if bounds is None:
+                self.stdout.write("Nothing to backfill.")
+                return
+            start, end = start or bounds[0], end or bounds[1]
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+
+        total = (end - start).days + 1
+        first = start
+        while first <= end:
+            last = min(first + timedelta(days=chunk_days - 1), end)
+            analytics.rebuild(first, last)
+            done = (last - start).days + 1
+            self.stdout.write(f"Rebuilt {first} to {last} ({done}/{total} days)")
+            first = last + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} day(s)."))
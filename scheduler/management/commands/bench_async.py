@@ -0,0 +1,211 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from scheduler.models import Booking, Location, MemberProfile, Schedule
+
+from .bench_endpoints import Command as EndpointBench, percentile
+
+
+# (sync route, async route) serving the same content, see scheduler/views_async.py.
+READ_ROUTES = (
+    ('fitness_class_list', 'fitness_class_list_async'),
+    ('location_detail', 'location_detail_async'),
+    ('schedule-list', 'schedule_list_async'),
+    ('booking-list', 'booking_list_async'),
+)
+
+MODES = ('sync', 'async')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync and async read paths under the same mixed read/write load: the sync "
+        "views on one thread per client, as under WSGI, against the async views with every "
+        "client on one event loop, as under ASGI. Writes book and cancel through the API in "
+        "both modes. Reports throughput and tail latency. Seed data first with seed_gym."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=MODES, default=[],
+                            help="Mode to run; repeatable. Defaults to both.")
+        parser.add_argument('--seconds', type=float, default=10, help="How long to run each mode.")
+        parser.add_argument('--concurrency', type=int, default=16, help="Concurrent clients.")
+        parser.add_argument('--write-ratio', type=float, default=0.1,
+                            help="Share of operations that book and then cancel a seat.")
+        parser.add_argument('--user', help="Username to request as; defaults to a superuser.")
+        parser.add_argument('--json', dest='json_path', help="Write the results to this file.")
+
+    def handle(self, *args, mode, seconds, concurrency, write_ratio, user, json_path, **options):
+        if not 0 <= write_ratio <= 1:
+            raise CommandError("--write-ratio must be between 0 and 1.")
+        self.user = EndpointBench().bench_user(user)
+        self.plan = self.load_plan(concurrency)
+
+        results = []
+        for name in mode or MODES:
+            measure = self.measure_sync if name == 'sync' else self.measure_async
+            result = {'mode': name, 'concurrency': concurrency, **measure(seconds, concurrency, write_ratio)}
+            results.append(result)
+            self.print_result(result)
+
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump({'seconds': seconds, 'write_ratio': write_ratio, 'results': results}, f, indent=2)
+            self.stdout.write(f"Wrote {json_path}")
+
+    def load_plan(self, concurrency):
+        """Read paths per mode, and per client a member with schedules it can book."""
+        location = Location.objects.order_by('pk').first()
+        if location is None or not Schedule.objects.exists():
+            raise CommandError("No data to request; run seed_gym first.")
+        paths = {}
+        for sync_name, async_name in READ_ROUTES:
+            kwargs = {'pk': location.pk} if sync_name == 'location_detail' else {}
+            paths.setdefault('sync', []).append(reverse(sync_name, kwargs=kwargs))
+            paths.setdefault('async', []).append(reverse(async_name, kwargs=kwargs))
+
+        schedules = list(Schedule.objects.values_list('pk', flat=True)[:200])
+        members = list(MemberProfile.objects.order_by('pk').values_list('pk', flat=True)[:concurrency])
+        if not members:
+            raise CommandError("No members to book for; run seed_gym first.")
+        booked = set(Booking.objects.filter(member_id__in=members).values_list('member_id', 'schedule_id'))
+        writers = []
+        for n in range(concurrency):
+            member = members[n % len(members)]
+            # Clients sharing a member take different schedules, so their bookings never collide.
+            free = [pk for i, pk in enumerate(schedules) if (member, pk) not in booked and i % concurrency == n]
+            writers.append((member, free))
+        return {'paths': paths, 'writers': writers}
+
+    # Operations pick the same sequence in both modes for a given client.
+
+    def operations(self, n, write_ratio):
+        rng = random.Random(n)
+        paths = len(self.plan['paths']['sync'])
+        member, free = self.plan['writers'][n]
+        while True:
+            if free and rng.random() < write_ratio:
+                yield 'write', (member, rng.choice(free))
+            else:
+                yield 'read', rng.randrange(paths)
+
+    def measure_sync(self, seconds, concurrency, write_ratio):
+        paths = self.plan['paths']['sync']
+        start = threading.Barrier(concurrency + 1)
+        results, lock = [], threading.Lock()
+
+        def client_loop(n):
+            client = Client()
+            client.force_login(self.user)
+            own = []
+            start.wait()
+            deadline = time.perf_counter() + seconds
+            for kind, arg in self.operations(n, write_ratio):
+                if time.perf_counter() >= deadline:
+                    break
+                began = time.perf_counter()
+                if kind == 'read':
+                    ok = client.get(paths[arg], HTTP_ACCEPT='application/json').status_code == 200
+                else:
+                    ok = self.write(client, *arg)
+                own.append((kind, (time.perf_counter() - began) * 1000, ok))
+            connections.close_all()
+            with lock:
+                results.extend(own)
+
+        workers = [threading.Thread(target=client_loop, args=(n,)) for n in range(concurrency)]
+        for worker in workers:
+            worker.start()
+        start.wait()
+        began = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        return self.summary(results, time.perf_counter() - began)
+
+    def measure_async(self, seconds, concurrency, write_ratio):
+        paths = self.plan['paths']['async']
+        connections.close_all()
+
+        async def request(coroutine_function, *args):
+            # One thread per request for sync work, as ASGIHandler does; its
+            # connections are closed at the end, as request_finished would.
+            async with ThreadSensitiveContext():
+                try:
+                    return await coroutine_function(*args)
+                finally:
+                    await sync_to_async(connections.close_all)()
+
+        async def client_loop(n, start, results):
+            client = AsyncClient()
+            await request(client.aforce_login, self.user)
+            await start.wait()
+            deadline = time.perf_counter() + seconds
+            for kind, arg in self.operations(n, write_ratio):
+                if time.perf_counter() >= deadline:
+                    break
+                began = time.perf_counter()
+                if kind == 'read':
+                    response = await request(client.get, paths[arg])
+                    ok = response.status_code == 200
+                else:
+                    ok = await request(self.awrite, client, *arg)
+                results.append((kind, (time.perf_counter() - began) * 1000, ok))
+
+        async def main():
+            start, results = asyncio.Event(), []
+            loops = [asyncio.create_task(client_loop(n, start, results)) for n in range(concurrency)]
+            await asyncio.sleep(0)
+            began = time.perf_counter()
+            start.set()
+            await asyncio.gather(*loops)
+            return self.summary(results, time.perf_counter() - began)
+
+        return asyncio.run(main())
+
+    def write(self, client, member, schedule):
+        response = client.post(reverse('booking-list'), {'member': member, 'schedule': schedule})
+        if response.status_code != 201:
+            return False
+        return client.delete(reverse('booking-detail', args=[response.json()['id']])).status_code == 204
+
+    async def awrite(self, client, member, schedule):
+        response = await client.post(reverse('booking-list'), {'member': member, 'schedule': schedule})
+        if response.status_code != 201:
+            return False
+        return (await client.delete(reverse('booking-detail', args=[response.json()['id']]))).status_code == 204
+
+    def summary(self, results, elapsed):
+        def latencies(kind=None):
+            return sorted(ms for k, ms, _ in results if kind in (None, k))
+
+        everything = latencies()
+        summary = {
+            'operations': len(results),
+            'writes': sum(kind == 'write' for kind, _, _ in results),
+            'errors': sum(not ok for _, _, ok in results),
+            'ops_per_s': round(len(results) / elapsed, 1),
+        }
+        for fraction in (0.50, 0.95, 0.99):
+            value = percentile(everything, fraction)
+            summary[f'p{round(fraction * 100)}_ms'] = value and round(value, 3)
+        reads = latencies('read')
+        summary['read_p99_ms'] = reads and round(percentile(reads, 0.99), 3)
+        summary['max_ms'] = everything and round(everything[-1], 3)
+        return summary
+
+    def print_result(self, result):
+        self.stdout.write(
+            f"{result['mode']:<6} x{result['concurrency']:<4} {result['ops_per_s']:>8.1f} ops/s  "
+            f"p50 {result['p50_ms'] or 0:7.1f}  p95 {result['p95_ms'] or 0:7.1f}  p99 {result['p99_ms'] or 0:7.1f}  "
+            f"max {result['max_ms'] or 0:7.1f} ms  {result['operations']:>6} ops  "
+            f"{result['writes']} writes  {result['errors']} errors"
+        )
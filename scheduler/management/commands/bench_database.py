@@ -0,0 +1,160 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from .bench_endpoints import Command as EndpointBench, percentile, quiet_instrumentation
+
+
+# Environment for each database mode, read by safezone/settings.py.
+MODES = {
+    'sqlite': {'SQLITE_TUNING': '0', 'SQLITE_WAL': '0', 'DB_CONN_MAX_AGE': '0'},
+    'sqlite-tuned': {'SQLITE_TUNING': '1', 'SQLITE_WAL': '1', 'DB_CONN_MAX_AGE': '600'},
+    'postgres': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': '0'},
+    'postgres-persistent': {'DB_CONN_MAX_AGE': '600', 'DB_POOL': '0'},
+    'postgres-pooled': {'DB_POOL': '1'},
+}
+
+DEFAULT_URL_NAMES = ('home', 'schedule_list', 'bookings_list_cbv', 'schedule-list', 'booking-list')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec across the database modes in safezone/settings.py: plain and tuned "
+        "SQLite, and PostgreSQL with per-request, persistent or pooled connections. Each mode runs "
+        "in its own process against data seeded with seed_gym."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=sorted(MODES), default=[],
+                            help="Mode to run; repeatable. Defaults to both SQLite modes, plus the "
+                                 "PostgreSQL ones when a database URL is given.")
+        parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                            help="PostgreSQL URL for the postgres modes; defaults to $DATABASE_URL.")
+        parser.add_argument('--seconds', type=float, default=10, help="How long to run each mode.")
+        parser.add_argument('--threads', type=int, default=4, help="Concurrent clients.")
+        parser.add_argument('--url-name', action='append', default=[], help="Route to request; repeatable.")
+        parser.add_argument('--user', help="Username to request as; defaults to a superuser.")
+        parser.add_argument('--json', dest='json_path', help="Write the results to this file.")
+        parser.add_argument('--run', metavar='MODE', help="Measure the current settings only (used per mode).")
+
+    def handle(self, *args, mode, database_url, seconds, threads, url_name, user, json_path, run, **options):
+        url_names = url_name or list(DEFAULT_URL_NAMES)
+        if run:
+            result = self.measure(run, seconds, threads, url_names, user)
+            self.stdout.write(json.dumps(result))
+            return
+
+        modes = mode or [name for name in MODES if database_url or not name.startswith('postgres')]
+        if any(name.startswith('postgres') for name in modes) and not database_url:
+            raise CommandError("The postgres modes need --database-url or $DATABASE_URL.")
+
+        results = []
+        for name in modes:
+            result = self.run_mode(name, database_url, seconds, threads, url_names, user)
+            results.append(result)
+            self.print_result(result, results[0])
+
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump({'threads': threads, 'seconds': seconds, 'url_names': url_names, 'results': results}, f, indent=2)
+            self.stdout.write(f"Wrote {json_path}")
+
+    def run_mode(self, name, database_url, seconds, threads, url_names, user):
+        env = {**os.environ, **MODES[name]}
+        if name.startswith('postgres'):
+            env['DATABASE_URL'] = database_url
+        else:
+            env.pop('DATABASE_URL', None)
+        command = [
+            sys.executable, '-m', 'django', 'bench_database', '--run', name,
+            '--seconds', str(seconds), '--threads', str(threads),
+        ]
+        command += [arg for url in url_names for arg in ('--url-name', url)]
+        if user:
+            command += ['--user', user]
+        completed = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f"{name} failed:\n{completed.stderr}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def measure(self, name, seconds, threads, url_names, username):
+        paths = [reverse(url_name) for url_name in url_names]
+        user = EndpointBench().bench_user(username)
+        database = connection.settings_dict
+        if connection.vendor == 'sqlite' and 'journal_mode=WAL' not in database['OPTIONS'].get('init_command', ''):
+            # journal_mode is stored in the file, so undo an earlier tuned run.
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=DELETE')
+        journal_mode = None
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+        connection.close()
+
+        start = threading.Barrier(threads + 1)
+        timings, errors, lock = [], [], threading.Lock()
+
+        def client_loop(offset):
+            client = Client()
+            client.force_login(user)
+            own_timings, own_errors = [], 0
+            start.wait()
+            deadline = time.perf_counter() + seconds
+            i = offset
+            while time.perf_counter() < deadline:
+                began = time.perf_counter()
+                response = client.get(paths[i % len(paths)], HTTP_ACCEPT='application/json')
+                own_timings.append((time.perf_counter() - began) * 1000)
+                own_errors += response.status_code != 200
+                i += 1
+            connections.close_all()
+            with lock:
+                timings.extend(own_timings)
+                errors.append(own_errors)
+
+        workers = [threading.Thread(target=client_loop, args=(n,)) for n in range(threads)]
+        with quiet_instrumentation():
+            for worker in workers:
+                worker.start()
+            start.wait()
+            began = time.perf_counter()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - began
+        timings.sort()
+        if journal_mode == 'wal':
+            # Leave the file as it was committed; the next tuned start turns WAL back on.
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=DELETE')
+            connection.close()
+
+        return {
+            'mode': name,
+            'vendor': connection.vendor,
+            'conn_max_age': database['CONN_MAX_AGE'],
+            'pool': bool(database['OPTIONS'].get('pool')),
+            'journal_mode': journal_mode,
+            'requests': len(timings),
+            'errors': sum(errors),
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 0.50), 3) if timings else None,
+            'p95_ms': round(percentile(timings, 0.95), 3) if timings else None,
+        }
+
+    def print_result(self, result, baseline):
+        ratio = result['rps'] / baseline['rps'] if baseline['rps'] else 0
+        self.stdout.write(
+            f"{result['mode']:<20} {result['rps']:>8.1f} req/s  x{ratio:4.2f}  "
+            f"p50 {result['p50_ms']:7.1f}  p95 {result['p95_ms']:7.1f} ms  "
+            f"{result['requests']:>6} requests  {result['errors']} errors"
+        )
@@ -0,0 +1,233 @@
+import json
+import math
+import platform
+import time
+import tracemalloc
+from datetime import datetime, timezone as dt_timezone
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.conf import settings
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+
+from scheduler import stats, urls
+from scheduler.models import (
+    Booking, FitnessClass, Location, MemberProfile, Notification, Schedule, TrainerProfile, WorkoutLog
+)
+
+
+# Model behind the <pk> of a function view, by a word in the URL name.
+NOUN_MODELS = {
+    'trainer': TrainerProfile,
+    'member': MemberProfile,
+    'class': FitnessClass,
+    'location': Location,
+    'schedule': Schedule,
+    'workoutlog': WorkoutLog,
+    'booking': Booking,
+    'notification': Notification,
+}
+
+# Pages that only work for some objects of their model.
+SAMPLE_FILTERS = {
+    'update_schedule_following': {'series__isnull': False},
+    'cancel_schedule_following': {'series__isnull': False},
+}
+
+
+def endpoints(patterns=None):
+    """(name, url kwargs, callback) for every named GET route in scheduler/urls.py, the API router included."""
+    for entry in urls.urlpatterns if patterns is None else patterns:
+        if isinstance(entry, URLResolver):
+            yield from endpoints(entry.url_patterns)
+            continue
+        if not isinstance(entry, URLPattern) or not entry.name:
+            continue
+        kwargs = list(entry.pattern.regex.groupindex)
+        if 'format' in kwargs:
+            # The router's .json/.api duplicates of each route.
+            continue
+        if 'get' not in getattr(entry.callback, 'actions', {'get': None}):
+            # POST-only API actions such as bookings/batch/.
+            continue
+        yield entry.name, kwargs, entry.callback
+
+
+def model_for(name, callback):
+    if hasattr(callback, 'cls'):
+        if callback.cls.queryset is not None:
+            return callback.cls.queryset.model
+        return callback.cls.serializer_class.Meta.model
+    if getattr(getattr(callback, 'view_class', None), 'model', None) is not None:
+        return callback.view_class.model
+    for word in name.replace('-', '_').split('_'):
+        if word in NOUN_MODELS:
+            return NOUN_MODELS[word]
+    return None
+
+
+def sample_pk(model, filters):
+    """A pk from the middle of the table, so pages see typical rather than first rows."""
+    queryset = model.objects.filter(**filters)
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return None
+    middle = (bounds['low'] + bounds['high']) // 2
+    return queryset.filter(pk__gte=middle).order_by('pk').values_list('pk', flat=True).first()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def quiet_instrumentation():
+    """The benchmarks report timings and queries themselves; don't also log every request as slow."""
+    return override_settings(INSTRUMENTATION={
+        **getattr(settings, 'INSTRUMENTATION', {}), 'SLOW_REQUEST_MS': math.inf, 'MAX_QUERIES': math.inf,
+    })
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every page and API route through the test client and report latency "
+        "percentiles, queries and peak Python memory per endpoint. Seed data first with seed_gym."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests per endpoint first.")
+        parser.add_argument('--only', action='append', default=[], help="Only URL names containing this; repeatable.")
+        parser.add_argument('--user', help="Username to request as; defaults to a superuser.")
+        parser.add_argument('--cold', action='store_true', help="Clear the cache before every request.")
+        parser.add_argument('--json', dest='json_path', help="Write the results to this file.")
+        parser.add_argument('--compare', help="A previous --json file to print changes against.")
+
+    def handle(self, *args, requests, warmup, only, user, cold, json_path, compare, **options):
+        client = Client()
+        client.force_login(self.bench_user(user))
+
+        results = []
+        with quiet_instrumentation():
+            for name, kwargs, callback in endpoints():
+                if only and not any(part in name for part in only):
+                    continue
+                result = {'name': name}
+                path = self.path_for(name, kwargs, callback)
+                if path is None:
+                    result['skipped'] = "no suitable object"
+                else:
+                    result.update(self.measure(client, path, requests, warmup, cold))
+                results.append(result)
+                self.print_result(result)
+
+        report = {'meta': self.meta(requests, warmup, cold), 'results': results}
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {json_path}")
+        if compare:
+            self.print_comparison(compare, results)
+
+    def bench_user(self, username):
+        User = get_user_model()
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"No user {username!r}.")
+        user = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if user is None:
+            user = User.objects.create_superuser('bench', 'bench@example.com', None)
+        return user
+
+    def path_for(self, name, kwargs, callback):
+        if not kwargs:
+            return reverse(name)
+        model = model_for(name, callback)
+        pk = model and sample_pk(model, SAMPLE_FILTERS.get(name, {}))
+        if pk is None:
+            return None
+        return reverse(name, kwargs={kwargs[0]: pk})
+
+    def measure(self, client, path, requests, warmup, cold):
+        headers = {'HTTP_ACCEPT': 'application/json'} if path.startswith('/api/') else {}
+
+        def get():
+            if cold:
+                cache.clear()
+            return client.get(path, **headers)
+
+        for _ in range(warmup):
+            get()
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = get()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+
+        # Queries and memory from one more request, so tracing doesn't skew the timings.
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as ctx:
+            response = get()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'path': path,
+            'status': response.status_code,
+            'bytes': len(response.content),
+            'requests': requests,
+            'p50_ms': round(percentile(timings, 0.50), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries': len(ctx),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def meta(self, requests, warmup, cold):
+        return {
+            'when': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests': requests,
+            'warmup': warmup,
+            'cold_cache': cold,
+            'rows': stats._count_all(),
+        }
+
+    def print_result(self, result):
+        if 'skipped' in result:
+            self.stdout.write(f"{result['name']:<32} skipped: {result['skipped']}")
+            return
+        self.stdout.write(
+            f"{result['name']:<32} {result['status']:>3}  p50 {result['p50_ms']:8.1f}  p95 {result['p95_ms']:8.1f}  "
+            f"p99 {result['p99_ms']:8.1f} ms  {result['queries']:>4} queries  {result['peak_kib']:>9.1f} KiB"
+        )
+
+    def print_comparison(self, path, results):
+        with open(path) as f:
+            baseline = {r['name']: r for r in json.load(f)['results'] if 'skipped' not in r}
+        self.stdout.write(f"\nChange against {path} (new / old):")
+        for result in results:
+            old = baseline.get(result['name'])
+            if old is None or 'skipped' in result:
+                continue
+            ratios = '  '.join(
+                f"{key[:-3]} x{result[key] / old[key]:5.2f}" if old[key] else f"{key[:-3]}    -"
+                for key in ('p50_ms', 'p95_ms', 'p99_ms')
+            )
+            queries = result['queries'] - old['queries']
+            self.stdout.write(f"{result['name']:<32} {ratios}  queries {queries:+d}")
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from scheduler.renderers import FastJSONRenderer
+from scheduler.serializers import ValuesProjection
+from scheduler.views_api import MemberViewSet, TrainerViewSet, FitnessClassViewSet, BookingViewSet, ScheduleViewSet
+
+
+class Command(BaseCommand):
+    help = "Compare ModelSerializer + JSONRenderer with the values() projection + FastJSONRenderer on the current data."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=5000, help="Rows per endpoint.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per path; the best is reported.")
+
+    def handle(self, *args, limit, repeat, **options):
+        viewsets = [MemberViewSet, TrainerViewSet, FitnessClassViewSet, BookingViewSet, ScheduleViewSet]
+        for viewset in viewsets:
+            queryset = viewset.queryset.order_by('pk')[:limit]
+            serializer_class = viewset.serializer_class
+            projection = ValuesProjection.for_serializer(serializer_class)
+
+            def model_path():
+                return JSONRenderer().render(serializer_class(queryset.all(), many=True).data)
+
+            def values_path():
+                return FastJSONRenderer().render(projection.render(projection.values(queryset.all())))
+
+            slow, slow_body = self.best_of(model_path, repeat)
+            fast, fast_body = self.best_of(values_path, repeat)
+            rows = queryset.count()
+            same = "identical" if slow_body == fast_body else "DIFFERENT"
+            self.stdout.write(
+                f"{viewset.__name__:<22} {rows:>7} rows  "
+                f"serializer {slow * 1000:8.1f} ms  values {fast * 1000:8.1f} ms  "
+                f"x{slow / fast if fast else 0:5.1f}  output {same}"
+            )
+
+    @staticmethod
+    def best_of(func, repeat):
+        best, body = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
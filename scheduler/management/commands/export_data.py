@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from scheduler import exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream bookings, schedules or workout logs as CSV or JSON Lines, in constant memory. "
+        "Prints the --since to pass for the next incremental export."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--format', dest='extension', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--start', help="First day (YYYY-MM-DD) of the export's date.")
+        parser.add_argument('--end', help="Last day (YYYY-MM-DD) of the export's date.")
+        parser.add_argument('--since', help="Only rows written at or after this ISO 8601 date and time.")
+        parser.add_argument('--output', help="File to write; defaults to standard output.")
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE, help="Rows fetched at a time.")
+        parser.add_argument('--database', default=None, help="Database alias to read from.")
+
+    def handle(self, *args, name, extension, output, chunk_size, database, **options):
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        try:
+            filters = exports.parse_filters(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        until = timezone.now()
+        chunks = exports.stream(
+            exports.EXPORTS[name], extension, chunk_size=chunk_size, until=until, using=database, **filters,
+        )
+        if output:
+            with open(output, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+        self.stderr.write(f"Exported {name} written before {until.isoformat()}; "
+                          f"next incremental export: --since {exports.resume_point(until).isoformat()}")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from scheduler.models import SEAT_COUNTERS, Schedule
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-schedule booking counters from the Booking table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('schedule_ids', nargs='*', type=int, help="Only recount these schedules.")
+        parser.add_argument('--check', action='store_true', help="Report drifted schedules without fixing them.")
+
+    def handle(self, *args, schedule_ids=None, check=False, **options):
+        schedules = Schedule.objects.all()
+        if schedule_ids:
+            schedules = schedules.filter(pk__in=schedule_ids)
+
+        if check:
+            self.check_counters(schedules)
+            return
+
+        updated = schedules.recount_seats()
+        self.stdout.write(self.style.SUCCESS(f"Recounted {updated} schedule(s)."))
+
+    def check_counters(self, schedules):
+        fields = ['pk', *SEAT_COUNTERS.values()]
+        stored = {row['pk']: row for row in schedules.values(*fields)}
+
+        # Recount inside a transaction that is rolled back, then compare.
+        with transaction.atomic():
+            schedules.recount_seats()
+            drifted = [row['pk'] for row in schedules.values(*fields) if row != stored.get(row['pk'])]
+            transaction.set_rollback(True)
+
+        if drifted:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} schedule(s) out of date: {drifted}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("All counters are correct."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from scheduler.synthetic import SCALES, populate
+
+
+class Command(BaseCommand):
+    help = "Bulk-insert a synthetic gym for load testing (see bench_endpoints)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small', help="Preset sizes; 'full' is 50k members / 5M bookings.")
+        for name in SCALES['full']:
+            parser.add_argument(f'--{name}', type=int, help=f"Override the preset number of {name}.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for repeatable data.")
+
+    def handle(self, *args, scale, batch_size, seed, **options):
+        sizes = {name: options[name] if options[name] is not None else value for name, value in SCALES[scale].items()}
+        self.stdout.write(f"Seeding {', '.join(f'{n} {name}' for name, n in sizes.items())}")
+        counts = populate(**sizes, batch_size=batch_size, seed=seed, log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f"Created {counts}"))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from scheduler import notifications
+
+
+class Command(BaseCommand):
+    help = "Turn queued schedule moves and cancellations into member notifications."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, as a worker process.")
+        parser.add_argument('--interval', type=float, default=30, help="Seconds between runs with --loop.")
+
+    def handle(self, *args, loop, interval, **options):
+        while True:
+            written = notifications.process_all()
+            if written or not loop:
+                self.stdout.write(f"Sent {written} notification(s).")
+            if not loop:
+                return
+            time.sleep(interval)
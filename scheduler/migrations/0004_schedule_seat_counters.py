@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_bookings(apps, schema_editor):
+    Booking = apps.get_model('scheduler', 'Booking')
+    Schedule = apps.get_model('scheduler', 'Schedule')
+    counts = {}
+    for status in ('booked', 'attended', 'cancelled', 'no_show'):
+        per_schedule = (
+            Booking.objects.filter(schedule=OuterRef('pk'), status=status)
+            .order_by()
+            .values('schedule')
+            .annotate(n=Count('pk'))
+            .values('n')
+        )
+        counts[f'{status}_count'] = Coalesce(Subquery(per_schedule), 0)
+    Schedule.objects.using(schema_editor.connection.alias).update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0003_fitnessclass_trainer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='attended_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='cancelled_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='no_show_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_existing_bookings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# PostgreSQL only: refuse overlapping [start_time, end_time) ranges for the
+# same trainer or the same location at the database level. Other backends
+# rely on Schedule.clean(), which does the equivalent indexed check.
+CONSTRAINTS = {
+    'schedule_trainer_no_overlap': 'trainer_id',
+    'schedule_location_no_overlap': 'location_id',
+}
+
+
+def add_exclusion_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = schema_editor.quote_name(apps.get_model('scheduler', 'Schedule')._meta.db_table)
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, column in CONSTRAINTS.items():
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {schema_editor.quote_name(name)} '
+            f'EXCLUDE USING gist ({column} WITH =, tstzrange(start_time, end_time) WITH &&)'
+        )
+
+
+def remove_exclusion_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table = schema_editor.quote_name(apps.get_model('scheduler', 'Schedule')._meta.db_table)
+    for name in CONSTRAINTS:
+        schema_editor.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {schema_editor.quote_name(name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0005_booking_waitlist'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_exclusion_constraints, remove_exclusion_constraints),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0006_schedule_exclusion_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField(help_text='First occurrence.')),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly')], default='weekly', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1, help_text='Repeat every N days or weeks.')),
+                ('weekdays', models.CharField(blank=True, max_length=20)),
+                ('until', models.DateField(blank=True, help_text='Last date (inclusive).', null=True)),
+                ('count', models.PositiveSmallIntegerField(blank=True, help_text='Number of occurrences.', null=True)),
+                ('exceptions', models.JSONField(blank=True, default=list)),
+                ('fitness_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scheduler.fitnessclass')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='scheduler.location')),
+                ('trainer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='scheduler.trainerprofile')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='series',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='scheduler.scheduleseries'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+COLLECTIONS = ['schedules', 'fitness_classes', 'locations', 'bookings', 'people']
+
+
+def create_versions(apps, schema_editor):
+    CollectionVersion = apps.get_model('scheduler', 'CollectionVersion')
+    CollectionVersion.objects.using(schema_editor.connection.alias).bulk_create([CollectionVersion(name=name) for name in COLLECTIONS])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0008_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0009_collection_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='timetable_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0010_location_timetable_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schedule_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('moved', 'Moved'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('old_start', models.DateTimeField()),
+                ('new_start', models.DateTimeField(blank=True, null=True)),
+                ('class_name', models.CharField(blank=True, max_length=100)),
+                ('recipients', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('new_location', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='scheduler.location')),
+                ('old_location', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='scheduler.location')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['schedule_id', 'created_at'], name='schedulechange_pending_idx')],
+            },
+        ),
+    ]
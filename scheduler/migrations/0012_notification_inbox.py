@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_unread(apps, schema_editor):
+    Notification = apps.get_model('scheduler', 'Notification')
+    User = apps.get_model('scheduler', 'User')
+    unread = (
+        Notification.objects.filter(user=OuterRef('pk'), is_read=False)
+        .order_by()
+        .values('user')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    User.objects.using(schema_editor.connection.alias).update(unread_notifications=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0011_schedule_change_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='notification_inbox_idx'),
+        ),
+        migrations.RunPython(count_existing_unread, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0013_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassDailyAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('attended', models.PositiveIntegerField(default=0)),
+                ('no_show', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('waitlisted', models.PositiveIntegerField(default=0)),
+                ('fitness_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='scheduler.fitnessclass')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='class_attendance_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('fitness_class', 'day'), name='class_attendance_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LocationHourlyAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('attended', models.PositiveIntegerField(default=0)),
+                ('no_show', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('waitlisted', models.PositiveIntegerField(default=0)),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='scheduler.location')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='location_attendance_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('location', 'day', 'hour'), name='location_attendance_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MemberDailyAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('attended', models.PositiveIntegerField(default=0)),
+                ('no_show', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('waitlisted', models.PositiveIntegerField(default=0)),
+                ('workouts', models.PositiveIntegerField(default=0)),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='scheduler.memberprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='member_attendance_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('member', 'day'), name='member_attendance_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrainerDailyAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('attended', models.PositiveIntegerField(default=0)),
+                ('no_show', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('waitlisted', models.PositiveIntegerField(default=0)),
+                ('trainer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='scheduler.trainerprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='trainer_attendance_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('trainer', 'day'), name='trainer_attendance_key')],
+            },
+        ),
+    ]
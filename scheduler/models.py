@@ -1,6 +1,14 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from collections import Counter
+from contextvars import ContextVar
+from datetime import date
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 import uuid
+from . import analytics, seats, stats, versions
 
 class User(AbstractUser):
     MEMBER = 1
@@ -19,6 +27,21 @@ class User(AbstractUser):
 
     tfa_secret = models.CharField(max_length=255, blank=True) 
 
+    # Maintained from Notification writes, see NotificationQuerySet and signals.py.
+    unread_notifications = models.PositiveIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        # unread_notifications only moves by UPDATE ... SET n = n + delta;
+        # writing back the value loaded with this object would undo the
+        # notifications that arrived since. Name it in update_fields to set it.
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'unread_notifications' and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
 
@@ -49,10 +72,47 @@ class WorkoutType(models.Model):
     def __str__(self):
         return self.name
 
+class LocationQuerySet(models.QuerySet):
+    def bump_timetable(self):
+        """
+        Invalidate the cached timetables of these locations once the caller's
+        transaction commits, see timetable.py.
+
+        Seat counter changes come through here, so bumping inside the booking
+        transaction would hold the location row locked until it commits and
+        queue every booking at that location behind it. As with
+        versions.bump(), all the locations of one transaction are bumped
+        together afterwards.
+        """
+        using = self.db
+        _pending_timetables(using).update(self.values_list('pk', flat=True))
+        transaction.on_commit(lambda: _flush_timetables(using), using=using)
+
+
+def _pending_timetables(using):
+    connection = connections[using]
+    if not hasattr(connection, 'pending_timetable_bumps'):
+        connection.pending_timetable_bumps = set()
+    return connection.pending_timetable_bumps
+
+
+def _flush_timetables(using):
+    pks = _pending_timetables(using)
+    if not pks:
+        return
+    pks, connections[using].pending_timetable_bumps = sorted(pks), set()
+    Location.objects.using(using).filter(pk__in=pks).update(timetable_version=F('timetable_version') + 1)
+
+
 class Location(models.Model):
     name = models.CharField(max_length=100) 
     address = models.TextField(blank=True)
     capacity = models.PositiveIntegerField(default=20)
+    # Bumped by every Schedule write here, including seat counter changes,
+    # and by edits to the classes and trainers its timetable shows.
+    timetable_version = models.PositiveBigIntegerField(default=0, editable=False)
+
+    objects = LocationQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -76,28 +136,399 @@ class FitnessClass(models.Model):
         return f"{self.name} ({self.workout_type})"
 
 
+class ScheduleSeries(models.Model):
+    """A repeating timetable slot, expanded into Schedule rows by recurrence.py."""
+
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+
+    FREQUENCY_CHOICES = (
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+    )
+
+    fitness_class = models.ForeignKey(FitnessClass, on_delete=models.CASCADE)
+    trainer = models.ForeignKey(TrainerProfile, on_delete=models.CASCADE)
+    location = models.ForeignKey(Location, on_delete=models.PROTECT)
+    start_time = models.DateTimeField(help_text="First occurrence.")
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default=WEEKLY)
+    interval = models.PositiveSmallIntegerField(default=1, help_text="Repeat every N days or weeks.")
+    # Comma separated weekday numbers, Monday=0. Empty means the first occurrence's weekday.
+    weekdays = models.CharField(max_length=20, blank=True)
+    until = models.DateField(null=True, blank=True, help_text="Last date (inclusive).")
+    count = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Number of occurrences.")
+    # ISO dates (YYYY-MM-DD) to skip.
+    exceptions = models.JSONField(default=list, blank=True)
+
+    def clean(self):
+        super().clean()
+        if self.until is None and not self.count:
+            raise ValidationError("Set either an end date or a number of occurrences.")
+        if not self.interval:
+            raise ValidationError({'interval': "Interval must be at least 1."})
+        try:
+            weekdays = self.weekday_list()
+            self.exception_dates()
+        except (TypeError, ValueError):
+            raise ValidationError("Weekdays must be numbers 0-6 and exceptions ISO dates.")
+        if any(d > 6 for d in weekdays):
+            raise ValidationError({'weekdays': "Weekdays must be numbers 0-6."})
+
+    def weekday_list(self):
+        return sorted({int(d) for d in self.weekdays.split(',') if d.strip()})
+
+    def exception_dates(self):
+        return {date.fromisoformat(d) for d in self.exceptions}
+
+    def __str__(self):
+        return f"{self.fitness_class.name} ({self.get_frequency_display()}) from {self.start_time.strftime('%Y-%m-%d %H:%M')}"
+
+
+# Booking status -> Schedule counter column that tracks it.
+SEAT_COUNTERS = {
+    'booked': 'booked_count',
+    'attended': 'attended_count',
+    'cancelled': 'cancelled_count',
+    'no_show': 'no_show_count',
+    'waitlisted': 'waitlist_count',
+}
+
+# Statuses that hold a seat in a class. Cancelled and waitlisted ones don't.
+SEAT_HOLDING_STATUSES = ('booked', 'attended', 'no_show')
+
+
+class StampedQuerySet(models.QuerySet):
+    """
+    Moves updated_at on queryset updates too (bulk_update() included);
+    auto_now only covers save(). Incremental exports read it, see exports.py.
+    """
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+
+def _stamp_update_fields(kwargs):
+    # save(update_fields=...) leaves auto_now fields alone unless they are listed.
+    if kwargs.get('update_fields') is not None:
+        kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+
+
+class VersionedQuerySet(models.QuerySet):
+    """Bumps the model's collection version on writes that skip the signals."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            versions.bump_for(self.model, using=self.db)
+        return created
+
+    def update(self, **kwargs):
+        # bulk_update() goes through here too.
+        with transaction.atomic(using=self.db):
+            rows = super().update(**kwargs)
+            if rows:
+                versions.bump_for(self.model, using=self.db)
+        return rows
+
+
+class ScheduleQuerySet(StampedQuerySet, VersionedQuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            Location.objects.using(self.db).filter(pk__in={s.location_id for s in objs}).bump_timetable()
+        return created
+
+    def update(self, **kwargs):
+        # Seat counter changes come through here too, so booking writes
+        # refresh the timetable as well.
+        with transaction.atomic(using=self.db):
+            locations = Location.objects.using(self.db)
+            moving = {'location', 'location_id'} & set(kwargs)
+            if moving:
+                # The new location may be any expression (bulk_update() passes a
+                # Case), so read both sides from the rows themselves.
+                before = list(self.order_by().values_list('pk', 'location_id'))
+            else:
+                locations.filter(pk__in=self.values('location_id')).bump_timetable()
+            regrouped = None
+            if analytics.SCHEDULE_KEYS & set(kwargs):
+                # The bookings move between rollup rows.
+                regrouped = analytics.schedule_keys(self.values('pk'))
+            rows = super().update(**kwargs)
+            if moving:
+                pks = [pk for pk, _ in before]
+                after = Schedule.objects.using(self.db).filter(pk__in=pks).values_list('location_id', flat=True)
+                locations.filter(pk__in={location_id for _, location_id in before} | set(after)).bump_timetable()
+            if regrouped:
+                analytics.record_regrouping(regrouped)
+        return rows
+
+    def overlapping(self, start, end):
+        """
+        Return an entry in this queryset whose interval overlaps
+        [start, end), or None.
+
+        Entries for one trainer or one location never overlap each other, so
+        when sorted by start_time their end_times are sorted too and only the
+        last entry starting before ``end`` can reach past ``start``. That is a
+        single seek on the (trainer, start_time) or (location, start_time)
+        index instead of a scan.
+        """
+        previous = self.filter(start_time__lt=end).order_by('-start_time').first()
+        if previous is not None and previous.end_time > start:
+            return previous
+        return None
+
+    def adjust_seat_counts(self, deltas):
+        """Apply a {(schedule_id, status): delta} mapping to the counter columns."""
+        moved = set()
+        for (schedule_id, status), delta in deltas.items():
+            field = SEAT_COUNTERS.get(status)
+            if field and delta:
+                self.filter(pk=schedule_id).update(**{field: F(field) + delta})
+                moved.add(schedule_id)
+        if moved:
+            seats.changed(moved)
+
+    def recount_seats(self):
+        """Rebuild the counter columns from the Booking table."""
+        counts = {}
+        for status, field in SEAT_COUNTERS.items():
+            per_schedule = (
+                Booking.objects.filter(schedule=OuterRef('pk'), status=status)
+                .order_by()
+                .values('schedule')
+                .annotate(n=Count('pk'))
+                .values('n')
+            )
+            counts[field] = Coalesce(Subquery(per_schedule), 0)
+        # Evaluated after commit, and only if a stream could be listening.
+        seats.changed(self.values_list('pk', flat=True))
+        return self.update(**counts)
+
+    def promote_waitlists(self):
+        """
+        Fill free seats from the head of each schedule's waitlist.
+
+        The schedule row is locked while promoting. Each promotion is a single
+        index seek on the waitlist position, however long the queue is.
+        """
+        promoted = []
+        for pk in self.values_list('pk', flat=True):
+            with transaction.atomic(using=self.db):
+                schedule = (
+                    Schedule.objects.using(self.db)
+                    .select_for_update(of=('self',))
+                    .select_related('fitness_class')
+                    .get(pk=pk)
+                )
+                for _ in range(schedule.seats_left):
+                    head = schedule.next_waitlisted()
+                    if head is None:
+                        break
+                    head.status = 'booked'
+                    head.waitlist_position = None
+                    head.save(update_fields=['status', 'waitlist_position'])
+                    promoted.append(head)
+        return promoted
+
+
 class Schedule(models.Model):
     fitness_class = models.ForeignKey(FitnessClass, on_delete=models.CASCADE)
     trainer = models.ForeignKey(TrainerProfile, on_delete=models.CASCADE)
     location = models.ForeignKey(Location, on_delete=models.PROTECT)
     start_time = models.DateTimeField() 
     end_time = models.DateTimeField()  
+    series = models.ForeignKey(
+        ScheduleSeries,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='occurrences'
+    )
+
+    # Maintained from Booking writes, see BookingQuerySet and signals.py.
+    booked_count = models.PositiveIntegerField(default=0, editable=False)
+    attended_count = models.PositiveIntegerField(default=0, editable=False)
+    cancelled_count = models.PositiveIntegerField(default=0, editable=False)
+    no_show_count = models.PositiveIntegerField(default=0, editable=False)
+    waitlist_count = models.PositiveIntegerField(default=0, editable=False)
+    # Last waitlist position handed out; positions only ever grow.
+    waitlist_tail = models.PositiveIntegerField(default=0, editable=False)
+    # Last write of any kind, seat counter changes included, for incremental exports.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ScheduleQuerySet.as_manager()
+
+    # Remembered as loaded, for change notifications and attendance rollups.
+    TRACKED_FIELDS = ('start_time', 'location_id', 'trainer_id', 'fitness_class_id')
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['trainer', 'start_time'], name='unique_trainer_time'),
             models.UniqueConstraint(fields=['location', 'start_time'], name='unique_location_time'),
         ]
+        indexes = [
+            # Keyset pagination key, see pagination.py.
+            models.Index(fields=['start_time', 'id'], name='schedule_start_id_idx'),
+            # Incremental exports, see exports.py.
+            models.Index(fields=['updated_at', 'id'], name='schedule_updated_at_id_idx'),
+        ]
         ordering = ['start_time']
 
+    def clean(self):
+        super().clean()
+        if not self.start_time:
+            return
+        end_time = self.end_time
+        if not end_time and self.fitness_class_id:
+            end_time = self.start_time + self.fitness_class.duration
+        if not end_time:
+            return
+        if end_time <= self.start_time:
+            raise ValidationError({'end_time': "End time must be after the start time."})
+
+        others = Schedule.objects.exclude(pk=self.pk)
+        errors = {}
+        if self.trainer_id:
+            clash = others.filter(trainer_id=self.trainer_id).overlapping(self.start_time, end_time)
+            if clash:
+                errors['trainer'] = f"This trainer is already teaching {clash}."
+        if self.location_id:
+            clash = others.filter(location_id=self.location_id).overlapping(self.start_time, end_time)
+            if clash:
+                errors['location'] = f"This location is already in use by {clash}."
+        if errors:
+            raise ValidationError(errors)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Where and when the row was as loaded; signals.py compares against it.
+        instance._original = {name: instance.__dict__.get(name) for name in cls.TRACKED_FIELDS}
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.end_time and self.fitness_class:
             self.end_time = self.start_time + self.fitness_class.duration
-        super().save(*args, **kwargs)
+        _stamp_update_fields(kwargs)
+        try:
+            with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Schedule, instance=self)):
+                super().save(*args, **kwargs)
+        except IntegrityError:
+            # Another write took the slot after clean() ran and the unique (or,
+            # on PostgreSQL, exclusion) constraint refused this one; clean()
+            # now sees that entry and says which. Anything else is re-raised.
+            self.clean()
+            raise
+
+    @property
+    def seats_taken(self):
+        return self.booked_count + self.attended_count + self.no_show_count
+
+    @property
+    def seats_left(self):
+        return max(self.fitness_class.capacity - self.seats_taken, 0)
+
+    def next_waitlisted(self):
+        return (
+            self.booking_set.filter(status='waitlisted')
+            .order_by('waitlist_position')
+            .first()
+        )
 
     def __str__(self):
         return f"{self.fitness_class.name} by {self.trainer} at {self.start_time.strftime('%Y-%m-%d %H:%M')}"
 
+
+# Set while BookingQuerySet.bulk_update() runs.
+_bulk_updating = ContextVar('booking_bulk_updating', default=False)
+
+
+class BookingQuerySet(StampedQuerySet, VersionedQuerySet):
+    """
+    Keeps the Schedule counters right for writes that skip Booking.save()
+    and the post_save/post_delete signals.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                # We can't tell which rows were actually written, so compare
+                # what the (schedule, member) pairs held before and after.
+                pairs = {(b.schedule_id, b.member_id) for b in objs}
+                rows = self.model.objects.using(self.db).filter(
+                    schedule_id__in={schedule_id for schedule_id, _ in pairs},
+                    member_id__in={member_id for _, member_id in pairs},
+                )
+                before = [row for row in self._rollups(rows) if row[:2] in pairs]
+                created = super().bulk_create(objs, *args, **kwargs)
+                after = [row for row in self._rollups(rows) if row[:2] in pairs]
+                Schedule.objects.filter(pk__in={schedule_id for schedule_id, _ in pairs}).recount_seats()
+                analytics.record_bookings(self._deltas(before, after))
+                stats.invalidate()
+            else:
+                created = super().bulk_create(objs, *args, **kwargs)
+                stats.adjust_count(self.model, len(created))
+                Schedule.objects.adjust_seat_counts(Counter((b.schedule_id, b.status) for b in created))
+                analytics.record_bookings(Counter((b.schedule_id, b.member_id, b.status) for b in created))
+                for b in created:
+                    b._counted = (b.schedule_id, b.status)
+                    b._rolled_up = (b.schedule_id, b.member_id, b.status)
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if not {'status', 'schedule'} & set(fields):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        with transaction.atomic(using=self.db):
+            bookings = self.model.objects.using(self.db).filter(pk__in=[b.pk for b in objs])
+            before = self._rollups(bookings)
+            # The update() calls bulk_update() makes leave the bookkeeping to it.
+            token = _bulk_updating.set(True)
+            try:
+                rows = super().bulk_update(objs, fields, *args, **kwargs)
+            finally:
+                _bulk_updating.reset(token)
+            self._recount(before, self._rollups(bookings))
+            for b in objs:
+                b._counted = (b.schedule_id, b.status)
+                b._rolled_up = (b.schedule_id, b.member_id, b.status)
+        return rows
+
+    def update(self, **kwargs):
+        if _bulk_updating.get() or not {'status', 'schedule', 'schedule_id'} & set(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            before = list(self.order_by().values_list('pk', 'schedule_id', 'member_id', 'status'))
+            rows = super().update(**kwargs)
+            # The new values may be any expression; read what the rows hold now.
+            after = self._rollups(self.model.objects.using(self.db).filter(pk__in=[row[0] for row in before]))
+            self._recount([row[1:] for row in before], after)
+        return rows
+
+    @staticmethod
+    def _rollups(bookings):
+        """The (schedule_id, member_id, status) of each of ``bookings``, as analytics counts them."""
+        return list(bookings.order_by().values_list('schedule_id', 'member_id', 'status'))
+
+    @staticmethod
+    def _deltas(before, after):
+        deltas = Counter(after)
+        deltas.subtract(before)
+        return deltas
+
+    def _recount(self, before, after):
+        schedules = Schedule.objects.using(self.db).filter(pk__in={row[0] for row in before + after})
+        schedules.recount_seats()
+        analytics.record_bookings(self._deltas(before, after))
+        schedules.promote_waitlists()
+
+
 class Booking(models.Model):
     member = models.ForeignKey('MemberProfile', on_delete=models.CASCADE)  
     schedule = models.ForeignKey('Schedule', on_delete=models.CASCADE)  
@@ -108,31 +539,316 @@ class Booking(models.Model):
         ('cancelled', 'Cancelled'),
         ('attended', 'Attended'),
         ('no_show', 'No-Show'),
+        ('waitlisted', 'Waitlisted'),
     )
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='booked')
+    # Place in the schedule's waitlist queue, set only while waitlisted.
+    waitlist_position = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Last write of any kind, for incremental exports.
+    updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BookingQuerySet.as_manager()
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['member', 'schedule'], name='unique_member_booking'),
         ]
+        indexes = [
+            models.Index(
+                fields=['schedule', 'waitlist_position'],
+                condition=models.Q(status='waitlisted'),
+                name='booking_waitlist_idx',
+            ),
+            # Keyset pagination key, see pagination.py.
+            models.Index(fields=['booked_at', 'id'], name='booking_booked_at_id_idx'),
+            # Seat recounts, capacity checks and notification recipients.
+            models.Index(fields=['schedule', 'status'], name='booking_schedule_status_idx'),
+            # Incremental exports, see exports.py.
+            models.Index(fields=['updated_at', 'id'], name='booking_updated_at_id_idx'),
+        ]
         ordering = ['-booked_at']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the Schedule counters currently include for this row.
+        if 'schedule_id' in instance.__dict__ and 'status' in instance.__dict__:
+            instance._counted = (instance.schedule_id, instance.status)
+            # And the attendance rollups, see analytics.py.
+            if 'member_id' in instance.__dict__:
+                instance._rolled_up = (instance.schedule_id, instance.member_id, instance.status)
+        return instance
+
+    def save(self, *args, **kwargs):
+        _stamp_update_fields(kwargs)
+        # The counter update in post_save must commit or roll back with the row.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.member.user.username} -> {self.schedule}"
 
 
+class WorkoutLogQuerySet(StampedQuerySet):
+    """Keeps the members' attendance rollups right for inserts that skip the signals."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                # Only logs given a pk can conflict; compare what those rows
+                # held before and after. The rest are all new.
+                new = [w for w in objs if w.pk is None]
+                rows = self.model.objects.using(self.db).filter(pk__in=[w.pk for w in objs if w.pk is not None])
+                before = list(rows.order_by().values_list('member_id', 'date'))
+                created = super().bulk_create(objs, *args, **kwargs)
+                deltas = Counter(rows.order_by().values_list('member_id', 'date'))
+                deltas.subtract(before)
+                deltas.update((w.member_id, w.date) for w in new)
+                analytics.record_workouts(deltas)
+            else:
+                created = super().bulk_create(objs, *args, **kwargs)
+                analytics.record_workouts(Counter((w.member_id, w.date) for w in created))
+                for w in created:
+                    w._rolled_up = (w.member_id, w.date)
+        return created
+
+
 class WorkoutLog(models.Model):
     member = models.ForeignKey(MemberProfile, on_delete=models.CASCADE)
     date = models.DateField(auto_now_add=True)
     notes = models.TextField(blank=True)
+    # Last write of any kind, for incremental exports.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = WorkoutLogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination key, see pagination.py.
+            models.Index(fields=['date', 'id'], name='workoutlog_date_id_idx'),
+            # One member's logs, newest first (workoutlogs_list, WorkoutLogListView).
+            models.Index(fields=['member', '-date', '-id'], name='workoutlog_member_date_idx'),
+            # Incremental exports, see exports.py.
+            models.Index(fields=['updated_at', 'id'], name='workoutlog_updated_at_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which attendance rollup row counts this log, see analytics.py.
+        if 'member_id' in instance.__dict__ and 'date' in instance.__dict__:
+            instance._rolled_up = (instance.member_id, instance.date)
+        return instance
+
+    def save(self, *args, **kwargs):
+        _stamp_update_fields(kwargs)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.member} — {self.date}"
 
+def recount_unread(user_ids):
+    """Rebuild User.unread_notifications for ``user_ids`` from the Notification table."""
+    unread = (
+        Notification.objects.filter(user=OuterRef('pk'), is_read=False)
+        .order_by()
+        .values('user')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    return User.objects.filter(pk__in=user_ids).update(unread_notifications=Coalesce(Subquery(unread), 0))
+
+
+def adjust_unread(deltas):
+    """Apply a {user_id: delta} mapping, one UPDATE per distinct delta."""
+    by_delta = {}
+    for user_id, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(user_id)
+    for delta, user_ids in by_delta.items():
+        User.objects.filter(pk__in=user_ids).update(unread_notifications=F('unread_notifications') + delta)
+
+
+class NotificationQuerySet(models.QuerySet):
+    """Keeps User.unread_notifications right for writes that skip the signals."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                recount_unread({n.user_id for n in objs})
+            else:
+                adjust_unread(Counter(n.user_id for n in created if not n.is_read))
+                for n in created:
+                    n._counted = (n.user_id, n.is_read)
+        return created
+
+    def update(self, **kwargs):
+        if not {'is_read', 'user', 'user_id'} & set(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            user_ids = set(self.order_by().values_list('user_id', flat=True).distinct())
+            rows = super().update(**kwargs)
+            new_user = kwargs.get('user', kwargs.get('user_id'))
+            if new_user is not None:
+                user_ids.add(getattr(new_user, 'pk', new_user))
+            recount_unread(user_ids)
+        return rows
+
+    def mark_all_read(self, user):
+        """Mark every unread notification of ``user`` read with a single UPDATE."""
+        unread = self.filter(user=user, is_read=False)
+        with transaction.atomic(using=self.db):
+            # The counter is known to become zero, so skip update()'s recount.
+            rows = super(NotificationQuerySet, unread).update(is_read=True)
+            User.objects.filter(pk=user.pk).update(unread_notifications=0)
+        user.unread_notifications = 0
+        return rows
+
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Unread lists and recounts.
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_unread_idx'),
+            # Inbox keyset pagination, see pagination.py.
+            models.Index(fields=['user', 'created_at', 'id'], name='notification_inbox_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what User.unread_notifications currently includes for this row.
+        if 'user_id' in instance.__dict__ and 'is_read' in instance.__dict__:
+            instance._counted = (instance.user_id, instance.is_read)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The counter update in post_save must commit or roll back with the row.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.title
+
+
+class ScheduleChange(models.Model):
+    """
+    Outbox row for a moved or deleted schedule, written in the same
+    transaction as the change and turned into Notifications later by
+    notifications.py, so the request only pays for one insert.
+    """
+    MOVED = 'moved'
+    CANCELLED = 'cancelled'
+    KIND_CHOICES = (
+        (MOVED, 'Moved'),
+        (CANCELLED, 'Cancelled'),
+    )
+
+    # Not a foreign key: the schedule may be gone by the time this is read.
+    schedule_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    old_start = models.DateTimeField()
+    new_start = models.DateTimeField(null=True, blank=True)
+    old_location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, related_name='+')
+    new_location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, related_name='+')
+    # Snapshots for cancellations, whose schedule and bookings are deleted.
+    class_name = models.CharField(max_length=100, blank=True)
+    recipients = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['schedule_id', 'created_at'],
+                name='schedulechange_pending_idx',
+                condition=models.Q(processed_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} schedule {self.schedule_id}"
+
+
+class CollectionVersion(models.Model):
+    """
+    Change counter for one collection of list data, bumped in the same
+    transaction as every write to it; see versions.py.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+# ATTENDANCE ROLLUPS
+# Per-day booking counts by status, kept in step with Booking and WorkoutLog
+# writes; analytics.py maintains them and reads its reports from them.
+
+class AttendanceRollup(models.Model):
+    day = models.DateField()
+    # Bookings currently in each status, see analytics.STATUS_COLUMNS.
+    booked = models.PositiveIntegerField(default=0)
+    attended = models.PositiveIntegerField(default=0)
+    no_show = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+    waitlisted = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class ClassDailyAttendance(AttendanceRollup):
+    fitness_class = models.ForeignKey(FitnessClass, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fitness_class', 'day'], name='class_attendance_key'),
+        ]
+        indexes = [models.Index(fields=['day'], name='class_attendance_day_idx')]
+
+
+class TrainerDailyAttendance(AttendanceRollup):
+    trainer = models.ForeignKey(TrainerProfile, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trainer', 'day'], name='trainer_attendance_key'),
+        ]
+        indexes = [models.Index(fields=['day'], name='trainer_attendance_day_idx')]
+
+
+class LocationHourlyAttendance(AttendanceRollup):
+    """By the local hour classes start, for busiest-hour reports."""
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='+')
+    hour = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'day', 'hour'], name='location_attendance_key'),
+        ]
+        indexes = [models.Index(fields=['day'], name='location_attendance_day_idx')]
+
+
+class MemberDailyAttendance(AttendanceRollup):
+    member = models.ForeignKey(MemberProfile, on_delete=models.CASCADE, related_name='+')
+    workouts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['member', 'day'], name='member_attendance_key'),
+        ]
+        indexes = [models.Index(fields=['day'], name='member_attendance_day_idx')]
@@ -0,0 +1,167 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Booking, Notification, Schedule, ScheduleChange
+
+
+# Bookings whose members hear about changes to their class.
+NOTIFY_STATUSES = ('booked', 'waitlisted')
+# Rows per INSERT when writing notifications.
+CHUNK_SIZE = 500
+# Schedules handled per transaction by process().
+SCHEDULES_PER_RUN = 200
+
+
+def collapse_window():
+    """
+    Changes to one schedule are held until it has been quiet this long, then
+    sent as one notification per member describing the net change.
+    """
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_COLLAPSE_SECONDS', 300))
+
+
+def _when(value):
+    return timezone.localtime(value).strftime('%a %d %b %H:%M')
+
+
+def _recipients(schedule_ids):
+    rows = (
+        Booking.objects.filter(schedule_id__in=schedule_ids, status__in=NOTIFY_STATUSES)
+        .values_list('schedule_id', 'member__user_id')
+    )
+    recipients = {}
+    for schedule_id, user_id in rows:
+        recipients.setdefault(schedule_id, set()).add(user_id)
+    return recipients
+
+
+# RECORDING
+
+def record_moves(moves):
+    """Queue notifications for [(schedule, original start_time, original location_id)] in one insert."""
+    ScheduleChange.objects.bulk_create([
+        ScheduleChange(
+            schedule_id=schedule.pk, kind=ScheduleChange.MOVED,
+            old_start=start, new_start=schedule.start_time,
+            old_location_id=location_id, new_location_id=schedule.location_id,
+        )
+        for schedule, start, location_id in moves
+        if (start, location_id) != (schedule.start_time, schedule.location_id)
+    ])
+
+
+# Schedules whose cancellation cancelling() has queued already, so the
+# pre_delete signal skips them as the delete runs.
+_queued = ContextVar('queued_cancellations', default=frozenset())
+
+
+def record_cancellations(schedules):
+    """
+    Queue the cancellation of ``schedules`` (fitness_class loaded) in one
+    insert, snapshotting who to tell before the bookings are deleted.
+    """
+    recipients = _recipients([schedule.pk for schedule in schedules])
+    ScheduleChange.objects.bulk_create([
+        ScheduleChange(
+            schedule_id=schedule.pk, kind=ScheduleChange.CANCELLED,
+            old_start=schedule.start_time, old_location_id=schedule.location_id,
+            class_name=schedule.fitness_class.name,
+            recipients=sorted(recipients.get(schedule.pk, ())),
+        )
+        for schedule in schedules
+    ])
+
+
+def record_cancellation(schedule):
+    if schedule.pk not in _queued.get():
+        record_cancellations([schedule])
+
+
+@contextmanager
+def cancelling(schedules):
+    """Queue the cancellations of ``schedules`` up front for a delete of them inside the block."""
+    record_cancellations(schedules)
+    token = _queued.set(_queued.get() | {schedule.pk for schedule in schedules})
+    try:
+        yield
+    finally:
+        _queued.reset(token)
+
+
+# FAN-OUT
+
+def process(now=None):
+    """
+    Turn the changes of up to SCHEDULES_PER_RUN quiet schedules into
+    Notifications. Returns (changes handled, notifications written).
+
+    Rows are claimed with SKIP LOCKED where the database supports it, so
+    several workers can run side by side.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = list(
+            ScheduleChange.objects.filter(processed_at__isnull=True)
+            .values('schedule_id')
+            .annotate(last=Max('created_at'))
+            .filter(last__lte=now - collapse_window())
+            .order_by('last')
+            .values_list('schedule_id', flat=True)[:SCHEDULES_PER_RUN]
+        )
+        if not due:
+            return 0, 0
+        changes = list(
+            ScheduleChange.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(processed_at__isnull=True, schedule_id__in=due)
+            .select_related('old_location', 'new_location')
+            .order_by('schedule_id', 'created_at', 'id')
+        )
+        groups = [list(group) for _, group in groupby(changes, key=lambda c: c.schedule_id)]
+
+        moved = [g for g in groups if all(c.kind == ScheduleChange.MOVED for c in g)]
+        live = Schedule.objects.select_related('fitness_class', 'location').in_bulk([g[0].schedule_id for g in moved])
+        recipients = _recipients(list(live))
+
+        notifications = []
+        for group in groups:
+            first, last = group[0], group[-1]
+            if last.kind == ScheduleChange.CANCELLED:
+                title = f"{last.class_name} cancelled"
+                message = (
+                    f"{last.class_name} on {_when(first.old_start)} at {first.old_location or 'its location'} "
+                    f"has been cancelled."
+                )
+                users = last.recipients
+            else:
+                schedule = live.get(first.schedule_id)
+                if schedule is None or (first.old_start, first.old_location_id) == (last.new_start, last.new_location_id):
+                    # Deleted without a record, or moved back where it was.
+                    continue
+                title = f"{schedule.fitness_class.name} rescheduled"
+                message = (
+                    f"{schedule.fitness_class.name} on {_when(first.old_start)} at {first.old_location or 'its location'} "
+                    f"is now on {_when(last.new_start)} at {last.new_location or schedule.location}."
+                )
+                users = recipients.get(schedule.pk, ())
+            notifications.extend(Notification(user_id=user, title=title, message=message) for user in sorted(users))
+
+        Notification.objects.bulk_create(notifications, batch_size=CHUNK_SIZE)
+        ScheduleChange.objects.filter(pk__in=[c.pk for c in changes]).update(processed_at=now)
+    return len(changes), len(notifications)
+
+
+def process_all(now=None):
+    """Run process() until nothing is due; returns the number of notifications written."""
+    total = 0
+    while True:
+        handled, written = process(now)
+        if not handled:
+            return total
+        total += written
@@ -0,0 +1,215 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+CURSOR_PARAM = 'cursor'
+PAGE_SIZE_PARAM = 'page_size'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size_from(request):
+    default = getattr(settings, 'LIST_PAGE_SIZE', 50)
+    maximum = getattr(settings, 'LIST_MAX_PAGE_SIZE', 500)
+    try:
+        size = int(request.GET.get(PAGE_SIZE_PARAM, default))
+    except ValueError:
+        return default
+    return max(1, min(size, maximum))
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Pages through a queryset by the values of its sort key instead of by
+    OFFSET, so page 1000 costs the same index seek as page 1 and rows
+    inserted meanwhile never shift a page boundary.
+
+    ``ordering`` must end in a unique column (normally the pk) and only
+    name non-null columns on the model itself, e.g. ('-booked_at', '-id').
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.keys = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+        self.fields = [queryset.model._meta.get_field(name) for name, _ in self.keys]
+
+    def page(self, cursor=None):
+        backwards, rows = self._rows(cursor)
+        return self._build(cursor, backwards, list(rows))
+
+    async def apage(self, cursor=None):
+        """page() for async views, fetching through the async ORM."""
+        backwards, rows = self._rows(cursor)
+        return self._build(cursor, backwards, [row async for row in rows])
+
+    def _rows(self, cursor):
+        """(backwards, unevaluated queryset of up to per_page + 1 rows) for ``cursor``."""
+        if not cursor:
+            return False, self.queryset.order_by(*self.ordering)[:self.per_page + 1]
+        backwards, values = self.decode(cursor)
+        ordering = self._reversed_ordering() if backwards else self.ordering
+        return backwards, self.queryset.filter(self._beyond(values, backwards)).order_by(*ordering)[:self.per_page + 1]
+
+    def _build(self, cursor, backwards, rows):
+        more = len(rows) > self.per_page
+        if not cursor:
+            return self._page(rows, more_after=more, more_before=False)
+        if backwards:
+            rows = rows[:self.per_page][::-1]
+            return self._page(rows, more_after=True, more_before=more, trimmed=True)
+        return self._page(rows, more_after=more, more_before=True)
+
+    def _page(self, rows, more_after, more_before, trimmed=False):
+        if not trimmed:
+            rows = rows[:self.per_page]
+        next_cursor = self.encode(rows[-1], backwards=False) if rows and more_after else None
+        previous_cursor = self.encode(rows[0], backwards=True) if rows and more_before else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def _reversed_ordering(self):
+        return tuple(name if desc else f'-{name}' for name, desc in self.keys)
+
+    def _beyond(self, values, backwards):
+        """Rows strictly after ``values`` in the page order: (a > x) OR (a = x AND b > y) ..."""
+        condition = Q()
+        for i, (name, desc) in enumerate(self.keys):
+            lookup = 'lt' if desc != backwards else 'gt'
+            ties = {n: v for (n, _), v in zip(self.keys[:i], values[:i])}
+            condition |= Q(**ties, **{f'{name}__{lookup}': values[i]})
+        return condition
+
+    def encode(self, obj, backwards):
+        if isinstance(obj, dict):
+            # Rows from values(), see serializers.ValuesProjection.
+            values = [self._to_string(obj[field.attname]) for field in self.fields]
+        else:
+            values = [field.value_to_string(obj) for field in self.fields]
+        raw = json.dumps({'b': backwards, 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _to_string(value):
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+    def decode(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values = [field.to_python(value) for field, value in zip(self.fields, data['v'])]
+            if len(values) != len(self.fields):
+                raise ValueError
+            return bool(data['b']), values
+        except Exception:
+            raise InvalidCursor(cursor)
+
+
+def paginate(request, queryset, ordering):
+    """Keyset-paginate ``queryset`` for a function view; 404 on a bad cursor."""
+    paginator = KeysetPaginator(queryset, ordering, page_size_from(request))
+    try:
+        page = paginator.page(request.GET.get(CURSOR_PARAM))
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+    return _link_pages(request, page)
+
+
+async def apaginate(request, queryset, ordering):
+    """paginate() for async views."""
+    paginator = KeysetPaginator(queryset, ordering, page_size_from(request))
+    try:
+        page = await paginator.apage(request.GET.get(CURSOR_PARAM))
+    except InvalidCursor:
+        raise Http404("Invalid page cursor.")
+    return _link_pages(request, page)
+
+
+def _link_pages(request, page):
+    url = request.get_full_path()
+    page.next_url = page.next_cursor and replace_query_param(url, CURSOR_PARAM, page.next_cursor)
+    page.previous_url = page.previous_cursor and replace_query_param(url, CURSOR_PARAM, page.previous_cursor)
+    page.first_url = remove_query_param(url, CURSOR_PARAM)
+    return page
+
+
+class KeysetPaginationMixin:
+    """ListView support: set ``keyset_ordering`` on the view."""
+    keyset_ordering = ('id',)
+
+    def get_paginate_by(self, queryset):
+        return page_size_from(self.request)
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate(self.request, queryset, self.keyset_ordering)
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination; viewsets set ``keyset_ordering`` like KeysetPaginationMixin."""
+    ordering = ('id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', self.ordering)
+        paginator = KeysetPaginator(queryset, ordering, page_size_from(request))
+        try:
+            self.page = paginator.page(request.query_params.get(CURSOR_PARAM))
+        except InvalidCursor:
+            raise NotFound("Invalid page cursor.")
+        self.request = request
+        return list(self.page.object_list)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), CURSOR_PARAM, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import notifications, stats
+from .models import Schedule, ScheduleSeries
+
+
+# Hard cap on one expansion so a typo in `until` can't create years of rows.
+MAX_OCCURRENCES = 366
+
+
+def occurrence_dates(series):
+    """
+    Yield the dates a series falls on, in order, before exceptions are
+    removed (as with RRULE/EXDATE, `count` counts generated dates).
+    """
+    first = timezone.localtime(series.start_time).date()
+    limit = min(series.count or MAX_OCCURRENCES, MAX_OCCURRENCES)
+    produced = 0
+
+    if series.frequency == ScheduleSeries.DAILY:
+        day = first
+        while produced < limit and (series.until is None or day <= series.until):
+            yield day
+            produced += 1
+            day += timedelta(days=series.interval)
+        return
+
+    weekdays = series.weekday_list() or [first.weekday()]
+    week = first - timedelta(days=first.weekday())
+    while produced < limit:
+        for weekday in weekdays:
+            day = week + timedelta(days=weekday)
+            if day < first:
+                continue
+            if series.until is not None and day > series.until:
+                return
+            yield day
+            produced += 1
+            if produced >= limit:
+                return
+        week += timedelta(weeks=series.interval)
+
+
+def expand(series):
+    """Build the unsaved Schedule rows for a series."""
+    local_start = timezone.localtime(series.start_time)
+    duration = series.fitness_class.duration
+    skip = series.exception_dates()
+    schedules = []
+    for day in occurrence_dates(series):
+        if day in skip:
+            continue
+        start = timezone.make_aware(datetime.combine(day, local_start.time()), local_start.tzinfo)
+        schedules.append(Schedule(
+            fitness_class_id=series.fitness_class_id,
+            trainer_id=series.trainer_id,
+            location_id=series.location_id,
+            start_time=start,
+            end_time=start + duration,
+            series=series,
+        ))
+    return schedules
+
+
+def find_conflicts(candidates, exclude=()):
+    """
+    Check a batch of new or moved schedules against each other and against
+    the stored timetable.
+
+    Fetches every stored entry for the batch's trainers and locations that
+    falls inside the batch's time window in one query, then sweeps each
+    trainer's and each location's entries in start order. Returns a list of
+    (candidate, other) pairs that overlap.
+    """
+    if not candidates:
+        return []
+    window_start = min(c.start_time for c in candidates)
+    window_end = max(c.end_time for c in candidates)
+    trainers = {c.trainer_id for c in candidates}
+    locations = {c.location_id for c in candidates}
+
+    stored = list(
+        Schedule.objects.filter(Q(trainer_id__in=trainers) | Q(location_id__in=locations))
+        .filter(start_time__lt=window_end, end_time__gt=window_start)
+        .exclude(pk__in=list(exclude))
+        .select_related('fitness_class')
+    )
+    new = {id(c) for c in candidates}
+
+    conflicts = {}
+    for resource in ('trainer_id', 'location_id'):
+        entries = sorted(stored + list(candidates), key=lambda s: (getattr(s, resource), s.start_time))
+        for _, group in groupby(entries, key=lambda s: getattr(s, resource)):
+            latest = None
+            for entry in group:
+                if latest is not None and entry.start_time < latest.end_time:
+                    if id(entry) in new:
+                        conflicts.setdefault((id(entry), id(latest)), (entry, latest))
+                    elif id(latest) in new:
+                        conflicts.setdefault((id(latest), id(entry)), (latest, entry))
+                if latest is None or entry.end_time > latest.end_time:
+                    latest = entry
+    return sorted(conflicts.values(), key=lambda pair: pair[0].start_time)
+
+
+def _raise_for_conflicts(conflicts):
+    if conflicts:
+        messages = [
+            f"{candidate.start_time.strftime('%Y-%m-%d %H:%M')} clashes with {other}"
+            for candidate, other in conflicts[:10]
+        ]
+        if len(conflicts) > 10:
+            messages.append(f"...and {len(conflicts) - 10} more.")
+        raise ValidationError(messages)
+
+
+def create_series(series):
+    """Save a series and insert all of its occurrences with one bulk_create."""
+    with transaction.atomic():
+        series.save()
+        schedules = expand(series)
+        _raise_for_conflicts(find_conflicts(schedules))
+        created = Schedule.objects.bulk_create(schedules)
+        stats.adjust_count(Schedule, len(created))
+        return created
+
+
+def _following(occurrence):
+    return Schedule.objects.filter(series_id=occurrence.series_id, start_time__gte=occurrence.start_time)
+
+
+def _truncate_before(series, occurrence):
+    """End ``series`` just before ``occurrence``; delete it if nothing is left."""
+    if not series.occurrences.filter(start_time__lt=occurrence.start_time).exists():
+        series.delete()
+        return None
+    series.until = timezone.localtime(occurrence.start_time).date() - timedelta(days=1)
+    series.count = None
+    series.save(update_fields=['until', 'count'])
+    return series
+
+
+def cancel_following(occurrence):
+    """Delete this occurrence and every later one in its series."""
+    with transaction.atomic():
+        series = ScheduleSeries.objects.select_for_update().get(pk=occurrence.series_id)
+        schedules = list(_following(occurrence).select_related('fitness_class'))
+        with notifications.cancelling(schedules):
+            deleted, _ = Schedule.objects.filter(pk__in=[s.pk for s in schedules]).delete()
+        _truncate_before(series, occurrence)
+    return deleted
+
+
+def update_following(occurrence, trainer=None, location=None, shift=None):
+    """
+    Change the trainer, the location and/or move by ``shift`` this
+    occurrence and every later one in its series.
+
+    The changed occurrences are split off into a new series, conflict
+    checked as one batch and written with a single bulk_update.
+    """
+    with transaction.atomic():
+        series = ScheduleSeries.objects.select_for_update().get(pk=occurrence.series_id)
+        schedules = list(_following(occurrence))
+        originals = [(s, s.start_time, s.location_id) for s in schedules]
+
+        for schedule in schedules:
+            if trainer is not None:
+                schedule.trainer = trainer
+            if location is not None:
+                schedule.location = location
+            if shift:
+                schedule.start_time += shift
+                schedule.end_time += shift
+        _raise_for_conflicts(find_conflicts(schedules, exclude=[s.pk for s in schedules]))
+
+        new_series = ScheduleSeries.objects.get(pk=series.pk)
+        new_series.pk = None
+        new_series.trainer_id = schedules[0].trainer_id
+        new_series.location_id = schedules[0].location_id
+        new_series.start_time = schedules[0].start_time
+        new_series.until = timezone.localtime(schedules[-1].start_time).date()
+        new_series.count = None
+        new_series.exceptions = [
+            d for d in series.exceptions
+            if d >= timezone.localtime(occurrence.start_time).date().isoformat()
+        ]
+        new_series.save()
+        for schedule in schedules:
+            schedule.series = new_series
+
+        Schedule.objects.bulk_update(schedules, ['series', 'trainer', 'location', 'start_time', 'end_time'])
+        notifications.record_moves(originals)
+        _truncate_before(series, occurrence)
+    return schedules
@@ -0,0 +1,133 @@
+"""
+Send the reads of list pages and safe API requests to read replicas.
+
+Reads go to a replica only inside ``replica_reads()``, which the
+read_from_replica decorator and ReplicaReadMixin open for GET/HEAD
+requests; it picks one replica at random for all of them, so a page reads
+a single consistent copy. Everything else, including all writes, uses the
+primary.
+
+Replicas lag, so a client that has just written reads its writes from the
+primary: ReplicaPinMiddleware answers every unsafe request with a short
+lived cookie that keeps the next requests (the redirect after a booking,
+say) off the replicas. A write inside a replica-read request also moves
+the rest of that request to the primary.
+
+Configured with DATABASE_REPLICAS, a list of database aliases, and
+REPLICA_PIN_SECONDS.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'primary_pin'
+
+# The replica alias reads go to, or None for the primary.
+_replica = ContextVar('replica', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+
+@contextmanager
+def replica_reads(request):
+    """Route reads to one replica for the duration, if ``request`` is safe and not pinned."""
+    aliases = replica_aliases()
+    allowed = bool(aliases) and request.method in SAFE_METHODS and not pinned(request)
+    token = _replica.set(random.choice(aliases) if allowed else None)
+    try:
+        yield allowed
+    finally:
+        _replica.reset(token)
+
+
+def _rendered(response):
+    # TemplateResponse and DRF's Response evaluate querysets while rendering,
+    # which would otherwise happen after the view has returned.
+    if getattr(response, 'is_rendered', True) is False:
+        response.render()
+    return response
+
+
+def read_from_replica(view):
+    """Function view decorator; put it outside @versioned so the version check reads the replica too."""
+    if iscoroutinefunction(view):
+        # The async ORM copies the context into its thread, so the router sees the flag.
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with replica_reads(request):
+                return _rendered(await view(request, *args, **kwargs))
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with replica_reads(request):
+            return _rendered(view(request, *args, **kwargs))
+    return wrapper
+
+
+class ReplicaReadMixin:
+    """For ListViews and viewsets: safe requests read from a replica."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(request):
+            return _rendered(super().dispatch(request, *args, **kwargs))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related objects come from wherever their parent did.
+            return instance._state.db
+        return _replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Read-your-writes for the rest of this request.
+        _replica.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Keep a client on the primary for REPLICA_PIN_SECONDS after each unsafe request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.pin(request, await self.get_response(request))
+
+    def pin(self, request, response):
+        if replica_aliases() and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
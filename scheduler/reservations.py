@@ -0,0 +1,190 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import SEAT_HOLDING_STATUSES, Booking, MemberProfile, Schedule
+
+
+class ReservationError(Exception):
+    """Base class for bookings that cannot be saved."""
+
+
+class ScheduleFull(ReservationError):
+    def __init__(self, message="This class is fully booked. No more spots are available."):
+        super().__init__(message)
+
+
+class AlreadyBooked(ReservationError):
+    def __init__(self, message="You are already registered for this class."):
+        super().__init__(message)
+
+
+def seats_taken(schedule, exclude=None):
+    """Seats held on ``schedule``, not counting the booking with pk ``exclude``."""
+    taken = schedule.seats_taken
+    if exclude is not None:
+        holds_seat = Booking.objects.filter(pk=exclude, schedule=schedule, status__in=SEAT_HOLDING_STATUSES)
+        if holds_seat.exists():
+            taken -= 1
+    return taken
+
+
+def save_booking(booking, waitlist=False):
+    """
+    Save a new or changed booking with the capacity check and the write in a
+    single transaction.
+
+    The target schedule row is locked first (SELECT ... FOR UPDATE on
+    PostgreSQL, an IMMEDIATE write transaction on SQLite) and its seat
+    counters are read from the locked row, so concurrent reservations for the
+    same schedule queue up behind each other instead of all passing the
+    capacity check and overbooking. Other schedules are not blocked. A
+    booking moving between classes changes the counters of the one it leaves
+    too, so both rows are locked up front, in pk order like book_batch(), and
+    two opposite moves can't deadlock on each other.
+
+    With ``waitlist=True`` a new booking for a full class is put at the back
+    of the schedule's waitlist instead of being rejected.
+    """
+    with transaction.atomic():
+        if hasattr(booking, '_counted') or booking.pk is None:
+            previous = getattr(booking, '_counted', (booking.schedule_id,))[0]
+        else:
+            previous = Booking.objects.filter(pk=booking.pk).values_list('schedule_id', flat=True).first()
+        locked = (
+            Schedule.objects.select_for_update(of=('self',))
+            .select_related('fitness_class')
+            .filter(pk__in={booking.schedule_id, previous or booking.schedule_id})
+            .order_by('pk')
+        )
+        schedule = next((s for s in locked if s.pk == booking.schedule_id), None)
+        if schedule is None:
+            raise Schedule.DoesNotExist("Schedule matching query does not exist.")
+        duplicates = Booking.objects.filter(member_id=booking.member_id, schedule=schedule)
+        if duplicates.exclude(pk=booking.pk).exists():
+            raise AlreadyBooked()
+        if booking.status in SEAT_HOLDING_STATUSES:
+            if seats_taken(schedule, exclude=booking.pk) >= schedule.fitness_class.capacity:
+                if not waitlist or booking.pk:
+                    raise ScheduleFull()
+                booking.status = 'waitlisted'
+
+        moved = previous is not None and previous != schedule.pk
+        if booking.status != 'waitlisted':
+            booking.waitlist_position = None
+        elif booking.waitlist_position is None or moved:
+            booking.waitlist_position = schedule.waitlist_tail + 1
+            Schedule.objects.filter(pk=schedule.pk).update(waitlist_tail=F('waitlist_tail') + 1)
+        try:
+            with transaction.atomic():
+                booking.save()
+        except IntegrityError:
+            raise AlreadyBooked()
+    return booking
+
+
+def reserve(member, schedule, status='booked', waitlist=True):
+    return save_booking(Booking(member=member, schedule=schedule, status=status), waitlist=waitlist)
+
+
+def waitlist_place(booking):
+    """1-based place of a waitlisted booking in its schedule's queue."""
+    if booking.status != 'waitlisted':
+        return None
+    ahead = Booking.objects.filter(
+        schedule_id=booking.schedule_id,
+        status='waitlisted',
+        waitlist_position__lt=booking.waitlist_position,
+    )
+    return ahead.count() + 1
+
+
+# Largest number of operations accepted by book_batch().
+MAX_BATCH_SIZE = 500
+
+
+def book_batch(creates=(), cancels=()):
+    """
+    Apply many bookings and cancellations in one transaction.
+
+    ``creates`` is a list of (member_id, schedule_id) pairs and ``cancels`` a
+    list of booking ids. Everything is validated with a handful of set-based
+    queries, cancellations are written with one bulk_update (which also
+    promotes waitlists) and new bookings with one bulk_create; a class that
+    runs out of seats puts the rest on its waitlist, as a single booking
+    would. Returns one result dict per create and per cancel, in input order.
+    """
+    create_results = [{'member': m, 'schedule': s} for m, s in creates]
+    cancel_results = [{'id': pk} for pk in cancels]
+
+    cancel_ids = list(set(cancels))
+    with transaction.atomic():
+        # Lock the schedules first, in pk order so two batches can't deadlock
+        # on each other, then read the bookings to cancel under those locks;
+        # read before them, a concurrent cancel could slip in between.
+        schedule_ids = {s for _, s in creates}
+        schedule_ids.update(Booking.objects.filter(pk__in=cancel_ids).values_list('schedule_id', flat=True))
+        while True:
+            locked = Schedule.objects.select_for_update().filter(pk__in=schedule_ids).order_by('pk')
+            list(locked.values_list('pk', flat=True))
+            to_cancel = Booking.objects.select_for_update().in_bulk(cancel_ids)
+            moved = {b.schedule_id for b in to_cancel.values()} - schedule_ids
+            if not moved:
+                break
+            # Moved to another class meanwhile; lock that one too.
+            schedule_ids |= moved
+
+        cancelled = []
+        seen = set()
+        for result in cancel_results:
+            booking = to_cancel.get(result['id'])
+            if booking is None:
+                result.update(result='error', error="Booking not found.")
+            elif booking.status == 'cancelled' or booking.pk in seen:
+                result.update(result='error', error="Booking is already cancelled.")
+            else:
+                booking.status = 'cancelled'
+                booking.waitlist_position = None
+                cancelled.append(booking)
+                seen.add(booking.pk)
+                result.update(result='cancelled')
+        if cancelled:
+            Booking.objects.bulk_update(cancelled, ['status', 'waitlist_position'])
+
+        # Seats as they stand after the cancellations and any promotions.
+        schedules = Schedule.objects.select_related('fitness_class').in_bulk(list(schedule_ids))
+        members = set(MemberProfile.objects.filter(pk__in={m for m, _ in creates}).values_list('pk', flat=True))
+        taken = set(
+            Booking.objects.filter(schedule_id__in=schedule_ids, member_id__in=members)
+            .values_list('member_id', 'schedule_id')
+        )
+        free = {pk: s.seats_left for pk, s in schedules.items()}
+        tails = {pk: s.waitlist_tail for pk, s in schedules.items()}
+
+        new = []
+        for result in create_results:
+            pair = (result['member'], result['schedule'])
+            if pair[1] not in schedules:
+                result.update(result='error', error="Schedule not found.")
+            elif pair[0] not in members:
+                result.update(result='error', error="Member not found.")
+            elif pair in taken:
+                result.update(result='error', error=str(AlreadyBooked()))
+            else:
+                booking = Booking(member_id=pair[0], schedule_id=pair[1])
+                if free[pair[1]] > 0:
+                    free[pair[1]] -= 1
+                else:
+                    tails[pair[1]] += 1
+                    booking.status = 'waitlisted'
+                    booking.waitlist_position = tails[pair[1]]
+                taken.add(pair)
+                new.append((result, booking))
+
+        Booking.objects.bulk_create([booking for _, booking in new])
+        for pk, tail in tails.items():
+            if tail != schedules[pk].waitlist_tail:
+                Schedule.objects.filter(pk=pk).update(waitlist_tail=tail)
+        for result, booking in new:
+            result.update(result=booking.status, id=booking.pk)
+
+    return create_results, cancel_results
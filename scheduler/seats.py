@@ -0,0 +1,216 @@
+"""
+Live seat availability for the server-sent events stream in views_async.py.
+
+Booking writes report the schedules whose seat counters they moved with
+changed(). After the transaction commits, the configured backend carries the
+schedule ids to the Hub of every process serving streams. A hub reads the
+current seats of the schedules its subscribers watch, in one query, and
+hands each subscriber its share.
+
+A subscriber keeps only the latest state per schedule until its stream
+sends it. A slow client therefore costs at most one pending update per
+watched schedule, however many bookings arrive meanwhile.
+
+Configured with the SEAT_STREAM setting; see DEFAULTS.
+"""
+import asyncio
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Carries changes to the streams: LocalBackend within one process,
+    # PostgresBackend across several.
+    'BACKEND': 'scheduler.seats.LocalBackend',
+    # Most schedules one stream may watch.
+    'MAX_SCHEDULES': 50,
+    # Comment line sent when nothing changed for this long, so proxies keep the connection open.
+    'KEEPALIVE_SECONDS': 15,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'SEAT_STREAM', {})}
+
+
+def snapshots(schedule_ids):
+    """{schedule id: seats event} for ``schedule_ids``; schedules that are gone come back cancelled."""
+    Schedule = apps.get_model('scheduler', 'Schedule')
+    # The primary: this runs right after the write that prompted it.
+    schedules = (
+        Schedule.objects.using(DEFAULT_DB_ALIAS)
+        .filter(pk__in=schedule_ids)
+        .select_related('fitness_class')
+        .only('booked_count', 'attended_count', 'no_show_count', 'waitlist_count', 'fitness_class__capacity')
+    )
+    events = {pk: {'schedule': pk, 'status': 'cancelled'} for pk in schedule_ids}
+    for schedule in schedules:
+        events[schedule.pk] = {
+            'schedule': schedule.pk,
+            'status': 'open' if schedule.seats_left else 'full',
+            'capacity': schedule.fitness_class.capacity,
+            'seats_taken': schedule.seats_taken,
+            'seats_left': schedule.seats_left,
+            'waitlist_count': schedule.waitlist_count,
+        }
+    return events
+
+
+class Subscriber:
+    """One stream: the schedules it watches and the latest unsent state of each."""
+
+    def __init__(self, schedule_ids):
+        self.schedule_ids = frozenset(schedule_ids)
+        self.loop = asyncio.get_running_loop()
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, events):
+        # Runs on the subscriber's event loop; newer state replaces older.
+        self.pending.update(events)
+        self.ready.set()
+
+    async def updates(self, timeout):
+        """The pending events, waiting up to ``timeout`` seconds for some; [] on timeout."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        events, self.pending = list(self.pending.values()), {}
+        return events
+
+
+class Hub:
+    """This process's subscribers, indexed by the schedules they watch."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watchers = {}
+        self._listeners = {}
+
+    def watching(self):
+        return bool(self._watchers)
+
+    def subscribe(self, schedule_ids):
+        """Register a stream; call from its event loop and unsubscribe() when it ends."""
+        subscriber = Subscriber(schedule_ids)
+        with self._lock:
+            for pk in subscriber.schedule_ids:
+                self._watchers.setdefault(pk, set()).add(subscriber)
+        self._listen(subscriber.loop)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for pk in subscriber.schedule_ids:
+                watchers = self._watchers.get(pk)
+                if watchers is not None:
+                    watchers.discard(subscriber)
+                    if not watchers:
+                        del self._watchers[pk]
+
+    def deliver(self, schedule_ids):
+        """Send the current seats of ``schedule_ids`` to the streams watching them. Safe from any thread."""
+        with self._lock:
+            watched = {pk: list(self._watchers[pk]) for pk in set(schedule_ids) if pk in self._watchers}
+        if not watched:
+            return
+        events = snapshots(list(watched))
+        shares = {}
+        for pk, subscribers in watched.items():
+            for subscriber in subscribers:
+                shares.setdefault(subscriber, {})[pk] = events[pk]
+        for subscriber, share in shares.items():
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.push, share)
+            except RuntimeError:
+                # Its loop has closed; the stream is gone.
+                pass
+
+    def _listen(self, loop):
+        # Backends that receive from other processes listen once per event loop.
+        listen = getattr(backend(), 'listen', None)
+        if listen is None:
+            return
+        task = self._listeners.get(loop)
+        if task is None or task.done():
+            self._listeners[loop] = loop.create_task(listen(self))
+
+
+hub = Hub()
+
+
+class LocalBackend:
+    """Delivers to the streams of this process only: runserver, tests, or a single ASGI worker."""
+
+    def publish(self, schedule_ids):
+        if hub.watching():
+            hub.deliver(list(schedule_ids))
+
+
+class PostgresBackend:
+    """
+    For several worker processes: publish() sends the schedule ids with
+    NOTIFY, and each process serving streams keeps one LISTEN connection that
+    passes them to its hub.
+    """
+    channel = 'seat_changes'
+    # NOTIFY payloads must stay under 8000 bytes.
+    ids_per_notify = 500
+    retry_seconds = 5
+
+    def publish(self, schedule_ids):
+        schedule_ids = sorted(set(schedule_ids))
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            for start in range(0, len(schedule_ids), self.ids_per_notify):
+                payload = ','.join(map(str, schedule_ids[start:start + self.ids_per_notify]))
+                cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    async def listen(self, hub):
+        import psycopg
+
+        database = connections[DEFAULT_DB_ALIAS].settings_dict
+        conninfo = psycopg.conninfo.make_conninfo(**{
+            key: value for key, value in {
+                'dbname': database['NAME'], 'user': database['USER'], 'password': database['PASSWORD'],
+                'host': database['HOST'], 'port': database['PORT'],
+            }.items() if value
+        })
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+                    await conn.execute(f'LISTEN {self.channel}')
+                    async for notify in conn.notifies():
+                        schedule_ids = [int(pk) for pk in notify.payload.split(',') if pk]
+                        await sync_to_async(hub.deliver)(schedule_ids)
+            except Exception:
+                logger.exception("Seat stream listener failed; reconnecting in %ss", self.retry_seconds)
+                await asyncio.sleep(self.retry_seconds)
+
+
+_backend = None
+
+
+def backend():
+    global _backend
+    path = config()['BACKEND']
+    if _backend is None or _backend[0] != path:
+        _backend = (path, import_string(path)())
+    return _backend[1]
+
+
+def changed(schedule_ids):
+    """
+    Report that the seat counters of ``schedule_ids`` (an iterable or a
+    values_list queryset of pks) moved; streams hear of it after commit.
+    """
+    transaction.on_commit(lambda: backend().publish(schedule_ids))
@@ -1,5 +1,8 @@
+from copy import copy
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import MemberProfile, TrainerProfile, FitnessClass, Booking, Schedule
+from .models import MemberProfile, TrainerProfile, FitnessClass, Booking, Schedule, Notification
+from .reservations import MAX_BATCH_SIZE
 
 class MemberSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.username', read_only=True)
@@ -24,7 +27,7 @@ class FitnessClassSerializer(serializers.ModelSerializer):
 
 class BookingSerializer(serializers.ModelSerializer):
     member_name = serializers.CharField(source='member.user.username', read_only=True)
-    fitness_class_name = serializers.CharField(source='fitness_class.name', read_only=True)
+    fitness_class_name = serializers.CharField(source='schedule.fitness_class.name', read_only=True)
 
     class Meta:
         model = Booking
@@ -37,3 +40,99 @@ class ScheduleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Schedule
         fields = '__all__'
+
+    def validate(self, attrs):
+        # Run the same trainer/location overlap checks as ScheduleForm.
+        schedule = copy(self.instance) if self.instance else Schedule()
+        for attr, value in attrs.items():
+            setattr(schedule, attr, value)
+        try:
+            schedule.clean()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
+        return attrs
+
+    def save(self, **kwargs):
+        # A clash that raced past validate() is reported by Schedule.save().
+        try:
+            return super().save(**kwargs)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Notification
+        fields = ('id', 'title', 'message', 'is_read', 'created_at')
+        read_only_fields = fields
+
+
+class BookingBatchCreateSerializer(serializers.Serializer):
+    member = serializers.IntegerField()
+    schedule = serializers.IntegerField()
+
+
+class BookingBatchSerializer(serializers.Serializer):
+    """Payload for BookingViewSet.batch; ids are checked in bulk by book_batch()."""
+    create = BookingBatchCreateSerializer(many=True, required=False, default=list)
+    cancel = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate(self, attrs):
+        if len(attrs['create']) + len(attrs['cancel']) > MAX_BATCH_SIZE:
+            raise serializers.ValidationError(f"At most {MAX_BATCH_SIZE} operations per batch.")
+        return attrs
+
+
+# Field types whose to_representation() returns database values unchanged.
+_PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+    serializers.BooleanField, serializers.RelatedField,
+)
+
+
+class ValuesProjection:
+    """
+    Read-only fast path for a ModelSerializer: fetch exactly the serializer's
+    columns with values(), letting SQL do the joins behind dotted sources, and
+    build plain dicts in the serializer's field order. Output matches
+    serializer(instance).data for the read-only field types used here.
+    """
+
+    _cache = {}
+
+    def __init__(self, serializer_class):
+        model = serializer_class.Meta.model
+        self.columns = []
+        for name, field in serializer_class().fields.items():
+            path = field.source.replace('.', '__')
+            if '__' not in path and model._meta.get_field(path).is_relation:
+                path = model._meta.get_field(path).attname
+            convert = None if isinstance(field, _PASSTHROUGH_FIELDS) else field.to_representation
+            # DRF leaves a dotted field out when a link on the way is null.
+            omit_if_null = '__' in path
+            self.columns.append((name, path, convert, omit_if_null))
+        self.paths = [path for _, path, _, _ in self.columns]
+
+    @classmethod
+    def for_serializer(cls, serializer_class):
+        if serializer_class not in cls._cache:
+            cls._cache[serializer_class] = cls(serializer_class)
+        return cls._cache[serializer_class]
+
+    def values(self, queryset):
+        return queryset.values(*self.paths)
+
+    def render(self, rows):
+        data = []
+        for row in rows:
+            item = {}
+            for name, path, convert, omit_if_null in self.columns:
+                value = row[path]
+                if value is None:
+                    if omit_if_null:
+                        continue
+                elif convert is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+        return data
@@ -0,0 +1,265 @@
+from collections import Counter
+
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    SEAT_HOLDING_STATUSES, Booking, FitnessClass, Location, Notification, Schedule, User, WorkoutLog, adjust_unread,
+    recount_unread,
+)
+from . import access, analytics, notifications, seats, stats, versions
+
+
+# SEAT COUNTERS
+
+@receiver(pre_save, sender=Booking)
+def booking_saving(sender, instance, using=None, **kwargs):
+    if instance.pk is None or hasattr(instance, '_rolled_up'):
+        return
+    # Loaded with fields deferred, or built by hand: read what the counters
+    # and rollups include for the row now, so post_save can apply deltas.
+    row = Booking.objects.using(using).filter(pk=instance.pk).values_list('schedule_id', 'member_id', 'status').first()
+    if row is not None:
+        instance._counted = (row[0], row[2])
+        instance._rolled_up = row
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created, **kwargs):
+    current = (instance.schedule_id, instance.status)
+    previous = None if created else getattr(instance, '_counted', None)
+
+    if created or previous is not None:
+        deltas = Counter({current: 1})
+        if previous is not None:
+            deltas[previous] -= 1
+        Schedule.objects.adjust_seat_counts(deltas)
+    else:
+        # The row turned up after booking_saving() looked, so the old values are unknown.
+        Schedule.objects.filter(pk=instance.schedule_id).recount_seats()
+    instance._counted = current
+
+    if previous is not None and previous[1] in SEAT_HOLDING_STATUSES and previous != current:
+        if current[1] not in SEAT_HOLDING_STATUSES or current[0] != previous[0]:
+            Schedule.objects.filter(pk=previous[0]).promote_waitlists()
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Schedule) or getattr(origin, 'model', None) is Schedule:
+        # The schedule itself is going; nothing left to count or promote.
+        return
+    counted = getattr(instance, '_counted', None) or (instance.schedule_id, instance.status)
+    Schedule.objects.adjust_seat_counts({counted: -1})
+    if counted[1] in SEAT_HOLDING_STATUSES:
+        Schedule.objects.filter(pk=counted[0]).promote_waitlists()
+
+
+# ATTENDANCE ROLLUPS
+
+@receiver(post_save, sender=Booking)
+def booking_rolled_up(sender, instance, created, **kwargs):
+    current = (instance.schedule_id, instance.member_id, instance.status)
+    previous = None if created else getattr(instance, '_rolled_up', None)
+    if previous != current:
+        deltas = Counter({current: 1})
+        if previous is not None:
+            deltas[previous] -= 1
+        analytics.record_bookings(deltas)
+    instance._rolled_up = current
+
+
+@receiver(post_delete, sender=Booking)
+def booking_unrolled(sender, instance, **kwargs):
+    analytics.booking_deleted(instance)
+
+
+@receiver(pre_delete, sender=Schedule)
+def schedule_unrolling(sender, instance, **kwargs):
+    analytics.schedule_deleting(instance)
+
+
+@receiver(post_delete, sender=Schedule)
+def schedule_unrolled(sender, instance, **kwargs):
+    analytics.schedule_deleted(instance)
+
+
+@receiver(pre_save, sender=WorkoutLog)
+def workout_saving(sender, instance, using=None, **kwargs):
+    if instance.pk is None or hasattr(instance, '_rolled_up'):
+        return
+    # As booking_saving().
+    row = WorkoutLog.objects.using(using).filter(pk=instance.pk).values_list('member_id', 'date').first()
+    if row is not None:
+        instance._rolled_up = row
+
+
+@receiver(post_save, sender=WorkoutLog)
+def workout_rolled_up(sender, instance, created, **kwargs):
+    current = (instance.member_id, instance.date)
+    previous = None if created else getattr(instance, '_rolled_up', None)
+    if previous != current:
+        deltas = Counter({current: 1})
+        if previous is not None:
+            deltas[previous] -= 1
+        analytics.record_workouts(deltas)
+    instance._rolled_up = current
+
+
+@receiver(post_delete, sender=WorkoutLog)
+def workout_unrolled(sender, instance, **kwargs):
+    analytics.record_workouts({getattr(instance, '_rolled_up', None) or (instance.member_id, instance.date): -1})
+
+
+# TIMETABLES AND CHANGE NOTIFICATIONS
+
+@receiver(post_save, sender=Schedule)
+def schedule_saved(sender, instance, created, **kwargs):
+    original = getattr(instance, '_original', {})
+    locations = {instance.location_id, original.get('location_id')} - {None}
+    Location.objects.filter(pk__in=locations).bump_timetable()
+
+    if not created and original.get('start_time') is not None and original.get('location_id') is not None:
+        notifications.record_moves([(instance, original['start_time'], original['location_id'])])
+    if not created and any(
+        original.get(name) not in (None, getattr(instance, name)) for name in Schedule.TRACKED_FIELDS
+    ):
+        # Its bookings now count towards other attendance rollup rows.
+        analytics.record_regrouping({instance.pk: analytics.rollup_keys(**{
+            name: original.get(name) or getattr(instance, name) for name in Schedule.TRACKED_FIELDS
+        })})
+    instance._original = {name: getattr(instance, name) for name in Schedule.TRACKED_FIELDS}
+
+
+@receiver(pre_delete, sender=Schedule)
+def schedule_deleting(sender, instance, **kwargs):
+    # Before the cascade removes the bookings we need for the recipients.
+    notifications.record_cancellation(instance)
+
+
+@receiver(post_delete, sender=Schedule)
+def schedule_deleted(sender, instance, **kwargs):
+    Location.objects.filter(pk=instance.location_id).bump_timetable()
+    # Streams watching it hear that it is cancelled.
+    seats.changed([instance.pk])
+
+
+def _timetables_showing(schedules):
+    return Location.objects.filter(pk__in=schedules.values('location_id'))
+
+
+@receiver(post_save, sender=FitnessClass)
+def fitness_class_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Its name and capacity are on the timetable of every location it is scheduled at.
+    if not created and (update_fields is None or {'name', 'capacity'} & set(update_fields)):
+        _timetables_showing(Schedule.objects.filter(fitness_class=instance)).bump_timetable()
+
+
+@receiver(post_save, sender=User)
+def trainer_renamed(sender, instance, created, update_fields=None, **kwargs):
+    # As is the name of the trainer teaching it.
+    if not created and (update_fields is None or {'first_name', 'last_name'} & set(update_fields)):
+        _timetables_showing(Schedule.objects.filter(trainer__user=instance)).bump_timetable()
+
+
+# UNREAD NOTIFICATION COUNTS
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_counted', None)
+    if not created and previous is None:
+        # Loaded with user/is_read deferred, so the old values are unknown.
+        recount_unread([instance.user_id])
+    else:
+        deltas = Counter()
+        if not instance.is_read:
+            deltas[instance.user_id] += 1
+        if previous is not None and not previous[1]:
+            deltas[previous[0]] -= 1
+        adjust_unread(deltas)
+    instance._counted = (instance.user_id, instance.is_read)
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    user_id, is_read = getattr(instance, '_counted', None) or (instance.user_id, instance.is_read)
+    if not is_read:
+        adjust_unread({user_id: -1})
+
+
+# DASHBOARD COUNTS
+
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.adjust_count(sender, 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    stats.adjust_count(sender, -1)
+
+
+for label in stats.DASHBOARD_COUNTS.values():
+    post_save.connect(count_created, sender=label, dispatch_uid=f'dashboard-created-{label}')
+    post_delete.connect(count_deleted, sender=label, dispatch_uid=f'dashboard-deleted-{label}')
+
+
+# LIST VERSIONS
+
+def bump_version(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        # Logging in changes nothing any list shows.
+        return
+    versions.bump_for(sender, using=kwargs.get('using'))
+
+
+for label in versions.COLLECTIONS:
+    post_save.connect(bump_version, sender=label, dispatch_uid=f'version-saved-{label}')
+    post_delete.connect(bump_version, sender=label, dispatch_uid=f'version-deleted-{label}')
+
+
+# ACCESS
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login', 'unread_notifications'}:
+        return
+    instance.__dict__.pop('_access', None)
+    access.invalidate([instance.pk])
+
+
+def profile_changed(sender, instance, **kwargs):
+    access.invalidate([instance.user_id])
+
+
+for label in ('scheduler.TrainerProfile', 'scheduler.MemberProfile'):
+    post_save.connect(profile_changed, sender=label, dispatch_uid=f'access-saved-{label}')
+    post_delete.connect(profile_changed, sender=label, dispatch_uid=f'access-deleted-{label}')
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def user_grants_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # From the permission's or group's side; pk_set is users, or None on clear().
+        access.invalidate_all()
+    else:
+        instance.__dict__.pop('_access', None)
+        access.invalidate([instance.pk])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        access.invalidate_all()
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def grant_deleted(sender, **kwargs):
+    access.invalidate_all()
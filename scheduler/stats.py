@@ -0,0 +1,99 @@
+from django.apps import apps
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+from . import caching
+
+
+# Dashboard counter -> model it counts.
+DASHBOARD_COUNTS = {
+    'trainer_count': 'scheduler.TrainerProfile',
+    'member_count': 'scheduler.MemberProfile',
+    'class_count': 'scheduler.FitnessClass',
+    'location_count': 'scheduler.Location',
+    'schedule_count': 'scheduler.Schedule',
+    'booking_count': 'scheduler.Booking',
+    'workoutlog_count': 'scheduler.WorkoutLog',
+}
+
+CACHE_PREFIX = 'dashboard:'
+# Backstop for writes that bypass the signals (raw SQL); signals keep the
+# numbers exact in between.
+CACHE_TIMEOUT = 60 * 15
+# A per-process cache (see caching.py) only sees this process's writes, so
+# there the counts are recounted this often instead.
+LOCAL_CACHE_TIMEOUT = 30
+
+# Moved by every committed write to the counters. A recount that sees it
+# move while counting may have missed an increment, so it drops its numbers.
+GENERATION_KEY = CACHE_PREFIX + 'generation'
+
+_COUNTER_FOR_LABEL = {label: name for name, label in DASHBOARD_COUNTS.items()}
+
+
+def _key(name):
+    return CACHE_PREFIX + name
+
+
+def dashboard_counts():
+    """Row counts for the home page, from the cache or one SQL round-trip."""
+    keys = {name: _key(name) for name in DASHBOARD_COUNTS}
+    cached = cache.get_many(keys.values())
+    if len(cached) == len(keys):
+        return {name: cached[key] for name, key in keys.items()}
+
+    generation = cache.get(GENERATION_KEY)
+    counts = _count_all()
+    timeout = CACHE_TIMEOUT if caching.is_shared() else LOCAL_CACHE_TIMEOUT
+    for name, value in counts.items():
+        # add(), not set(): a counter another request has put back since
+        # already carries the increments that came after its count.
+        cache.add(keys[name], value, timeout)
+    if cache.get(GENERATION_KEY) != generation:
+        # A write committed while we counted; its increment may have found
+        # no key to move and be missing from what we just added.
+        cache.delete_many(keys.values())
+    return counts
+
+
+def _count_all():
+    # On the primary: the counters are moved by writes as they commit there,
+    # so a replica lagging behind would cache numbers they never catch up on.
+    models = [apps.get_model(label) for label in DASHBOARD_COUNTS.values()]
+    connection = connections[DEFAULT_DB_ALIAS]
+    qn = connection.ops.quote_name
+    subqueries = ', '.join(f'(SELECT COUNT(*) FROM {qn(model._meta.db_table)})' for model in models)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {subqueries}')
+        row = cursor.fetchone()
+    return dict(zip(DASHBOARD_COUNTS, row))
+
+
+def adjust_count(model, delta):
+    """Shift a cached dashboard counter once the current transaction commits."""
+    name = _COUNTER_FOR_LABEL.get(model._meta.label)
+    if name is None or not delta:
+        return
+
+    def apply():
+        # Before the increment, so a recount running now notices either.
+        _next_generation()
+        try:
+            cache.incr(_key(name), delta)
+        except ValueError:
+            # Not cached; the next dashboard_counts() call recounts.
+            pass
+
+    transaction.on_commit(apply, using=router.db_for_write(model))
+
+
+def _next_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, None)
+
+
+def invalidate():
+    _next_generation()
+    cache.delete_many([_key(name) for name in DASHBOARD_COUNTS])
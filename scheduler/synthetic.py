@@ -0,0 +1,157 @@
+"""
+A synthetic gym for load testing: bulk-inserted members, trainers, classes,
+locations, a timetable of non-overlapping schedules around today, and
+bookings in every status. See the seed_gym and bench_endpoints commands.
+"""
+import random
+import time
+import uuid
+from datetime import datetime, time as dtime, timedelta
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import transaction
+from django.utils import timezone
+
+from . import stats, versions
+from .models import (
+    User, TrainerProfile, MemberProfile, WorkoutType, Location,
+    FitnessClass, Schedule, Booking, WorkoutLog
+)
+
+
+SCALES = {
+    'tiny': dict(members=200, trainers=10, locations=4, schedules=400, bookings=4000),
+    'small': dict(members=2000, trainers=40, locations=10, schedules=4000, bookings=60000),
+    'medium': dict(members=10000, trainers=150, locations=30, schedules=40000, bookings=800000),
+    'full': dict(members=50000, trainers=500, locations=100, schedules=200000, bookings=5000000),
+}
+
+# Classes run on the hour from OPENING_HOUR, SLOTS_PER_DAY times a day.
+OPENING_HOUR = 6
+SLOTS_PER_DAY = 16
+CLASSES_PER_TRAINER = 2
+
+
+def _bulk_users(prefix, count, role, batch_size):
+    users = (
+        User(username=f'{prefix}{i}', first_name=prefix.split('-')[-1].title(), last_name=str(i),
+             password=UNUSABLE_PASSWORD_PREFIX + 'synthetic', role=role)
+        for i in range(count)
+    )
+    _insert(User, users, batch_size)
+    return list(User.objects.filter(username__startswith=prefix).order_by('pk').values_list('pk', flat=True))
+
+
+def _insert(model, objs, batch_size):
+    """bulk_create a generator in fixed-size batches, one transaction each."""
+    objs = iter(objs)
+    while True:
+        batch = [obj for _, obj in zip(range(batch_size), objs)]
+        if not batch:
+            return
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+
+
+def populate(members, trainers, locations, schedules, bookings, batch_size=2000, seed=0, log=None):
+    """
+    Insert a synthetic gym of the given size next to any existing data and
+    return the row counts actually written.
+
+    Every slot runs min(locations, trainers) classes at once, each in its
+    own location with its own trainer, so the timetable honours the overlap
+    rules. Past classes get attended/no-show/cancelled bookings, future ones
+    booked/cancelled and a waitlist once they are full.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    run = uuid.uuid4().hex[:6]
+    started = time.monotonic()
+
+    def step(message):
+        log(f"[{time.monotonic() - started:7.1f}s] {message}")
+
+    member_users = _bulk_users(f'gym{run}-member', members, User.MEMBER, batch_size)
+    trainer_users = _bulk_users(f'gym{run}-trainer', trainers, User.TRAINER, batch_size)
+    _insert(MemberProfile, (MemberProfile(user_id=pk) for pk in member_users), batch_size)
+    _insert(TrainerProfile, (TrainerProfile(user_id=pk, specialization='Strength') for pk in trainer_users), batch_size)
+    member_ids = list(MemberProfile.objects.filter(user_id__in=member_users).order_by('pk').values_list('pk', flat=True))
+    trainer_ids = list(TrainerProfile.objects.filter(user_id__in=trainer_users).order_by('pk').values_list('pk', flat=True))
+    step(f"{members} members, {trainers} trainers")
+
+    workout_type, _ = WorkoutType.objects.get_or_create(name='Synthetic')
+    Location.objects.bulk_create(
+        Location(name=f'Gym {run} room {i}', capacity=rng.randint(15, 40)) for i in range(locations))
+    location_ids = list(Location.objects.filter(name__startswith=f'Gym {run} ').order_by('pk').values_list('pk', flat=True))
+    FitnessClass.objects.bulk_create(
+        FitnessClass(name=f'Class {run}-{i}', workout_type=workout_type, trainer_id=trainer_ids[i // CLASSES_PER_TRAINER],
+                     duration=timedelta(minutes=rng.choice([45, 60])), capacity=rng.randint(15, 30))
+        for i in range(trainers * CLASSES_PER_TRAINER)
+    )
+    classes = list(FitnessClass.objects.filter(name__startswith=f'Class {run}-').order_by('pk'))
+    step(f"{locations} locations, {len(classes)} classes")
+
+    lanes = min(locations, trainers)
+    days = -(-schedules // (lanes * SLOTS_PER_DAY))
+    first_day = timezone.localdate() - timedelta(days=days // 2)
+    now = timezone.now()
+    per_schedule = bookings / schedules if schedules else 0
+    written = 0
+
+    for chunk_start in range(0, schedules, batch_size):
+        planned = []
+        for i in range(chunk_start, min(chunk_start + batch_size, schedules)):
+            slot, lane = divmod(i, lanes)
+            day, hour = divmod(slot, SLOTS_PER_DAY)
+            trainer = (lane + slot) % trainers
+            fitness_class = classes[trainer * CLASSES_PER_TRAINER + slot % CLASSES_PER_TRAINER]
+            start = timezone.make_aware(datetime.combine(first_day + timedelta(days=day), dtime(OPENING_HOUR + hour)))
+            schedule = Schedule(
+                fitness_class=fitness_class, trainer_id=trainer_ids[trainer], location_id=location_ids[lane],
+                start_time=start, end_time=start + fitness_class.duration,
+            )
+            planned.append((schedule, _plan_bookings(rng, schedule, fitness_class.capacity, per_schedule,
+                                                     len(member_ids), past=start < now)))
+
+        with transaction.atomic():
+            created = Schedule.objects.bulk_create([schedule for schedule, _ in planned])
+            new_bookings = [
+                Booking(member_id=member_ids[member], schedule_id=schedule.pk, status=status, waitlist_position=position)
+                for schedule, plan in zip(created, (plan for _, plan in planned))
+                for member, status, position in plan
+            ]
+            # ignore_conflicts makes BookingQuerySet recount these schedules in one statement.
+            Booking.objects.bulk_create(new_bookings, batch_size=batch_size, ignore_conflicts=True)
+        written += len(new_bookings)
+        step(f"{chunk_start + len(planned)}/{schedules} schedules, {written} bookings")
+
+    _insert(WorkoutLog, (WorkoutLog(member_id=pk, notes='Synthetic') for pk in member_ids[::2]), batch_size)
+    # The inserts above skip the signals.
+    stats.invalidate()
+    versions.bump(*set(versions.COLLECTIONS.values()))
+    step("done")
+    return {
+        'members': len(member_ids), 'trainers': len(trainer_ids), 'locations': len(location_ids),
+        'classes': len(classes), 'schedules': schedules, 'bookings': written,
+    }
+
+
+def _plan_bookings(rng, schedule, capacity, mean, members, past):
+    """(member index, status, waitlist position) for one schedule; sets its waitlist_tail."""
+    wanted = min(members, rng.randint(0, round(2 * mean)))
+    plan, holding = [], 0
+    for member in rng.sample(range(members), wanted):
+        roll = rng.random()
+        if roll < 0.1:
+            status = 'cancelled'
+        elif holding >= capacity:
+            status = 'cancelled' if past else 'waitlisted'
+        else:
+            status = ('no_show' if roll < 0.2 else 'attended') if past else 'booked'
+            holding += 1
+        position = None
+        if status == 'waitlisted':
+            schedule.waitlist_tail += 1
+            position = schedule.waitlist_tail
+        plan.append((member, status, position))
+    return plan
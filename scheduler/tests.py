@@ -1,3 +1,1666 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
+from io import StringIO
+import asyncio
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.template import Context, Template
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from django.contrib.auth.models import Group, Permission
+
+from . import analytics, caching, exports, instrumentation, notifications, seats, stats, utilization
+from .access import access_for
+from .replicas import PIN_COOKIE
+from .pagination import KeysetPaginator
+from .synthetic import populate
+from .recurrence import (
+    MAX_OCCURRENCES, cancel_following, create_series, find_conflicts, occurrence_dates, update_following
+)
+from .reservations import (
+    AlreadyBooked, ReservationError, ScheduleFull, book_batch, save_booking, waitlist_place
+)
+from .serializers import (
+    MemberSerializer, TrainerSerializer, FitnessClassSerializer, BookingSerializer, ScheduleSerializer
+)
+from .models import (
+    SEAT_COUNTERS, User, TrainerProfile, MemberProfile, WorkoutType, Location,
+    FitnessClass, Schedule, ScheduleSeries, Booking, WorkoutLog, Notification, ScheduleChange, CollectionVersion,
+    ClassDailyAttendance, TrainerDailyAttendance, LocationHourlyAttendance, MemberDailyAttendance
+)
+
+
+def seed_gym(trainers=3, members=10, locations=2, schedules=12, bookings_per_schedule=4):
+    """Create a small but fully linked gym: every relation the list pages walk is populated."""
+    start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    workout_type, _ = WorkoutType.objects.get_or_create(name='Strength')
+    offset = User.objects.count()
+
+    trainer_profiles = [
+        TrainerProfile.objects.create(user=User.objects.create(
+            username=f'trainer{offset + i}', first_name='Tina', last_name=f'T{i}', role=User.TRAINER))
+        for i in range(trainers)
+    ]
+    member_profiles = [
+        MemberProfile.objects.create(user=User.objects.create(
+            username=f'member{offset + i}', first_name='Max', last_name=f'M{i}'))
+        for i in range(members)
+    ]
+    rooms = [Location.objects.create(name=f'Room {offset + i}') for i in range(locations)]
+    classes = [
+        FitnessClass.objects.create(
+            name=f'Class {offset + i}', workout_type=workout_type,
+            duration=timedelta(hours=1), capacity=bookings_per_schedule + 1, trainer=trainer)
+        for i, trainer in enumerate(trainer_profiles)
+    ]
+
+    # Later calls start after the last seeded slot so nothing overlaps.
+    last = Schedule.objects.order_by('-start_time').first()
+    if last is not None:
+        start = max(start, last.end_time + timedelta(hours=1))
+    for i in range(schedules):
+        schedule = Schedule.objects.create(
+            fitness_class=classes[i % trainers],
+            trainer=trainer_profiles[i % trainers],
+            location=rooms[i % locations],
+            start_time=start + timedelta(hours=2 * i),
+        )
+        for j in range(bookings_per_schedule):
+            Booking.objects.create(member=member_profiles[(i + j) % members], schedule=schedule)
+    for member in member_profiles:
+        WorkoutLog.objects.create(member=member, notes='Leg day')
+
+
+# A cache every process shares, for the tests of what is only cached in one.
+SHARED_CACHE_DIR = tempfile.TemporaryDirectory()
+SHARED_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': SHARED_CACHE_DIR.name,
+}}
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Fails when a page's query count grows with the number of rows it lists,
+    i.e. when an N+1 lookup creeps into a view, template or serializer.
+    """
+
+    # url name -> maximum queries for one request, session, auth and the
+    # list version lookup (versions.py) included.
+    BUDGETS = {
+        'home': 7,
+        'trainers_list': 3,
+        'members_list': 3,
+        'fitness_class_list': 4,
+        'locations_list': 4,
+        'schedule_list': 4,
+        'workoutlogs_list': 3,
+        'bookings_list_cbv': 3,
+        'memberprofile-list': 3,
+        'trainerprofile-list': 3,
+        'fitnessclass-list': 5,
+        'booking-list': 5,
+        'schedule-list': 5,
+        # Forms: one query per choice field.
+        'create_booking_cbv': 4,
+        'create_schedule': 5,
+        'create_schedule_series': 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym()
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def count_queries(self, url_name):
+        # Measure with cold caches so runs are comparable.
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200, url_name)
+        return ctx
+
+    def assertQueryBudget(self, url_name, budget):
+        ctx = self.count_queries(url_name)
+        queries = '\n'.join(q['sql'] for q in ctx.captured_queries)
+        self.assertLessEqual(len(ctx), budget, f"{url_name} ran {len(ctx)} queries:\n{queries}")
+
+    def test_budgets(self):
+        for url_name, budget in self.BUDGETS.items():
+            with self.subTest(url_name):
+                self.assertQueryBudget(url_name, budget)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        before = {url_name: len(self.count_queries(url_name)) for url_name in self.BUDGETS}
+        seed_gym()
+        for url_name, count in before.items():
+            with self.subTest(url_name):
+                self.assertEqual(len(self.count_queries(url_name)), count)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class DashboardCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(members=3, schedules=2, bookings_per_schedule=1)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('home'))
+        return response, [q for q in ctx.captured_queries if 'COUNT(*)' in q['sql']]
+
+    def test_warm_home_page_counts_nothing(self):
+        self.assertTrue(self.count_queries()[1])
+        response, counts = self.count_queries()
+        self.assertEqual(counts, [])
+        self.assertEqual(response.context['member_count'], 3)
+
+        # Writes move the cached numbers instead of dropping them.
+        with self.captureOnCommitCallbacks(execute=True):
+            MemberProfile.objects.create(user=User.objects.create(username='newcomer'))
+        response, counts = self.count_queries()
+        self.assertEqual(counts, [])
+        self.assertEqual(response.context['member_count'], 4)
+
+    def test_write_committed_during_a_recount_is_not_lost(self):
+        count_all = stats._count_all
+
+        def count_then_write():
+            counts = count_all()
+            with self.captureOnCommitCallbacks(execute=True):
+                MemberProfile.objects.create(user=User.objects.create(username='racer'))
+            return counts
+
+        with mock.patch.object(stats, '_count_all', count_then_write):
+            self.assertEqual(stats.dashboard_counts()['member_count'], 3)
+        self.assertEqual(stats.dashboard_counts()['member_count'], 4)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_recounts_soon(self):
+        self.count_queries()
+        self.assertEqual(self.count_queries()[1], [])
+        # Other processes' writes never reach this cache, so it expires quickly.
+        later = timezone.now().timestamp() + stats.LOCAL_CACHE_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertTrue(self.count_queries()[1])
+
+
+class SeatCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=3, bookings_per_schedule=2)
+
+    def assertCountersMatchBookings(self):
+        for schedule in Schedule.objects.all():
+            for status, field in SEAT_COUNTERS.items():
+                self.assertEqual(
+                    getattr(schedule, field), schedule.booking_set.filter(status=status).count(),
+                    f"{field} of schedule {schedule.pk}",
+                )
+
+    def test_bulk_update_moves_bookings_between_schedules(self):
+        first, second, _ = Schedule.objects.order_by('start_time')
+        booking = Booking.objects.filter(schedule=first).exclude(member__booking__schedule=second).first()
+        booking.schedule = second
+        Booking.objects.bulk_update([booking], ['schedule'])
+        self.assertEqual(Booking.objects.get(pk=booking.pk).schedule_id, second.pk)
+        self.assertCountersMatchBookings()
+
+        # The in-memory copy now counts where it was moved to.
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertCountersMatchBookings()
+
+    def test_bulk_update_does_the_bookkeeping_once(self):
+        booking = Booking.objects.order_by('pk').first()
+        booking.status = 'attended'
+        with CaptureQueriesContext(connection) as bulk:
+            Booking.objects.bulk_update([booking], ['status'])
+        with CaptureQueriesContext(connection) as single:
+            Booking.objects.filter(pk=booking.pk).update(status='no_show')
+        self.assertLessEqual(len(bulk), len(single) + 1)
+        self.assertCountersMatchBookings()
+
+    def test_queryset_update_recounts_old_and_new_schedules(self):
+        first, second, third = Schedule.objects.order_by('start_time')
+        Booking.objects.filter(schedule=first).update(status='cancelled')
+        self.assertCountersMatchBookings()
+        moving = Booking.objects.filter(schedule=second).exclude(member__booking__schedule=third)
+        Booking.objects.filter(pk__in=moving.values('pk')[:1]).update(schedule=third)
+        self.assertCountersMatchBookings()
+
+
+class ScheduleOverlapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(trainers=2, members=1, locations=2, schedules=1, bookings_per_schedule=0)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        cls.existing = Schedule.objects.get()
+        cls.other_trainer = TrainerProfile.objects.exclude(pk=cls.existing.trainer_id).get()
+        cls.other_room = Location.objects.exclude(pk=cls.existing.location_id).get()
+
+    def entry(self, start, end=None, trainer=None, location=None):
+        # Offsets in minutes from the existing one-hour entry's start.
+        return Schedule(
+            fitness_class=self.existing.fitness_class,
+            trainer=trainer or self.existing.trainer,
+            location=location or self.existing.location,
+            start_time=self.existing.start_time + timedelta(minutes=start),
+            end_time=self.existing.start_time + timedelta(minutes=end if end is not None else start + 60),
+        )
+
+    def clashes(self, schedule):
+        try:
+            schedule.clean()
+        except ValidationError as e:
+            return sorted(e.message_dict)
+        return []
+
+    def test_partial_and_enclosing_overlaps_clash(self):
+        for start, end in [(30, 90), (-30, 30), (-30, 90), (15, 45)]:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(self.clashes(self.entry(start, end)), ['location', 'trainer'])
+
+    def test_touching_boundaries_do_not_clash(self):
+        self.assertEqual(self.clashes(self.entry(60)), [])
+        self.assertEqual(self.clashes(self.entry(-60)), [])
+
+    def test_trainer_and_location_are_checked_separately(self):
+        self.assertEqual(self.clashes(self.entry(30, location=self.other_room)), ['trainer'])
+        self.assertEqual(self.clashes(self.entry(30, trainer=self.other_trainer)), ['location'])
+        self.assertEqual(self.clashes(self.entry(30, trainer=self.other_trainer, location=self.other_room)), [])
+
+    def test_an_entry_does_not_clash_with_itself(self):
+        self.existing.end_time += timedelta(minutes=30)
+        self.assertEqual(self.clashes(self.existing), [])
+
+    def test_constraint_violation_on_save_is_a_validation_error(self):
+        # As if another request had saved the slot after this one's clean().
+        with self.assertRaises(ValidationError) as caught:
+            self.entry(0, location=self.other_room).save()
+        self.assertEqual(sorted(caught.exception.message_dict), ['trainer'])
+        self.assertEqual(Schedule.objects.count(), 1)
+
+    def test_api_reports_overlaps_as_400(self):
+        self.client.force_login(self.admin)
+        payload = {
+            'fitness_class': self.existing.fitness_class_id, 'trainer': self.existing.trainer_id,
+            'location': self.other_room.pk, 'start_time': self.existing.start_time + timedelta(minutes=30),
+            'end_time': self.existing.end_time + timedelta(minutes=30),
+        }
+        response = self.client.post(reverse('schedule-list'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('trainer', response.json())
+
+        payload['start_time'], payload['end_time'] = self.existing.start_time, self.existing.end_time
+        # Validation passes, as it would before a concurrent request's insert.
+        with mock.patch.object(ScheduleSerializer, 'run_validation', ScheduleSerializer.to_internal_value):
+            response = self.client.post(reverse('schedule-list'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('trainer', response.json())
+
+
+class RecurrenceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(trainers=2, members=2, locations=2, schedules=1, bookings_per_schedule=1)
+        cls.fitness_class = FitnessClass.objects.order_by('pk').first()
+        cls.trainer, cls.other_trainer = TrainerProfile.objects.order_by('pk')
+        cls.room, cls.other_room = Location.objects.order_by('pk')
+        # A Monday at 10:00, well clear of the seeded entry.
+        day = timezone.localdate() + timedelta(days=60)
+        day -= timedelta(days=day.weekday())
+        cls.monday = timezone.make_aware(datetime.combine(day, time(10)))
+
+    def series(self, **kwargs):
+        return ScheduleSeries(**{
+            'fitness_class': self.fitness_class, 'trainer': self.trainer, 'location': self.room,
+            'start_time': self.monday, **kwargs,
+        })
+
+    def starts(self, schedules):
+        return [(s.start_time - self.monday) for s in schedules]
+
+    def test_weekly_expansion_with_weekdays_and_exceptions(self):
+        skipped = (self.monday + timedelta(days=9)).date()
+        created = create_series(self.series(weekdays='0,2', count=5, exceptions=[skipped.isoformat()]))
+        # Mon, Wed, Mon, [Wed skipped], Mon: ``count`` includes the exception.
+        self.assertEqual(self.starts(created), [timedelta(days=d) for d in (0, 2, 7, 14)])
+        self.assertTrue(all(s.end_time - s.start_time == self.fitness_class.duration for s in created))
+        self.assertEqual(Schedule.objects.filter(series=created[0].series).count(), 4)
+        self.assertEqual(Schedule.objects.get(pk=created[0].pk).booked_count, 0)
+
+    def test_daily_expansion_stops_at_until_and_the_cap(self):
+        created = create_series(self.series(
+            frequency=ScheduleSeries.DAILY, interval=3, until=(self.monday + timedelta(days=10)).date()))
+        self.assertEqual(self.starts(created), [timedelta(days=d) for d in (0, 3, 6, 9)])
+        endless = self.series(frequency=ScheduleSeries.DAILY, until=(self.monday + timedelta(days=5000)).date())
+        self.assertEqual(len(list(occurrence_dates(endless))), MAX_OCCURRENCES)
+
+    def test_a_clash_anywhere_in_the_series_rejects_all_of_it(self):
+        Schedule.objects.create(fitness_class=self.fitness_class, trainer=self.other_trainer, location=self.room,
+                                start_time=self.monday + timedelta(weeks=2, minutes=30))
+        with self.assertRaises(ValidationError) as caught:
+            create_series(self.series(count=4))
+        self.assertEqual(len(caught.exception.messages), 1)
+        self.assertFalse(ScheduleSeries.objects.exists())
+        self.assertFalse(Schedule.objects.filter(start_time__gte=self.monday, location=self.room,
+                                                 trainer=self.trainer).exists())
+
+    def test_candidates_are_checked_against_each_other(self):
+        batch = [
+            Schedule(fitness_class=self.fitness_class, trainer=self.trainer, location=self.room,
+                     start_time=self.monday, end_time=self.monday + timedelta(hours=1)),
+            Schedule(fitness_class=self.fitness_class, trainer=self.trainer, location=self.other_room,
+                     start_time=self.monday + timedelta(minutes=30), end_time=self.monday + timedelta(hours=2)),
+        ]
+        self.assertEqual(find_conflicts(batch), [(batch[1], batch[0])])
+        batch[1].trainer = self.other_trainer
+        self.assertEqual(find_conflicts(batch), [])
+
+    def test_update_following_splits_the_series(self):
+        created = create_series(self.series(count=4))
+        series = created[0].series
+        moved = update_following(created[2], trainer=self.other_trainer, location=self.other_room,
+                                 shift=timedelta(hours=1))
+
+        self.assertEqual([s.pk for s in moved], [s.pk for s in created[2:]])
+        kept = list(Schedule.objects.filter(pk__in=[s.pk for s in created[:2]]))
+        self.assertEqual({(s.series_id, s.trainer_id, s.location_id) for s in kept},
+                         {(series.pk, self.trainer.pk, self.room.pk)})
+        self.assertEqual(self.starts(kept), [timedelta(weeks=0), timedelta(weeks=1)])
+
+        rows = list(Schedule.objects.filter(pk__in=[s.pk for s in moved]))
+        self.assertEqual(self.starts(rows), [timedelta(weeks=2, hours=1), timedelta(weeks=3, hours=1)])
+        self.assertEqual({(s.trainer_id, s.location_id) for s in rows}, {(self.other_trainer.pk, self.other_room.pk)})
+        new_series = rows[0].series
+        self.assertNotEqual(new_series.pk, series.pk)
+        self.assertEqual(new_series.start_time, rows[0].start_time)
+        series.refresh_from_db()
+        self.assertEqual((series.until, series.count), ((self.monday + timedelta(weeks=2, days=-1)).date(), None))
+
+    def test_update_following_refuses_a_clash_and_changes_nothing(self):
+        created = create_series(self.series(count=3))
+        Schedule.objects.create(fitness_class=self.fitness_class, trainer=self.other_trainer, location=self.other_room,
+                                start_time=self.monday + timedelta(weeks=2))
+        with self.assertRaises(ValidationError):
+            update_following(created[1], location=self.other_room)
+        self.assertEqual(set(Schedule.objects.filter(series=created[0].series).values_list('location_id', flat=True)),
+                         {self.room.pk})
+        self.assertEqual(ScheduleSeries.objects.count(), 1)
+
+    def test_update_following_from_the_first_occurrence_replaces_the_series(self):
+        created = create_series(self.series(count=2))
+        update_following(created[0], trainer=self.other_trainer)
+        self.assertFalse(ScheduleSeries.objects.filter(pk=created[0].series_id).exists())
+        self.assertEqual(Schedule.objects.filter(series__isnull=False, trainer=self.other_trainer).count(), 2)
+
+    def test_cancel_following(self):
+        created = create_series(self.series(count=4))
+        series = created[0].series
+        self.assertEqual(cancel_following(created[1]), 3)
+        self.assertEqual(list(Schedule.objects.filter(series=series)), [created[0]])
+        series.refresh_from_db()
+        self.assertEqual(series.until, (self.monday + timedelta(days=6)).date())
+
+        cancel_following(created[0])
+        self.assertFalse(ScheduleSeries.objects.filter(pk=series.pk).exists())
+        self.assertFalse(Schedule.objects.filter(pk=created[0].pk).exists())
+
+    def test_cancel_following_queues_the_notices_in_one_insert(self):
+        created = create_series(self.series(count=4))
+        members = MemberProfile.objects.order_by('pk')[:2]
+        Booking.objects.bulk_create([Booking(member=m, schedule=s) for m in members for s in created[1:]])
+        with CaptureQueriesContext(connection) as ctx:
+            cancel_following(created[1])
+        sql = [q['sql'] for q in ctx.captured_queries]
+        self.assertEqual(len([q for q in sql if q.startswith('INSERT INTO "scheduler_schedulechange"')]), 1)
+        self.assertFalse([q for q in sql if q.startswith('SELECT') and ' FROM "scheduler_fitnessclass"' in q])
+        changes = ScheduleChange.objects.filter(kind=ScheduleChange.CANCELLED).order_by('old_start')
+        self.assertEqual([c.schedule_id for c in changes], [s.pk for s in created[1:]])
+        self.assertEqual(changes[0].recipients, sorted(m.user_id for m in members))
+
+
+class ReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Capacity 3 with 2 booked: one seat left on each schedule.
+        seed_gym(members=8, schedules=2, bookings_per_schedule=2)
+
+    def setUp(self):
+        self.schedule, self.other = Schedule.objects.select_related('fitness_class').order_by('start_time')[:2]
+        self.free = list(
+            MemberProfile.objects.exclude(booking__schedule__in=[self.schedule, self.other]).order_by('pk'))
+
+    def book(self, member, waitlist=False, schedule=None):
+        return save_booking(Booking(member=member, schedule=schedule or self.schedule), waitlist=waitlist)
+
+    def test_full_class_is_rejected_or_waitlisted(self):
+        self.assertEqual(self.book(self.free[0]).status, 'booked')
+        with self.assertRaises(ScheduleFull):
+            self.book(self.free[1])
+        queued = [self.book(member, waitlist=True) for member in self.free[1:3]]
+        self.assertEqual([(b.status, waitlist_place(b)) for b in queued], [('waitlisted', 1), ('waitlisted', 2)])
+        self.schedule.refresh_from_db()
+        self.assertEqual((self.schedule.booked_count, self.schedule.waitlist_count), (3, 2))
+
+    def test_booking_twice_is_refused(self):
+        booking = self.book(self.free[0])
+        with self.assertRaises(AlreadyBooked):
+            self.book(booking.member, waitlist=True)
+
+    def test_cancelling_promotes_the_head_of_the_waitlist(self):
+        self.book(self.free[0])
+        first, second = [self.book(member, waitlist=True) for member in self.free[1:3]]
+        cancelled = self.schedule.booking_set.filter(status='booked').first()
+        cancelled.status = 'cancelled'
+        save_booking(cancelled)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.waitlist_position), ('booked', None))
+        self.assertEqual((second.status, waitlist_place(second)), ('waitlisted', 1))
+        self.schedule.refresh_from_db()
+        self.assertEqual(
+            (self.schedule.booked_count, self.schedule.cancelled_count, self.schedule.waitlist_count), (3, 1, 1))
+
+    def test_moving_into_a_full_class(self):
+        self.book(self.free[0], schedule=self.other)
+        booked = self.schedule.booking_set.exclude(member__booking__schedule=self.other).filter(status='booked')[0]
+        booked.schedule = self.other
+        with self.assertRaises(ScheduleFull):
+            save_booking(booked)
+
+        # A waitlisted booking joins the back of the other class's queue.
+        self.book(self.free[1])
+        tail = Schedule.objects.get(pk=self.other.pk).waitlist_tail
+        queued = self.book(self.free[2], waitlist=True)
+        queued.schedule = self.other
+        save_booking(queued)
+        self.assertEqual((queued.status, queued.waitlist_position), ('waitlisted', tail + 1))
+
+    def test_moving_locks_both_schedules_first_in_pk_order(self):
+        booking = self.book(self.free[0])
+        booking.schedule = self.other
+        with CaptureQueriesContext(connection) as ctx:
+            save_booking(booking)
+        queries = ctx.captured_queries
+        lock = next(i for i, q in enumerate(queries) if ' FROM "scheduler_schedule"' in q['sql'])
+        write = next(i for i, q in enumerate(queries) if q['sql'].startswith(('UPDATE', 'INSERT')))
+        self.assertLess(lock, write)
+        self.assertIn('ORDER BY "scheduler_schedule"."id" ASC', queries[lock]['sql'])
+        self.assertEqual(Schedule.objects.get(pk=self.schedule.pk).booked_count, 2)
+        self.assertEqual(Schedule.objects.get(pk=self.other.pk).booked_count, 3)
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    """
+    Threads racing for the last seats, each on its own connection and
+    transaction. In-memory SQLite fails lock waits at once instead of
+    queueing them; give the test database a file (DATABASES TEST NAME) or
+    use PostgreSQL to run these.
+    """
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("in-memory SQLite doesn't wait for locks")
+        seed_gym(members=8, schedules=1, bookings_per_schedule=1)
+        self.schedule = Schedule.objects.select_related('fitness_class').get()
+        self.members = list(MemberProfile.objects.exclude(booking__schedule=self.schedule))
+
+    def race(self, waitlist):
+        barrier = threading.Barrier(len(self.members))
+        results = {}
+
+        def book(member):
+            try:
+                barrier.wait()
+                results[member.pk] = save_booking(Booking(member=member, schedule=self.schedule),
+                                                  waitlist=waitlist).status
+            except ReservationError as e:
+                results[member.pk] = type(e).__name__
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=book, args=(member,)) for member in self.members]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(results.values())
+
+    def test_capacity_holds_under_concurrent_reservations(self):
+        free = self.schedule.fitness_class.capacity - 1
+        results = self.race(waitlist=False)
+        self.assertEqual(results, ['ScheduleFull'] * (len(self.members) - free) + ['booked'] * free)
+        self.schedule.refresh_from_db()
+        self.assertEqual(self.schedule.booked_count, self.schedule.fitness_class.capacity)
+
+    def test_concurrent_overflow_gets_distinct_waitlist_places(self):
+        self.race(waitlist=True)
+        positions = list(Booking.objects.filter(schedule=self.schedule, status='waitlisted')
+                         .values_list('waitlist_position', flat=True))
+        # One seat was free; everyone else queues, each at their own place.
+        self.assertEqual(sorted(positions), list(range(1, len(self.members))))
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=7, bookings_per_schedule=3)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        # Equal sort keys must still page deterministically.
+        Booking.objects.update(booked_at=timezone.now())
+
+    def walk(self, ordering, per_page=4):
+        paginator = KeysetPaginator(Booking.objects.all(), ordering, per_page)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return paginator, pages
+
+    def test_forward_walk_visits_every_row_once(self):
+        _, pages = self.walk(('-booked_at', '-id'))
+        ids = [b.pk for page in pages for b in page]
+        self.assertEqual(ids, list(Booking.objects.order_by('-booked_at', '-id').values_list('pk', flat=True)))
+        self.assertFalse(pages[0].has_previous())
+
+    def test_previous_cursor_returns_the_page_before(self):
+        paginator, pages = self.walk(('-booked_at', '-id'))
+        for before, after in zip(pages, pages[1:]):
+            back = paginator.page(after.previous_cursor)
+            self.assertEqual([b.pk for b in back], [b.pk for b in before])
+
+    def test_api_returns_cursor_links(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('booking-list'), {'page_size': 5})
+        self.assertEqual(len(response.json()['results']), 5)
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertIsNotNone(response.json()['previous'])
+
+    def test_bad_cursor_is_404(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse('bookings_list_cbv'), {'cursor': 'nope'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('schedule-list'), {'cursor': 'nope'}).status_code, 404)
+
+
+class ValuesProjectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=4, bookings_per_schedule=2)
+        FitnessClass.objects.create(
+            name='No trainer', workout_type=WorkoutType.objects.get(), duration=timedelta(minutes=45))
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+
+    def test_fast_list_matches_model_serializer(self):
+        self.client.force_login(self.admin)
+        for url_name, serializer_class in [
+            ('memberprofile-list', MemberSerializer),
+            ('trainerprofile-list', TrainerSerializer),
+            ('fitnessclass-list', FitnessClassSerializer),
+            ('booking-list', BookingSerializer),
+            ('schedule-list', ScheduleSerializer),
+        ]:
+            with self.subTest(url_name):
+                results = self.client.get(reverse(url_name), {'page_size': 500}).json()['results']
+                model = serializer_class.Meta.model
+                objects = model.objects.filter(pk__in=[row['id'] for row in results])
+                expected = {obj.pk: obj for obj in objects}
+                slow = [serializer_class(expected[row['id']]).data for row in results]
+                self.assertEqual(json.loads(JSONRenderer().render(slow)), results)
+
+
+class BookingBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(members=8, schedules=2, bookings_per_schedule=2)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+
+    def post(self, payload):
+        self.client.force_login(self.admin)
+        return self.client.post(reverse('booking-batch'), payload, content_type='application/json')
+
+    def test_creates_waitlist_overflow_and_cancels_promote(self):
+        schedule = Schedule.objects.order_by('start_time').first()
+        booked = set(schedule.booking_set.values_list('member_id', flat=True))
+        free = [m.pk for m in MemberProfile.objects.exclude(pk__in=booked)]
+        # Capacity is 3 with 2 booked: one seat, then the waitlist.
+        response = self.post({'create': [{'member': m, 'schedule': schedule.pk} for m in free[:3]]})
+        self.assertEqual(response.status_code, 200)
+        results = [r['result'] for r in response.json()['create']]
+        self.assertEqual(results, ['booked', 'waitlisted', 'waitlisted'])
+
+        cancel = schedule.booking_set.filter(status='booked').first()
+        response = self.post({'cancel': [cancel.pk, cancel.pk, 0]})
+        self.assertEqual([r['result'] for r in response.json()['cancel']], ['cancelled', 'error', 'error'])
+        promoted = Booking.objects.get(member_id=free[1], schedule=schedule)
+        self.assertEqual(promoted.status, 'booked')
+        schedule.refresh_from_db()
+        self.assertEqual((schedule.booked_count, schedule.waitlist_count), (3, 1))
+
+    def test_duplicates_and_unknown_ids_are_reported_per_item(self):
+        booking = Booking.objects.first()
+        response = self.post({'create': [
+            {'member': booking.member_id, 'schedule': booking.schedule_id},
+            {'member': booking.member_id, 'schedule': 0},
+        ]})
+        errors = [r['error'] for r in response.json()['create']]
+        self.assertEqual(errors, ["You are already registered for this class.", "Schedule not found."])
+
+    def test_bookings_to_cancel_are_read_under_the_schedule_locks(self):
+        booking = Booking.objects.filter(status='booked').first()
+        with CaptureQueriesContext(connection) as ctx:
+            book_batch(cancels=[booking.pk])
+        sql = [q['sql'] for q in ctx.captured_queries]
+        lock = next(i for i, q in enumerate(sql) if q.startswith('SELECT "scheduler_schedule"."id" AS "pk" FROM'))
+        read = next(i for i, q in enumerate(sql) if '"scheduler_booking"."status"' in q.split(' FROM ')[0])
+        self.assertLess(lock, read)
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', sql[read])
+
+    def test_oversized_batch_is_rejected(self):
+        self.assertEqual(self.post({'cancel': list(range(501))}).status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=3, bookings_per_schedule=2)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_unchanged_list_is_304_without_reading_the_list(self):
+        for url_name, table in [('schedule-list', 'scheduler_schedule'), ('schedule_list', 'scheduler_schedule'),
+                                ('fitnessclass-list', 'scheduler_fitnessclass')]:
+            with self.subTest(url_name):
+                first = self.client.get(reverse(url_name))
+                self.assertIn('ETag', first)
+                with CaptureQueriesContext(connection) as ctx:
+                    again = self.client.get(reverse(url_name), HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(again.status_code, 304)
+                self.assertFalse([q for q in ctx.captured_queries if f'"{table}"' in q['sql']])
+
+    def test_writes_change_the_etag(self):
+        url = reverse('schedule-list')
+        etag = self.client.get(url)['ETag']
+        schedule = Schedule.objects.first()
+        member = MemberProfile.objects.exclude(booking__schedule=schedule).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(member=member, schedule=schedule)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Bulk writes bypass the signals but still move the version.
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.filter(pk=schedule.pk).update(start_time=schedule.start_time - timedelta(days=30))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_versions_move_after_commit_in_one_short_transaction(self):
+        schedule = Schedule.objects.first()
+        members = MemberProfile.objects.exclude(booking__schedule=schedule)[:2]
+        before = dict(CollectionVersion.objects.values_list('name', 'version'))
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks() as callbacks:
+                for member in members:
+                    save_booking(Booking(member=member, schedule=schedule), waitlist=True)
+        # Nothing touches the version rows while the bookings are being written...
+        self.assertFalse([q for q in ctx.captured_queries if 'scheduler_collectionversion' in q['sql']])
+        self.assertEqual(dict(CollectionVersion.objects.values_list('name', 'version')), before)
+
+        with CaptureQueriesContext(connection) as ctx:
+            for callback in callbacks:
+                callback()
+        # ...and afterwards every collection of the transaction moves once, in one UPDATE.
+        updates = [q for q in ctx.captured_queries
+                   if q['sql'].startswith('UPDATE "scheduler_collectionversion"')]
+        self.assertEqual(len(updates), 1)
+        after = dict(CollectionVersion.objects.values_list('name', 'version'))
+        self.assertEqual(after['bookings'], before['bookings'] + 1)
+        self.assertEqual(after['schedules'], before['schedules'] + 1)
+
+    def test_etag_depends_on_user(self):
+        etag = self.client.get(reverse('fitnessclass-list'))['ETag']
+        trainer = TrainerProfile.objects.first()
+        self.client.force_login(trainer.user)
+        response = self.client.get(reverse('fitnessclass-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class TimetableCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=4, bookings_per_schedule=2)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.schedule = Schedule.objects.order_by('start_time').first()
+        self.url = reverse('location_detail', args=[self.schedule.location_id])
+        self.week = {'week': timezone.localtime(self.schedule.start_time).date().isoformat()}
+
+    def schedule_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, self.week)
+        self.assertEqual(response.status_code, 200)
+        return response, [q for q in ctx.captured_queries if '"scheduler_schedule"' in q['sql']]
+
+    def test_second_render_comes_from_the_cache(self):
+        response, queries = self.schedule_queries()
+        self.assertContains(response, self.schedule.fitness_class.name)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.schedule_queries()[1], [])
+
+    def test_booking_refreshes_the_timetable(self):
+        self.schedule_queries()
+        member = MemberProfile.objects.exclude(booking__schedule=self.schedule).first()
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as ctx:
+            Booking.objects.create(member=member, schedule=self.schedule)
+        # The location row is not locked inside the booking transaction...
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "scheduler_location"')])
+        # ...its version moves once it commits.
+        for callback in callbacks:
+            callback()
+        response, queries = self.schedule_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, f'3/{self.schedule.fitness_class.capacity} seats')
+
+    def test_renaming_the_class_or_trainer_refreshes_the_timetable(self):
+        self.schedule_queries()
+        fitness_class = self.schedule.fitness_class
+        fitness_class.name = 'Sunrise Flow'
+        with self.captureOnCommitCallbacks(execute=True):
+            fitness_class.save()
+        response, queries = self.schedule_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, 'Sunrise Flow')
+
+        trainer = self.schedule.trainer.user
+        trainer.first_name, trainer.last_name = 'Renamed', 'Coach'
+        with self.captureOnCommitCallbacks(execute=True):
+            trainer.save()
+        self.assertContains(self.schedule_queries()[0], 'Renamed Coach')
+
+    def test_moving_a_series_refreshes_both_locations(self):
+        source, destination = Location.objects.create(name='Studio A'), Location.objects.create(name='Studio B')
+        created = create_series(ScheduleSeries(
+            fitness_class=self.schedule.fitness_class, trainer=self.schedule.trainer, location=source,
+            start_time=self.schedule.start_time + timedelta(days=60), count=3,
+        ))
+        versions = dict(Location.objects.filter(pk__in=[source.pk, destination.pk])
+                        .values_list('pk', 'timetable_version'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            update_following(created[1], location=destination)
+        moved = dict(Location.objects.filter(pk__in=[source.pk, destination.pk])
+                     .values_list('pk', 'timetable_version'))
+        self.assertGreater(moved[source.pk], versions[source.pk])
+        self.assertGreater(moved[destination.pk], versions[destination.pk])
+
+    def test_waits_for_the_lock_holder_instead_of_rendering(self):
+        from . import timetable
+        location = Location.objects.get(pk=self.schedule.location_id)
+        week = timetable.week_from(self.week['week'])
+        key = timetable._key(location, week)
+        cache.set(key + ':lock', 1)
+
+        def finish_render(seconds):
+            cache.set(key, 'rendered elsewhere')
+
+        with mock.patch.object(timetable.time, 'sleep', finish_render), \
+                CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(timetable.cached_week(location, week), 'rendered elsewhere')
+        self.assertEqual(len(ctx), 0)
+
+
+class SyntheticGymTests(TestCase):
+    def test_populate_keeps_counters_and_timetable_consistent(self):
+        counts = populate(members=30, trainers=3, locations=2, schedules=40, bookings=300, batch_size=16)
+        self.assertEqual(Schedule.objects.count(), 40)
+        self.assertEqual(Booking.objects.count(), counts['bookings'])
+        stored = list(Schedule.objects.order_by('pk').values_list(*SEAT_COUNTERS.values()))
+        Schedule.objects.recount_seats()
+        self.assertEqual(list(Schedule.objects.order_by('pk').values_list(*SEAT_COUNTERS.values())), stored)
+        for schedule in Schedule.objects.select_related('fitness_class'):
+            self.assertLessEqual(schedule.seats_taken, schedule.fitness_class.capacity)
+            self.assertIsNone(Schedule.objects.exclude(pk=schedule.pk).filter(
+                trainer_id=schedule.trainer_id).overlapping(schedule.start_time, schedule.end_time))
+
+    def test_bench_endpoints_writes_a_report(self):
+        populate(members=20, trainers=2, locations=2, schedules=10, bookings=40)
+        with tempfile.NamedTemporaryFile(suffix='.json') as report:
+            call_command('bench_endpoints', requests=2, warmup=0, only=['list', 'detail'],
+                         json_path=report.name, stdout=StringIO())
+            results = {r['name']: r for r in json.load(open(report.name))['results']}
+        self.assertEqual(results['schedule-list']['status'], 200)
+        self.assertEqual(results['location_detail']['status'], 200)
+        self.assertGreater(results['schedule_list']['queries'], 0)
+        self.assertNotIn('booking-batch', results)
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=3, bookings_per_schedule=1)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('schedule_list'))
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'db', 'tpl', 'app', 'total'})
+        self.assertRegex(timing['db'], r'dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertNotEqual(timing['tpl'], 'dur=0.0')
+
+    def test_slow_requests_are_logged_and_profiled(self):
+        with tempfile.TemporaryDirectory() as profiles, \
+                self.settings(INSTRUMENTATION={'SLOW_REQUEST_MS': 0, 'PROFILE_SAMPLE_RATE': 1, 'PROFILE_DIR': profiles}), \
+                self.assertLogs('scheduler.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('schedule_list'))
+            record = logs.records[0].request_metrics
+            self.assertEqual(record['path'], reverse('schedule_list'))
+            self.assertTrue(record['slowest'][0]['sql'])
+            self.assertTrue(os.path.exists(record['profile']))
+
+    def test_fast_requests_are_not_logged(self):
+        with self.settings(INSTRUMENTATION={'SLOW_REQUEST_MS': 60000, 'MAX_QUERIES': 1000}), \
+                self.assertNoLogs('scheduler.instrumentation'):
+            self.client.get(reverse('schedule_list'))
+
+    def test_disabled_instrumentation_is_left_out(self):
+        with self.settings(INSTRUMENTATION={'ENABLED': False, 'SLOW_REQUEST_MS': 0}), \
+                self.assertNoLogs('scheduler.instrumentation'):
+            response = self.client.get(reverse('schedule_list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_template_timing_is_installed_once(self):
+        with mock.patch.object(Template, 'render', instrumentation._template_render):
+            instrumentation.install()
+            self.assertIs(Template.render, instrumentation._timed_render)
+            instrumentation.install()
+            self.assertIs(Template.render, instrumentation._timed_render)
+            self.assertEqual(Template('{{ n }}').render(Context({'n': 1})), '1')
+
+
+class NotificationFanOutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(members=6, schedules=2, bookings_per_schedule=3)
+
+    def setUp(self):
+        self.schedule = Schedule.objects.order_by('start_time').first()
+        self.members = set(self.schedule.booking_set.values_list('member__user_id', flat=True))
+        self.later = timezone.now() + timedelta(hours=1)
+
+    def move(self, hours):
+        schedule = Schedule.objects.get(pk=self.schedule.pk)
+        schedule.start_time += timedelta(hours=hours)
+        schedule.end_time += timedelta(hours=hours)
+        schedule.save()
+        return schedule
+
+    def test_changes_within_the_window_collapse_into_one_notification(self):
+        self.move(24)
+        final = self.move(1)
+        self.assertEqual(notifications.process_all(), 0)  # Still inside the window.
+
+        self.assertEqual(notifications.process_all(now=self.later), len(self.members))
+        sent = Notification.objects.all()
+        self.assertEqual({n.user_id for n in sent}, self.members)
+        self.assertIn(timezone.localtime(final.start_time).strftime('%H:%M'), sent[0].message)
+        self.assertFalse(ScheduleChange.objects.filter(processed_at__isnull=True).exists())
+
+    def test_moving_back_sends_nothing(self):
+        self.move(2)
+        self.move(-2)
+        self.assertEqual(notifications.process_all(now=self.later), 0)
+
+    def test_cancellation_reaches_members_after_the_bookings_are_gone(self):
+        name = self.schedule.fitness_class.name
+        self.move(1)
+        Schedule.objects.get(pk=self.schedule.pk).delete()
+        self.assertEqual(notifications.process_all(now=self.later), len(self.members))
+        self.assertEqual(set(Notification.objects.values_list('title', flat=True)), {f"{name} cancelled"})
+
+
+class NotificationInboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass')
+        cls.other = User.objects.create_user('other', password='pass')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def unread(self, user=None):
+        return User.objects.get(pk=(user or self.user).pk).unread_notifications
+
+    def test_counter_follows_every_write_path(self):
+        Notification.objects.bulk_create(
+            [Notification(user=self.user, title=f'n{i}', message='') for i in range(3)]
+            + [Notification(user=self.other, title='x', message='')]
+        )
+        single = Notification.objects.create(user=self.user, title='single', message='')
+        self.assertEqual((self.unread(), self.unread(self.other)), (4, 1))
+
+        single = Notification.objects.get(pk=single.pk)
+        single.is_read = True
+        single.save()
+        self.assertEqual(self.unread(), 3)
+        Notification.objects.filter(title='n0').delete()
+        self.assertEqual(self.unread(), 2)
+        Notification.objects.filter(title='n1').update(user=self.other)
+        self.assertEqual((self.unread(), self.unread(self.other)), (1, 2))
+
+    def test_saving_a_stale_user_keeps_new_notifications(self):
+        stale = User.objects.get(pk=self.user.pk)
+        Notification.objects.create(user=self.user, title='meanwhile', message='')
+        stale.first_name = 'Renamed'
+        stale.save()
+        self.assertEqual(self.unread(), 1)
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_name, 'Renamed')
+
+        # Still settable on purpose, and saving a deferred user loads nothing extra.
+        stale.unread_notifications = 0
+        stale.save(update_fields=['unread_notifications'])
+        self.assertEqual(self.unread(), 0)
+        partial = User.objects.only('email').get(pk=self.user.pk)
+        partial.email = 'reader@example.com'
+        with self.assertNumQueries(1):
+            partial.save()
+
+    def test_mark_all_read_is_one_update_of_the_notifications(self):
+        Notification.objects.bulk_create([Notification(user=self.user, title='n', message='') for _ in range(5)])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(Notification.objects.mark_all_read(self.user), 5)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "scheduler_notification"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.unread(), 0)
+
+    def test_badge_needs_no_count_query(self):
+        Notification.objects.bulk_create([Notification(user=self.user, title='n', message='') for _ in range(2)])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, '<span class="badge bg-danger">2</span>', html=True)
+        self.assertFalse([q for q in ctx.captured_queries if 'scheduler_notification' in q['sql']])
+
+    def test_inbox_api_pages_and_marks_read(self):
+        Notification.objects.bulk_create([Notification(user=self.user, title=f'n{i}', message='') for i in range(5)])
+        Notification.objects.create(user=self.other, title='not mine', message='')
+        page = self.client.get(reverse('notification-list'), {'page_size': 3}).json()
+        rest = self.client.get(page['next']).json()
+        self.assertEqual(len(page['results']) + len(rest['results']), 5)
+
+        response = self.client.post(reverse('notification-read-all'))
+        self.assertEqual(response.json(), {'marked': 5, 'unread': 0})
+        self.assertEqual(self.client.get(reverse('notification-list'), {'unread': 1}).json()['results'], [])
+        self.assertEqual(self.unread(self.other), 1)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class AccessResolverTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(trainers=2, members=2, schedules=2, bookings_per_schedule=1)
+        cls.trainer = TrainerProfile.objects.select_related('user').order_by('pk').first()
+        cls.user = User.objects.create_user('plain', password='pass')
+
+    def setUp(self):
+        cache.clear()
+
+    def fresh(self, user):
+        # A new object, as the next request would load it.
+        return User.objects.get(pk=user.pk)
+
+    def test_resolved_in_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            access = access_for(self.trainer.user)
+            self.assertEqual(access_for(self.trainer.user), access)
+        self.assertEqual(access.trainer_id, self.trainer.pk)
+        self.assertFalse(access.is_member)
+        user = self.fresh(self.trainer.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(access_for(user).trainer_id, self.trainer.pk)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_not_cached_across_requests_in_a_per_process_cache(self):
+        access_for(self.trainer.user)
+        user = self.fresh(self.trainer.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(access_for(user).trainer_id, self.trainer.pk)
+            access_for(user)
+        self.assertFalse(cache.get_many(['access:generation', f'access:{user.pk}']))
+        self.assertEqual([e.id for e in caching.check_shared_cache(None)], ['scheduler.W001'])
+
+    def test_profile_changes_invalidate(self):
+        self.assertFalse(access_for(self.fresh(self.user)).is_member)
+        member = MemberProfile.objects.create(user=self.user)
+        self.assertEqual(access_for(self.fresh(self.user)).member_id, member.pk)
+        member.delete()
+        self.assertFalse(access_for(self.fresh(self.user)).is_member)
+
+    def test_permission_changes_invalidate(self):
+        perm = Permission.objects.get(content_type__app_label='scheduler', codename='change_trainerprofile')
+        self.assertFalse(self.fresh(self.user).has_perm('scheduler.change_trainerprofile'))
+
+        self.user.user_permissions.add(perm)
+        self.assertTrue(self.fresh(self.user).has_perm('scheduler.change_trainerprofile'))
+        self.user.user_permissions.clear()
+        self.assertFalse(self.fresh(self.user).has_perm('scheduler.change_trainerprofile'))
+
+        group = Group.objects.create(name='front desk')
+        self.user.groups.add(group)
+        group.permissions.add(perm)
+        user = self.fresh(self.user)
+        self.assertTrue(user.has_perm('scheduler.change_trainerprofile'))
+        with self.assertNumQueries(0):
+            # Answered from the same Access, without ModelBackend's two queries.
+            self.assertFalse(user.has_perm('scheduler.delete_trainerprofile'))
+        group.delete()
+        self.assertFalse(self.fresh(self.user).has_perm('scheduler.change_trainerprofile'))
+
+    def test_views_use_the_resolver(self):
+        self.client.force_login(self.user)
+        url = reverse('update_trainer', args=[self.trainer.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.user.user_permissions.add(
+            Permission.objects.get(content_type__app_label='scheduler', codename='change_trainerprofile'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.force_login(self.trainer.user)
+        classes = self.client.get(reverse('fitnessclass-list'), HTTP_ACCEPT='application/json').json()['results']
+        self.assertEqual({c['id'] for c in classes}, set(self.trainer.classes.values_list('pk', flat=True)))
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN the hot queries and fail on a full table scan. Runs on SQLite
+    and PostgreSQL; PostgreSQL prefers a seq scan on tiny tables, so it
+    plans with enable_seqscan off and a Seq Scan means no usable index.
+    """
+
+    FULL_SCAN = {
+        'sqlite': re.compile(r'\bSCAN (\S+)\s*$', re.MULTILINE),
+        'postgresql': re.compile(r'Seq Scan on (\S+)'),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(trainers=2, members=4, schedules=4, bookings_per_schedule=2)
+
+    def hot_queries(self):
+        start = timezone.now()
+        return {
+            'seat recount': Booking.objects.filter(schedule_id=1, status='booked'),
+            'notification recipients': Booking.objects.filter(
+                schedule_id__in=[1, 2], status__in=notifications.NOTIFY_STATUSES
+            ).values_list('schedule_id', 'member__user_id'),
+            'waitlist head': Booking.objects.filter(schedule_id=1, status='waitlisted').order_by('waitlist_position'),
+            'timetable week': Schedule.objects.filter(
+                location_id=1, start_time__gte=start, start_time__lt=start + timedelta(days=7)
+            ).order_by('start_time'),
+            'trainer schedules': Schedule.objects.filter(trainer_id=1).order_by('start_time', 'id')[:51],
+            'trainer schedule page': Schedule.objects.select_related('fitness_class', 'trainer__user', 'location')
+            .filter(fitness_class__trainer_id=1).order_by('start_time', 'id')[:51],
+            'trainer bookings': Booking.objects.select_related('member__user', 'schedule__fitness_class')
+            .filter(schedule__fitness_class__trainer_id=1).order_by('-booked_at', '-id')[:51],
+            'trainer classes': FitnessClass.objects.select_related('trainer__user')
+            .filter(trainer_id=1).order_by('id')[:51],
+            'member logs': WorkoutLog.objects.select_related('member__user')
+            .filter(member_id=1).order_by('-date', '-id')[:51],
+            'inbox': Notification.objects.filter(user_id=1).order_by('-created_at', '-id')[:51],
+            'pending changes': ScheduleChange.objects.filter(processed_at__isnull=True).values('schedule_id'),
+        }
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
+
+    def test_hot_queries_use_indexes(self):
+        pattern = self.FULL_SCAN.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f"No plan parser for {connection.vendor}")
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                plan = self.explain(queryset)
+                self.assertFalse(pattern.findall(plan), f"{name} scans a whole table:\n{plan}")
+
+
+# A second configured database (the SQLite stand-in, or a PostgreSQL replica URL) plays the replica.
+REPLICA = next((alias for alias in settings.DATABASES if alias != 'default'), None)
+
+
+@skipUnless(REPLICA, "needs a second database to stand in for a replica")
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRoutingTests(TestCase):
+    """Nothing replicates here, so each database gets its own rows and pages show where they read from."""
+    databases = {'default', REPLICA} - {None}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        Location.objects.create(name='Primary room')
+        Location.objects.using(REPLICA).create(name='Replica room')
+        TrainerProfile.objects.create(user=User.objects.create(username='coach', role=User.TRAINER))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_list_pages_read_the_replica(self):
+        response = self.client.get(reverse('locations_list'))
+        self.assertContains(response, 'Replica room')
+        self.assertNotContains(response, 'Primary room')
+
+    def test_safe_api_requests_read_the_replica(self):
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get(reverse('trainerprofile-list'), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['results'], [])
+        self.assertTrue(replica.captured_queries)
+
+    def test_dashboard_counts_read_the_primary(self):
+        cache.clear()
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['trainer_count'], 1)
+        self.assertFalse([q for q in replica.captured_queries if 'COUNT(*)' in q['sql']])
+
+    def test_writes_and_the_following_redirect_use_the_primary(self):
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.post(
+                reverse('create_location'), {'name': 'New room', 'address': '', 'capacity': 10}, follow=True)
+        self.assertFalse(replica.captured_queries)
+        self.assertIn(PIN_COOKIE, self.client.cookies)
+        self.assertContains(response, 'New room')
+        self.assertContains(response, 'Primary room')
+        self.assertFalse(Location.objects.using(REPLICA).filter(name='New room').exists())
+
+        # Once the pin expires, reads go back to the replica.
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertContains(self.client.get(reverse('locations_list')), 'Replica room')
+
+    def test_one_replica_per_request(self):
+        with mock.patch('scheduler.replicas.random.choice', return_value=REPLICA) as choice, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            self.assertContains(self.client.get(reverse('locations_list')), 'Replica room')
+        self.assertGreater(len(replica.captured_queries), 1)
+        choice.assert_called_once()
+
+    async def test_async_views_read_the_replica(self):
+        await self.async_client.aforce_login(self.admin)
+        room = await Location.objects.using(REPLICA).aget(name='Replica room')
+        response = await self.async_client.get(reverse('location_detail_async', args=[room.pk]))
+        self.assertContains(response, 'Replica room')
+
+    def test_other_pages_use_the_primary(self):
+        self.assertContains(self.client.get(reverse('create_location')), 'csrfmiddlewaretoken')
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            self.client.get(reverse('update_location', args=[Location.objects.get(name='Primary room').pk]))
+        self.assertFalse(replica.captured_queries)
+
+
+class AsyncViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=6, bookings_per_schedule=2)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        cls.trainer = TrainerProfile.objects.select_related('user').first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    async def test_pages_match_the_sync_views(self):
+        await self.async_client.aforce_login(self.admin)
+        location = await Location.objects.afirst()
+        for sync_url, async_url in [
+            (reverse('fitness_class_list'), reverse('fitness_class_list_async')),
+            (reverse('location_detail', args=[location.pk]), reverse('location_detail_async', args=[location.pk])),
+        ]:
+            with self.subTest(async_url):
+                expected = await sync_to_async(self.client.get)(sync_url)
+                response = await self.async_client.get(async_url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+
+    async def test_api_lists_match_and_page_like_the_viewsets(self):
+        await self.async_client.aforce_login(self.admin)
+        for sync_name, async_name in [('schedule-list', 'schedule_list_async'), ('booking-list', 'booking_list_async')]:
+            with self.subTest(async_name):
+                expected = await sync_to_async(self.client.get)(
+                    reverse(sync_name), {'page_size': 4}, HTTP_ACCEPT='application/json')
+                response = await self.async_client.get(reverse(async_name), {'page_size': 4})
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(response.json()['results'], expected.json()['results'])
+
+                expected = await sync_to_async(self.client.get)(
+                    expected.json()['next'], HTTP_ACCEPT='application/json')
+                response = await self.async_client.get(response.json()['next'])
+                self.assertEqual(response.json()['results'], expected.json()['results'])
+                self.assertIsNotNone(response.json()['previous'])
+
+    async def test_trainers_see_their_own_schedules(self):
+        await self.async_client.aforce_login(self.trainer.user)
+        response = await self.async_client.get(reverse('schedule_list_async'), {'page_size': 100})
+        trainers = {row['trainer'] for row in response.json()['results']}
+        self.assertEqual(trainers, {self.trainer.pk})
+
+    async def test_unchanged_list_is_304(self):
+        await self.async_client.aforce_login(self.admin)
+        for url_name in ('fitness_class_list_async', 'schedule_list_async'):
+            with self.subTest(url_name):
+                first = await self.async_client.get(reverse(url_name))
+                again = await self.async_client.get(reverse(url_name), headers={'if-none-match': first['ETag']})
+                self.assertEqual(again.status_code, 304)
+
+    async def test_instrumentation_counts_async_queries(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse('schedule_list_async'))
+        queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertGreater(queries, 0)
+
+    def test_login_and_safe_methods_are_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('fitness_class_list_async')).status_code, 302)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.post(reverse('booking_list_async')).status_code, 405)
+
+
+class SeatStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=2, bookings_per_schedule=1)
+        cls.schedule = Schedule.objects.select_related('fitness_class').order_by('start_time').first()
+        cls.member = MemberProfile.objects.exclude(booking__schedule=cls.schedule).select_related('user').first()
+
+    @staticmethod
+    def parse(chunk):
+        lines = dict(line.split(': ', 1) for line in chunk.decode().strip().splitlines())
+        return lines['event'], json.loads(lines['data'])
+
+    async def test_sends_current_seats_then_each_change(self):
+        await self.async_client.aforce_login(self.member.user)
+        response = await self.async_client.get(reverse('seat_stream'), {'schedule': [self.schedule.pk]})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        event, data = self.parse(await anext(stream))
+        self.assertEqual((event, data['seats_taken'], data['status']), ('seats', 1, 'open'))
+
+        def book():
+            with self.captureOnCommitCallbacks(execute=True):
+                Booking.objects.create(member=self.member, schedule=self.schedule)
+
+        await sync_to_async(book)()
+        _, data = self.parse(await asyncio.wait_for(anext(stream), 5))
+        self.assertEqual((data['schedule'], data['seats_taken'], data['seats_left']),
+                         (self.schedule.pk, 2, self.schedule.fitness_class.capacity - 2))
+
+        # A client disconnecting cancels the stream while it waits.
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertFalse(seats.hub.watching())
+
+    async def test_pending_changes_collapse_per_schedule(self):
+        subscriber = seats.hub.subscribe([1, 2])
+        try:
+            for taken in range(100):
+                subscriber.push({1: {'schedule': 1, 'seats_taken': taken}})
+            subscriber.push({2: {'schedule': 2, 'status': 'cancelled'}})
+            updates = await subscriber.updates(1)
+        finally:
+            seats.hub.unsubscribe(subscriber)
+        self.assertEqual(updates, [{'schedule': 1, 'seats_taken': 99}, {'schedule': 2, 'status': 'cancelled'}])
+
+    def test_only_committed_writes_are_published(self):
+        with mock.patch.object(seats.LocalBackend, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    Booking.objects.create(member=self.member, schedule=self.schedule)
+                    transaction.set_rollback(True)
+            publish.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                Booking.objects.create(member=self.member, schedule=self.schedule)
+        self.assertEqual(set(publish.call_args.args[0]), {self.schedule.pk})
+
+    async def test_rejects_bad_subscriptions(self):
+        await self.async_client.aforce_login(self.member.user)
+        url = reverse('seat_stream')
+        self.assertEqual((await self.async_client.get(url)).status_code, 400)
+        self.assertEqual((await self.async_client.get(url, {'schedule': 'x'})).status_code, 400)
+        self.assertEqual((await self.async_client.get(url, {'schedule': list(range(1, 60))})).status_code, 400)
+
+    def test_not_served_over_wsgi(self):
+        self.client.force_login(self.member.user)
+        self.assertEqual(self.client.get(reverse('seat_stream'), {'schedule': [self.schedule.pk]}).status_code, 501)
+
+
+class AttendanceAnalyticsTests(TestCase):
+    ROLLUPS = (ClassDailyAttendance, TrainerDailyAttendance, LocationHourlyAttendance, MemberDailyAttendance)
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=6, bookings_per_schedule=3)
+        cls.staff = User.objects.create(username='manager', is_staff=True)
+
+    def rollups(self):
+        """Every non-empty rollup row, without ids."""
+        snapshot = {}
+        for model in self.ROLLUPS:
+            fields = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+            counts = [name for name in fields if name not in ('day', 'hour') and not name.endswith('_id')]
+            snapshot[model.__name__] = sorted(
+                row for row in model.objects.values_list(*fields)
+                if any(row[fields.index(name)] for name in counts)
+            )
+        return snapshot
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        today = timezone.localdate()
+        analytics.rebuild(today - timedelta(days=30), today + timedelta(days=30))
+        self.assertEqual(incremental, self.rollups())
+
+    def test_writes_keep_rollups_equal_to_a_rebuild(self):
+        schedules = list(Schedule.objects.order_by('start_time'))
+        member = MemberProfile.objects.exclude(booking__schedule__in=[schedules[0], schedules[2], schedules[4]]).first()
+        self.assertTrue(ClassDailyAttendance.objects.exists())
+        self.assertMatchesRebuild()
+
+        booking = Booking.objects.create(member=member, schedule=schedules[0])
+        booking.status = 'attended'
+        booking.save()
+        Booking.objects.filter(schedule=schedules[1]).update(status='no_show')
+        booking.schedule = schedules[2]
+        booking.save()
+        self.assertMatchesRebuild()
+
+        Booking.objects.filter(schedule=schedules[3]).first().delete()
+        Booking.objects.bulk_create([Booking(member=member, schedule=schedules[4], status='cancelled')])
+        Booking.objects.only('pk').get(member=member, schedule=schedules[4]).save()
+        self.assertMatchesRebuild()
+
+        # Moving a schedule moves its bookings to other rows; deleting one takes them off.
+        moved = Schedule.objects.get(pk=schedules[1].pk)
+        moved.start_time += timedelta(days=1, hours=3)
+        moved.save()
+        Schedule.objects.filter(pk=schedules[2].pk).update(trainer=schedules[3].trainer)
+        schedules[5].delete()
+        self.assertMatchesRebuild()
+
+        # As do deletes that cascade from elsewhere.
+        schedules[0].fitness_class.delete()
+        MemberProfile.objects.filter(booking__isnull=False).first().delete()
+        self.assertMatchesRebuild()
+
+        log = WorkoutLog.objects.create(member=member, notes='Rowing')
+        log.member = MemberProfile.objects.exclude(pk=member.pk).first()
+        log.save()
+        WorkoutLog.objects.bulk_create([WorkoutLog(member=member, notes='Bike')])
+        WorkoutLog.objects.filter(notes='Leg day').first().delete()
+        self.assertMatchesRebuild()
+
+    def test_bulk_writes_apply_deltas_without_rebuilding(self):
+        schedules = list(Schedule.objects.order_by('start_time'))
+        member = MemberProfile.objects.exclude(booking__schedule__in=schedules[:2]).first()
+        with mock.patch.object(analytics, 'rebuild', side_effect=AssertionError('rebuilt in a request')):
+            bookings = list(Booking.objects.filter(schedule=schedules[0]))
+            for booking, status in zip(bookings, ('attended', 'no_show', 'cancelled')):
+                booking.status = status
+            Booking.objects.bulk_update(bookings, ['status'])
+            moved = Booking.objects.filter(schedule=schedules[1]).exclude(
+                member__booking__schedule=schedules[2]
+            ).update(schedule=schedules[2])
+            self.assertTrue(moved)
+            existing = Booking.objects.filter(schedule=schedules[3]).first()
+            Booking.objects.bulk_create([
+                Booking(member_id=existing.member_id, schedule=schedules[3], status='attended'),
+                Booking(member=member, schedule=schedules[3], status='booked'),
+            ], update_conflicts=True, unique_fields=['member', 'schedule'], update_fields=['status'])
+            Booking.objects.bulk_create([Booking(member=member, schedule=schedules[3])], ignore_conflicts=True)
+            Schedule.objects.filter(pk=schedules[4].pk).update(fitness_class=schedules[5].fitness_class)
+            log = WorkoutLog.objects.create(member=member, notes='Rowing')
+            WorkoutLog.objects.bulk_create([
+                WorkoutLog(pk=log.pk, member=member, notes='Rowing'), WorkoutLog(member=member, notes='Bike'),
+            ], ignore_conflicts=True)
+            WorkoutLog.objects.only('pk').get(pk=log.pk).save()
+        self.assertMatchesRebuild()
+
+    def test_reports(self):
+        schedule = Schedule.objects.select_related('fitness_class', 'location').order_by('start_time').first()
+        bookings = list(Booking.objects.filter(schedule=schedule).select_related('member__user').order_by('pk'))
+        for booking, status in zip(bookings, ('attended', 'attended', 'no_show')):
+            booking.status = status
+            booking.save()
+        day = timezone.localdate(schedule.start_time)
+
+        classes = {row['fitness_class_id']: row for row in analytics.class_attendance(day, day)}
+        row = classes[schedule.fitness_class_id]
+        self.assertEqual((row['attended'], row['no_show'], row['attendance_rate']), (2, 1, 0.667))
+        self.assertEqual(analytics.member_no_shows(day, day)[0]['member_id'], bookings[2].member_id)
+        self.assertEqual(analytics.member_no_shows(day, day)[0]['no_show_rate'], 1.0)
+        busiest = analytics.busiest_hours(day, day, location_id=schedule.location_id)
+        self.assertIn(timezone.localtime(schedule.start_time).hour, [row['hour'] for row in busiest])
+
+        url = reverse('attendance_report')
+        self.client.force_login(bookings[0].member.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.staff)
+        response = self.client.get(url, {'start': day.isoformat(), 'end': day.isoformat()})
+        self.assertContains(response, schedule.fitness_class.name)
+        self.assertContains(response, bookings[2].member.user.username)
+        self.assertEqual(self.client.get(url, {'start': '2026-02-31'}).status_code, 200)
+
+    def test_no_show_rate_counts_every_day(self):
+        attended = Booking.objects.select_related('schedule').order_by('pk').first()
+        attended.status = 'attended'
+        attended.save()
+        # A no-show on another day than the class they attended.
+        later = Schedule.objects.create(
+            fitness_class=attended.schedule.fitness_class, trainer=attended.schedule.trainer,
+            location=attended.schedule.location, start_time=attended.schedule.start_time + timedelta(days=3),
+        )
+        Booking.objects.create(member_id=attended.member_id, schedule=later, status='no_show')
+        first, last = timezone.localdate(attended.schedule.start_time), timezone.localdate(later.start_time)
+
+        row = next(row for row in analytics.member_no_shows(first, last) if row['member_id'] == attended.member_id)
+        self.assertEqual((row['attended'], row['no_show'], row['no_show_rate']), (1, 1, 0.5))
+
+    def test_backfill_command_rebuilds_history(self):
+        expected = self.rollups()
+        for model in self.ROLLUPS:
+            model.objects.all().delete()
+        out = StringIO()
+        call_command('backfill_analytics', chunk_days=1, stdout=out)
+        self.assertIn('Backfilled', out.getvalue())
+        self.assertEqual(self.rollups(), expected)
+
+
+class UtilizationReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=9, bookings_per_schedule=3)
+        cls.staff = User.objects.create(username='manager', is_staff=True)
+        starts = Schedule.objects.values_list('start_time', flat=True)
+        cls.first = timezone.localdate(min(starts))
+        cls.last = timezone.localdate(max(starts))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_grids_match_a_per_schedule_count(self):
+        with self.assertNumQueries(3):
+            report = utilization.report(self.first, self.last)
+        self.assertEqual(report['schedules'], 9)
+
+        location = Location.objects.order_by('pk').first()
+        expected = {}
+        for schedule in Schedule.objects.filter(location=location).select_related('fitness_class', 'location'):
+            start = timezone.localtime(schedule.start_time)
+            seats, capacity, room = expected.get((start.weekday(), start.hour), (0, 0, 0))
+            expected[start.weekday(), start.hour] = (
+                seats + schedule.seats_taken, capacity + schedule.fitness_class.capacity,
+                room + schedule.location.capacity,
+            )
+        row = next(row for row in report['locations'] if row['id'] == location.pk)
+        hours = report['hours']
+        for weekday in range(7):
+            for i, hour in enumerate(hours):
+                seats, capacity, room = expected.get((weekday, hour), (0, 0, 0))
+                self.assertEqual(row['grid'][weekday][i], round(seats / capacity, 3) if capacity else None)
+                self.assertEqual(row['room_grid'][weekday][i], round(seats / room, 3) if room else None)
+        self.assertEqual(report['overall']['seats'], 27)
+        self.assertEqual(sorted(row['id'] for row in report['trainers']),
+                         sorted(TrainerProfile.objects.values_list('pk', flat=True)))
+
+    def test_cached_until_the_data_changes(self):
+        report = utilization.cached_report(self.first, self.last)
+        with self.assertNumQueries(1):
+            self.assertEqual(utilization.cached_report(self.first, self.last), report)
+
+        schedule = Schedule.objects.order_by('start_time').first()
+        member = MemberProfile.objects.exclude(booking__schedule=schedule).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(member=member, schedule=schedule)
+        self.assertEqual(utilization.cached_report(self.first, self.last)['overall']['seats'], 28)
+
+    def test_views(self):
+        url = reverse('utilization_report')
+        self.client.force_login(MemberProfile.objects.first().user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.staff)
+        params = {'start': self.first.isoformat(), 'end': self.last.isoformat()}
+        data = self.client.get(url, {**params, 'format': 'json'}).json()
+        self.assertEqual(data['weekdays'][0], 'Mon')
+        self.assertEqual(len(data['locations']), 2)
+        response = self.client.get(url, params)
+        self.assertContains(response, data['locations'][0]['name'])
+        self.assertContains(self.client.get(url, {'start': '2000-01-01', 'end': '2000-01-02'}), 'No classes')
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_gym(schedules=6, bookings_per_schedule=3)
+        cls.staff = User.objects.create(username='finance', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, name, extension, **params):
+        response = self.client.get(reverse('export', args=[name, extension]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_export_has_every_row(self):
+        response, body = self.export('bookings', 'csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual(len(rows), Booking.objects.count())
+        self.assertEqual(sorted(int(row['id']) for row in rows), sorted(Booking.objects.values_list('pk', flat=True)))
+        self.assertEqual(rows[0]['status'], 'booked')
+
+        _, body = self.export('schedules', 'csv')
+        header = body.splitlines()[0].split(',')
+        self.assertIn('fitness_class_name', header)
+
+    def test_date_range_and_incremental_exports(self):
+        schedules = list(Schedule.objects.order_by('start_time'))
+        day = timezone.localdate(schedules[0].start_time)
+        _, body = self.export('schedules', 'jsonl', start=day.isoformat(), end=day.isoformat())
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(
+            [row['id'] for row in rows],
+            [s.pk for s in schedules if timezone.localdate(s.start_time) == day],
+        )
+
+        # Written well before the safety lag, so an export hands them over once.
+        Booking.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        response, body = self.export('bookings', 'jsonl')
+        until = response['X-Export-Until']
+        self.assertEqual(len(body.splitlines()), Booking.objects.count())
+        _, body = self.export('bookings', 'jsonl', since=until)
+        self.assertEqual(body, '')
+
+        # Every kind of write moves a row into the next incremental export.
+        first, second, third = Booking.objects.order_by('pk')[:3]
+        first.status = 'attended'
+        first.save()
+        second.status = 'no_show'
+        second.save(update_fields=['status'])
+        Booking.objects.filter(pk=third.pk).update(status='cancelled')
+        _, body = self.export('bookings', 'jsonl', since=until)
+        rows = {row['id']: row['status'] for row in map(json.loads, body.splitlines())}
+        self.assertEqual(rows, {first.pk: 'attended', second.pk: 'no_show', third.pk: 'cancelled'})
+
+    def test_next_export_overlaps_by_the_safety_lag(self):
+        Booking.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        before = timezone.now()
+        response, _ = self.export('bookings', 'jsonl')
+        since = datetime.fromisoformat(response['X-Export-Until'])
+        self.assertLessEqual(since, before - exports.SAFETY_LAG + timedelta(seconds=5))
+        self.assertGreaterEqual(since, before - exports.SAFETY_LAG)
+
+        # Stamped before that export ended but committed after it: not lost.
+        late = Booking.objects.first()
+        Booking.objects.filter(pk=late.pk).update(updated_at=before - timedelta(seconds=1))
+        _, body = self.export('bookings', 'jsonl', since=since.isoformat())
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], [late.pk])
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('export', args=['users', 'csv'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', args=['bookings', 'xml'])).status_code, 404)
+        response = self.client.get(reverse('export', args=['bookings', 'csv']), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_login(MemberProfile.objects.first().user)
+        self.assertEqual(self.client.get(reverse('export', args=['bookings', 'csv'])).status_code, 403)
+
+    def test_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('export_data', 'workoutlogs', '--format', 'jsonl', '--chunk-size', '3', stdout=out, stderr=err)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(WorkoutLog.objects.values_list('pk', flat=True)))
+        self.assertIn('--since', err.getvalue())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bookings.csv')
+            call_command('export_data', 'bookings', '--output', path, stderr=StringIO())
+            with open(path, newline='') as f:
+                self.assertEqual(len(list(csv.DictReader(f))), Booking.objects.count())
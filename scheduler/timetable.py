@@ -0,0 +1,130 @@
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .models import Schedule
+
+
+CACHE_PREFIX = 'timetable:'
+# Keys carry the location's timetable_version, so a cached week is never
+# stale; the timeout only bounds memory.
+CACHE_TIMEOUT = 60 * 60 * 6
+# How long one request may hold the rendering lock, and how long the others
+# wait for its result before rendering for themselves.
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+LOCK_POLL = 0.05
+
+TIMETABLE_FIELDS = (
+    'start_time', 'end_time',
+    'booked_count', 'attended_count', 'no_show_count',
+    'fitness_class__name', 'fitness_class__capacity',
+    'trainer__user__first_name', 'trainer__user__last_name',
+)
+
+
+def week_of(day):
+    """Monday of the week ``day`` falls in."""
+    return day - timedelta(days=day.weekday())
+
+
+def week_from(value):
+    """Monday of the week named by an ISO date string; the current week if it is missing or invalid."""
+    try:
+        return week_of(date.fromisoformat(value))
+    except (TypeError, ValueError):
+        return week_of(timezone.localdate())
+
+
+def _key(location, week):
+    return f'{CACHE_PREFIX}{location.pk}:{week.isoformat()}:{location.timetable_version}'
+
+
+def _week_schedules(location, week):
+    start = timezone.make_aware(datetime.combine(week, datetime.min.time()))
+    return (
+        Schedule.objects.filter(location=location, start_time__gte=start, start_time__lt=start + timedelta(days=7))
+        .select_related('fitness_class', 'trainer__user')
+        .only(*TIMETABLE_FIELDS)
+        .order_by('start_time')
+    )
+
+
+def render_week(location, week):
+    """Render the timetable fragment for one location and week, uncached."""
+    return _render(location, week, list(_week_schedules(location, week)))
+
+
+async def arender_week(location, week):
+    """render_week() for async views."""
+    return _render(location, week, [schedule async for schedule in _week_schedules(location, week)])
+
+
+def _render(location, week, schedules):
+    days = [(week + timedelta(days=i), []) for i in range(7)]
+    for schedule in schedules:
+        days[timezone.localtime(schedule.start_time).weekday()][1].append(schedule)
+    return render_to_string('location/_timetable.html', {'location': location, 'days': days})
+
+
+def cached_week(location, week):
+    """
+    The timetable fragment for ``location`` and ``week``, from the cache
+    when possible.
+
+    On a miss only the request that wins the lock renders; the others poll
+    for its result for up to LOCK_WAIT seconds, so a busy location costs
+    one render per change instead of one per concurrent request.
+    """
+    key = _key(location, week)
+    html = cache.get(key)
+    if html is not None:
+        return mark_safe(html)
+
+    lock = key + ':lock'
+    if cache.add(lock, 1, LOCK_TIMEOUT):
+        try:
+            html = render_week(location, week)
+            cache.set(key, html, CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock)
+        return mark_safe(html)
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        html = cache.get(key)
+        if html is not None:
+            return mark_safe(html)
+    # The lock holder is slow or died; don't make this request wait longer.
+    return mark_safe(render_week(location, week))
+
+
+async def acached_week(location, week):
+    """cached_week() for async views; waiting for the lock holder doesn't block the event loop."""
+    key = _key(location, week)
+    html = await cache.aget(key)
+    if html is not None:
+        return mark_safe(html)
+
+    lock = key + ':lock'
+    if await cache.aadd(lock, 1, LOCK_TIMEOUT):
+        try:
+            html = await arender_week(location, week)
+            await cache.aset(key, html, CACHE_TIMEOUT)
+        finally:
+            await cache.adelete(lock)
+        return mark_safe(html)
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL)
+        html = await cache.aget(key)
+        if html is not None:
+            return mark_safe(html)
+    return mark_safe(await arender_week(location, week))
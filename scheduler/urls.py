@@ -1,10 +1,12 @@
 from django.urls import path, include
-from . import views
+from . import views, views_async
 from .cbv import BookingListView, BookingCreateView, BookingUpdateView, BookingDeleteView
 
 # --- DRF API ---
 from rest_framework.routers import DefaultRouter
-from .views_api import MemberViewSet, TrainerViewSet, FitnessClassViewSet, BookingViewSet, ScheduleViewSet
+from .views_api import (
+    MemberViewSet, TrainerViewSet, FitnessClassViewSet, BookingViewSet, ScheduleViewSet, NotificationViewSet, ExportView
+)
 
 router = DefaultRouter()
 router.register(r'members', MemberViewSet)
@@ -12,6 +14,7 @@ router.register(r'trainers', TrainerViewSet)
 router.register(r'fitness-classes', FitnessClassViewSet)
 router.register(r'bookings', BookingViewSet)
 router.register(r'schedules', ScheduleViewSet)
+router.register(r'notifications', NotificationViewSet, basename='notification')
 
 
 urlpatterns = [
@@ -40,6 +43,7 @@ urlpatterns = [
 
     # --- Location CRUD ---
     path('locations/add/', views.create_location, name='create_location'),
+    path('locations/<int:pk>/', views.location_detail, name='location_detail'),
     path('locations/<int:pk>/edit/', views.update_location, name='update_location'),
     path('locations/<int:pk>/delete/', views.delete_location, name='delete_location'),
 
@@ -47,6 +51,9 @@ urlpatterns = [
     path('schedule/add/', views.create_schedule, name='create_schedule'),
     path('schedule/<int:pk>/edit/', views.update_schedule, name='update_schedule'),
     path('schedule/<int:pk>/delete/', views.delete_schedule, name='delete_schedule'),
+    path('schedule/series/add/', views.create_schedule_series, name='create_schedule_series'),
+    path('schedule/<int:pk>/edit-following/', views.update_schedule_following, name='update_schedule_following'),
+    path('schedule/<int:pk>/cancel-following/', views.cancel_schedule_following, name='cancel_schedule_following'),
 
     # --- Workout Logs ---
     path('logs/', views.workoutlogs_list, name='workoutlogs_list'),
@@ -54,6 +61,15 @@ urlpatterns = [
     path('logs/<int:pk>/update/', views.update_workoutlog, name='update_workoutlog'),
     path('logs/<int:pk>/delete/', views.delete_workoutlog, name='delete_workoutlog'),
 
+    # --- Notifications ---
+    path('notifications/', views.notifications_inbox, name='notifications_inbox'),
+    path('notifications/read-all/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
+    path('notifications/<int:pk>/read/', views.mark_notification_read, name='mark_notification_read'),
+
+    # --- Reports ---
+    path('reports/attendance/', views.attendance_report, name='attendance_report'),
+    path('reports/utilization/', views.utilization_report, name='utilization_report'),
+
     # --- Booking CBV ---
     path('bookings/create/', BookingCreateView.as_view(), name='bookings_create_redirect'),
     path('bookings-cbv/', BookingListView.as_view(), name='bookings_list_cbv'),
@@ -61,6 +77,16 @@ urlpatterns = [
     path('bookings-cbv/<int:pk>/edit/', BookingUpdateView.as_view(), name='update_booking_cbv'),
     path('bookings-cbv/<int:pk>/delete/', BookingDeleteView.as_view(), name='delete_booking_cbv'),
 
+    # --- Async read paths (ASGI, see safezone/asgi.py) ---
+    path('async/classes/', views_async.fitness_class_list, name='fitness_class_list_async'),
+    path('async/locations/<int:pk>/', views_async.location_detail, name='location_detail_async'),
+    path('api/async/schedules/', views_async.schedule_list_api, name='schedule_list_async'),
+    path('api/async/bookings/', views_async.booking_list_api, name='booking_list_async'),
+    path('api/seats/stream/', views_async.seat_stream, name='seat_stream'),
+
+    # --- Exports ---
+    path('api/exports/<slug:name>.<slug:extension>', ExportView.as_view(), name='export'),
+
     # --- DRF API ---
     path('api/', include(router.urls)),
 ]
@@ -0,0 +1,153 @@
+"""
+Occupancy heatmaps: seats taken against class and room capacity, by
+weekday and hour of day, overall, per location and per trainer.
+
+columns() reads the schedules of a date range in one query, straight into
+a NumPy record array. The seat counters are denormalised on Schedule, so no
+Booking rows are read. report() then sums the columns into weekday x hour
+grids with np.bincount, one pass per grid, instead of looping over objects;
+a year of schedules takes milliseconds.
+
+cached_report() keys the result on the versions of the collections it reads
+(see versions.py), so any write to them retires the cached copy.
+"""
+import hashlib
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from .models import Location, Schedule, TrainerProfile
+from . import versions
+
+
+CACHE_PREFIX = 'utilization:'
+# Keys carry the collection versions, so a cached report is never stale;
+# the timeout only bounds memory.
+CACHE_TIMEOUT = 60 * 60 * 6
+# Every write that can change a report bumps one of these.
+COLLECTIONS = ('schedules', 'bookings', 'fitness_classes', 'locations', 'people')
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+CELLS = len(WEEKDAYS) * 24
+
+ROW = np.dtype([
+    ('weekday', np.int8), ('hour', np.int8), ('location', np.int64), ('trainer', np.int64),
+    ('seats', np.int32), ('class_capacity', np.int32), ('room_capacity', np.int32),
+])
+
+
+def columns(first_day, last_day):
+    """The schedules starting on first_day..last_day, one ROW each; one query."""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(first_day, time.min))
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min))
+    rows = (
+        Schedule.objects.filter(start_time__gte=start, start_time__lt=end)
+        .order_by()
+        .values_list(
+            ExtractIsoWeekDay('start_time', tzinfo=tz) - 1, ExtractHour('start_time', tzinfo=tz),
+            'location_id', 'trainer_id',
+            F('booked_count') + F('attended_count') + F('no_show_count'),
+            'fitness_class__capacity', 'location__capacity',
+        )
+    )
+    return np.fromiter(rows.iterator(chunk_size=5000), dtype=ROW)
+
+
+def _grids(data, group, groups, *fields):
+    """Sum each field into a (groups, 7, 24) grid, ``group`` giving each row's group index."""
+    cell = (group * len(WEEKDAYS) + data['weekday']) * 24 + data['hour']
+    return [
+        np.bincount(cell, weights=data[field], minlength=groups * CELLS).reshape(groups, len(WEEKDAYS), 24)
+        for field in fields
+    ]
+
+
+def _ratio(part, whole):
+    # NaN where nothing was scheduled, rather than a misleading zero.
+    return np.divide(part, whole, out=np.full(np.shape(part), np.nan), where=whole > 0)
+
+
+def _cells(grid, hours):
+    """A weekday x hour grid as nested lists, trimmed to ``hours``, with None for empty cells."""
+    grid = np.round(grid[:, hours.start:hours.stop], 3)
+    return np.where(np.isnan(grid), None, grid).tolist()
+
+
+def _rate(part, whole):
+    return round(float(part / whole), 3) if whole else None
+
+
+def report(first_day, last_day):
+    """
+    Utilization of class capacity (and, per location, of room capacity) for
+    every weekday and hour in the range, as plain lists ready for JSON.
+    Grids cover only the hours that have classes; None marks empty cells.
+    """
+    data = columns(first_day, last_day)
+    result = {
+        'start': first_day.isoformat(), 'end': last_day.isoformat(), 'weekdays': list(WEEKDAYS),
+        'hours': [], 'schedules': len(data),
+    }
+    if not len(data):
+        return {**result, 'overall': None, 'locations': [], 'trainers': []}
+    hours = range(int(data['hour'].min()), int(data['hour'].max()) + 1)
+    result['hours'] = list(hours)
+
+    seats, capacity = _grids(data, np.zeros(len(data), dtype=np.int64), 1, 'seats', 'class_capacity')
+    result['overall'] = {
+        'seats': int(seats.sum()), 'capacity': int(capacity.sum()),
+        'utilization': _rate(seats.sum(), capacity.sum()),
+        'grid': _cells(_ratio(seats, capacity)[0], hours),
+    }
+
+    location_ids, group = np.unique(data['location'], return_inverse=True)
+    seats, capacity, room = _grids(data, group, len(location_ids), 'seats', 'class_capacity', 'room_capacity')
+    class_grid, room_grid = _ratio(seats, capacity), _ratio(seats, room)
+    names = dict(Location.objects.filter(pk__in=location_ids.tolist()).values_list('pk', 'name'))
+    result['locations'] = [
+        {
+            'id': pk, 'name': names.get(pk, ''),
+            'seats': int(seats[i].sum()),
+            'utilization': _rate(seats[i].sum(), capacity[i].sum()),
+            'room_utilization': _rate(seats[i].sum(), room[i].sum()),
+            'grid': _cells(class_grid[i], hours),
+            'room_grid': _cells(room_grid[i], hours),
+        }
+        for i, pk in enumerate(location_ids.tolist())
+    ]
+
+    trainer_ids, group = np.unique(data['trainer'], return_inverse=True)
+    seats, capacity = _grids(data, group, len(trainer_ids), 'seats', 'class_capacity')
+    class_grid = _ratio(seats, capacity)
+    names = {
+        pk: ' '.join(filter(None, (first, last))) or username
+        for pk, first, last, username in TrainerProfile.objects.filter(pk__in=trainer_ids.tolist()).values_list(
+            'pk', 'user__first_name', 'user__last_name', 'user__username')
+    }
+    result['trainers'] = [
+        {
+            'id': pk, 'name': names.get(pk, ''),
+            'seats': int(seats[i].sum()),
+            'utilization': _rate(seats[i].sum(), capacity[i].sum()),
+            'grid': _cells(class_grid[i], hours),
+        }
+        for i, pk in enumerate(trainer_ids.tolist())
+    ]
+    return result
+
+
+def cached_report(first_day, last_day):
+    """report(), from the cache while none of COLLECTIONS has changed."""
+    stamps, _ = versions.current(COLLECTIONS)
+    digest = hashlib.md5(repr(stamps).encode(), usedforsecurity=False).hexdigest()
+    key = f'{CACHE_PREFIX}{first_day.isoformat()}:{last_day.isoformat()}:{digest}'
+    result = cache.get(key)
+    if result is None:
+        result = report(first_day, last_day)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,182 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+# Model -> collection whose version it bumps. A list's ETag is built from
+# the versions of every collection it displays.
+COLLECTIONS = {
+    'scheduler.Schedule': 'schedules',
+    'scheduler.FitnessClass': 'fitness_classes',
+    'scheduler.Location': 'locations',
+    'scheduler.Booking': 'bookings',
+    'scheduler.User': 'people',
+    'scheduler.TrainerProfile': 'people',
+    'scheduler.MemberProfile': 'people',
+}
+
+
+def _model():
+    return apps.get_model('scheduler', 'CollectionVersion')
+
+
+def bump(*names, using=None):
+    """
+    Move the given collections to a new version once the caller's
+    transaction commits.
+
+    Bumping inside that transaction would make every write queue on the
+    same few version rows until it commits. Bumping after it means a reader
+    may, for a moment, get the new data under the old version: the ETag is
+    then older than the body, which costs at most one more full response.
+    All the bumps of one transaction are written together, as one short
+    transaction of their own.
+    """
+    using = using or router.db_for_write(_model())
+    _pending(using).update(names)
+    transaction.on_commit(lambda: _flush(using), using=using)
+
+
+def _pending(using):
+    connection = connections[using]
+    if not hasattr(connection, 'pending_collection_bumps'):
+        connection.pending_collection_bumps = set()
+    return connection.pending_collection_bumps
+
+
+def _flush(using):
+    # The first callback of a transaction writes every pending name; the rest
+    # find nothing left. Names left behind by a rollback only cost an extra bump.
+    names = _pending(using)
+    if not names:
+        return
+    names, connections[using].pending_collection_bumps = sorted(names), set()
+    CollectionVersion = _model()
+    with transaction.atomic(using=using):
+        rows = CollectionVersion.objects.using(using).filter(name__in=names)
+        if rows.update(version=F('version') + 1, updated_at=timezone.now()) < len(set(names)):
+            # Rows are created by migration 0009; recreate any that went missing.
+            CollectionVersion.objects.using(using).bulk_create(
+                [CollectionVersion(name=name) for name in names], ignore_conflicts=True)
+            rows.update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def bump_for(model, using=None):
+    name = COLLECTIONS.get(model._meta.label)
+    if name is not None:
+        bump(name, using=using)
+
+
+def current(names):
+    """(sorted (name, version) pairs, newest updated_at) for ``names``; one query."""
+    return _stamps(names, list(_model().objects.filter(name__in=names).values_list('name', 'version', 'updated_at')))
+
+
+async def acurrent(names):
+    """current() for async views."""
+    rows = _model().objects.filter(name__in=names).values_list('name', 'version', 'updated_at')
+    return _stamps(names, [row async for row in rows])
+
+
+def _stamps(names, rows):
+    rows = sorted(rows)
+    last_modified = max((updated_at for _, _, updated_at in rows), default=None)
+    if len(rows) < len(set(names)):
+        last_modified = None
+    return [(name, version) for name, version, _ in rows], last_modified
+
+
+def conditional_response(request, names, variant, get_response):
+    """
+    Answer a GET for a list built from the collections ``names``.
+
+    Returns 304 Not Modified when the client's If-None-Match or
+    If-Modified-Since still matches, after a single query on the version
+    table; otherwise calls ``get_response()`` and stamps the result.
+    ``variant`` holds anything else the body depends on (user, format).
+
+    The versions are read before the list itself, so a write landing in
+    between can only make the ETag older than the body, never newer.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return get_response()
+
+    etag, timestamp = _validators(*current(names), variant)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = get_response()
+    return _stamp(response, etag, timestamp)
+
+
+async def aconditional_response(request, names, variant, get_response):
+    """conditional_response() for async views; ``get_response`` is a coroutine function."""
+    if request.method not in ('GET', 'HEAD'):
+        return await get_response()
+
+    etag, timestamp = _validators(*await acurrent(names), variant)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = await get_response()
+    return _stamp(response, etag, timestamp)
+
+
+def _validators(stamps, last_modified, variant):
+    digest = hashlib.md5(repr((stamps, variant)).encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"', int(last_modified.timestamp()) if last_modified else None
+
+
+def _stamp(response, etag, timestamp):
+    if response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        if timestamp is not None:
+            response.headers.setdefault('Last-Modified', http_date(timestamp))
+        # Let browsers keep the copy but revalidate it on every use.
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def versioned(*names):
+    """
+    Conditional GET for a function view that lists ``names``.
+
+    Put it under @login_required. The page embeds the user, their unread
+    count and a CSRF token, so all are part of the ETag; pages with flash
+    messages waiting are always rendered. Async views must have request.user
+    and the session loaded already, see views_async.py.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_inner(request, *args, **kwargs):
+                async def get_response():
+                    return await view(request, *args, **kwargs)
+
+                if len(get_messages(request)):
+                    return await get_response()
+                return await aconditional_response(request, names, _page_variant(request), get_response)
+            return async_inner
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            def get_response():
+                return view(request, *args, **kwargs)
+
+            if len(get_messages(request)):
+                return get_response()
+            return conditional_response(request, names, _page_variant(request), get_response)
+        return inner
+    return decorator
+
+
+def _page_variant(request):
+    user = request.user
+    return (user.pk, getattr(user, 'unread_notifications', None), request.COOKIES.get(settings.CSRF_COOKIE_NAME))
@@ -1,12 +1,26 @@
+from datetime import timedelta
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import TrainerProfile, MemberProfile, FitnessClass, Location, Schedule, Booking, WorkoutLog
+from .models import TrainerProfile, MemberProfile, FitnessClass, Location, Schedule, Booking, WorkoutLog, Notification
 from django.contrib import messages
 from .forms import (
     TrainerProfileForm, MemberProfileForm, FitnessClassForm,
-    LocationForm, ScheduleForm, BookingForm, WorkoutLogForm
+    LocationForm, ScheduleForm, BookingForm, WorkoutLogForm,
+    ScheduleSeriesForm, ScheduleFollowingForm
 )
+from .recurrence import create_series, update_following, cancel_following
+from . import analytics, utilization
+from .stats import dashboard_counts
+from .pagination import paginate
+from .access import access_for
+from .replicas import read_from_replica
+from .versions import versioned
+from .timetable import cached_week, week_from
+from django.core.exceptions import ValidationError
 from django.contrib.auth.decorators import login_required, permission_required
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_POST
 from scheduler.models import Booking
 
 
@@ -135,13 +149,17 @@ def delete_class(request, pk):
 
 # LOCATION VIEWS
 @login_required
+@read_from_replica
 def location_detail(request, pk):
     location = get_object_or_404(Location, pk=pk)
-    schedules = Schedule.objects.filter(location=location).select_related('fitness_class', 'trainer', 'trainer__user')
-    
+    week = week_from(request.GET.get('week'))
+
     context = {
         'location': location,
-        'schedules': schedules,
+        'week': week,
+        'previous_week': week - timedelta(weeks=1),
+        'next_week': week + timedelta(weeks=1),
+        'timetable': cached_week(location, week),
     }
     return render(request, 'location/location_detail.html', context)
 # CREATE
@@ -190,9 +208,13 @@ def create_schedule(request):
     if request.method == "POST":
         form = ScheduleForm(request.POST)
         if form.is_valid():
-            form.save()
-            messages.success(request, "Schedule created successfully.")
-            return redirect('schedule_list')
+            try:
+                form.save()
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.success(request, "Schedule created successfully.")
+                return redirect('schedule_list')
     else:
         form = ScheduleForm()
     return render(request, 'schedule/create_schedule.html', {'form': form})
@@ -204,9 +226,13 @@ def update_schedule(request, pk):
     if request.method == "POST":
         form = ScheduleForm(request.POST, instance=schedule)
         if form.is_valid():
-            form.save()
-            messages.info(request, "Schedule updated successfully.")
-            return redirect('schedule_list')
+            try:
+                form.save()
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.info(request, "Schedule updated successfully.")
+                return redirect('schedule_list')
     else:
         form = ScheduleForm(instance=schedule)
     return render(request, 'schedule/update_schedule.html', {'form': form, 'schedule': schedule})
@@ -222,26 +248,77 @@ def delete_schedule(request, pk):
         return redirect('schedule_list')
     return render(request, 'schedule/delete_schedule.html', {'schedule': schedule})
 
+# SCHEDULE SERIES VIEWS
+
+# CREATE
+@login_required
+def create_schedule_series(request):
+    if request.method == "POST":
+        form = ScheduleSeriesForm(request.POST)
+        if form.is_valid():
+            try:
+                schedules = create_series(form.save(commit=False))
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.success(request, f"Created {len(schedules)} schedule entries.")
+                return redirect('schedule_list')
+    else:
+        form = ScheduleSeriesForm()
+    return render(request, 'schedule/create_series.html', {'form': form})
+
+# UPDATE THIS AND FOLLOWING
+@login_required
+def update_schedule_following(request, pk):
+    schedule = get_object_or_404(Schedule, pk=pk, series__isnull=False)
+    if request.method == "POST":
+        form = ScheduleFollowingForm(request.POST)
+        if form.is_valid():
+            try:
+                schedules = update_following(
+                    schedule,
+                    trainer=form.cleaned_data['trainer'],
+                    location=form.cleaned_data['location'],
+                    shift=form.cleaned_data['start_time'] - schedule.start_time,
+                )
+            except ValidationError as e:
+                form.add_error(None, e)
+            else:
+                messages.info(request, f"Updated {len(schedules)} schedule entries.")
+                return redirect('schedule_list')
+    else:
+        form = ScheduleFollowingForm(initial={
+            'trainer': schedule.trainer,
+            'location': schedule.location,
+            'start_time': schedule.start_time,
+        })
+    return render(request, 'schedule/update_following.html', {'form': form, 'schedule': schedule})
+
+# CANCEL THIS AND FOLLOWING
+@login_required
+@permission_required("scheduler.delete_schedule", raise_exception=True)
+def cancel_schedule_following(request, pk):
+    schedule = get_object_or_404(Schedule, pk=pk, series__isnull=False)
+    if request.method == "POST":
+        cancel_following(schedule)
+        messages.warning(request, "Schedule entries cancelled.")
+        return redirect('schedule_list')
+    return render(request, 'schedule/cancel_following.html', {'schedule': schedule})
+
 
 
 from django.shortcuts import render
 from .models import User, TrainerProfile, MemberProfile, FitnessClass, Location, Schedule, Booking
 
 @login_required
+@read_from_replica
 def home(request):
-    user = request.user
+    access = access_for(request.user)
 
     context = {
-        'is_trainer': hasattr(user, "trainerprofile"),
-        'is_member': hasattr(user, "memberprofile"),
-
-        'trainer_count': TrainerProfile.objects.count(),
-        'member_count': MemberProfile.objects.count(),
-        'class_count': FitnessClass.objects.count(),
-        'location_count': Location.objects.count(),
-        'schedule_count': Schedule.objects.count(),
-        'booking_count': Booking.objects.count(),
-        'workoutlog_count': WorkoutLog.objects.count(),
+        'is_trainer': access.is_trainer,
+        'is_member': access.is_member,
+        **dashboard_counts(),
     }
     return render(request, 'home.html', context)
 
@@ -250,20 +327,22 @@ def home(request):
 # LIST
 @login_required
 def workoutlogs_list(request):
-    logs = WorkoutLog.objects.select_related('member').all()
-    return render(request, 'logs/workoutlogs_list.html', {'logs': logs})
+    logs = WorkoutLog.objects.select_related('member__user').all()
+    page = paginate(request, logs, ('-date', '-id'))
+    return render(request, 'logs/workoutlogs_list.html', {'logs': page.object_list, 'page_obj': page})
 
 # CREATE
 @login_required
 def create_workoutlog(request):
-    if not hasattr(request.user, "memberprofile"):
+    access = access_for(request.user)
+    if not access.is_member:
         return HttpResponseForbidden("You are not allowed to create workout logs.")
 
     if request.method == "POST":
         form = WorkoutLogForm(request.POST)
         if form.is_valid():
             workoutlog = form.save(commit=False)
-            workoutlog.member = MemberProfile.objects.get(user=request.user)
+            workoutlog.member_id = access.member_id
             workoutlog.save()
             messages.success(request, "Workout log created successfully.")
             return redirect('workoutlogs_list')
@@ -298,76 +377,200 @@ def delete_workoutlog(request, pk):
 
 
 @login_required
+@read_from_replica
 def trainers_list(request):
-    trainers = TrainerProfile.objects.all()
-    return render(request, 'trainer/trainers_list.html', {'trainers': trainers})
+    trainers = TrainerProfile.objects.select_related('user')
+    page = paginate(request, trainers, ('id',))
+    return render(request, 'trainer/trainers_list.html', {'trainers': page.object_list, 'page_obj': page})
 
 @login_required
+@read_from_replica
 def members_list(request):
     user = request.user
 
-    if user.is_staff or hasattr(user, "trainerprofile"):
-        members = MemberProfile.objects.all()
-    elif hasattr(user, "memberprofile"):
-        members = MemberProfile.objects.filter(user=user)
+    members = MemberProfile.objects.select_related('user')
+    if user.is_staff or access_for(user).is_trainer:
+        members = members.all()
+    elif access_for(user).is_member:
+        members = members.filter(pk=access_for(user).member_id)
     else:
-        members = MemberProfile.objects.none() 
+        members = members.none() 
 
-    return render(request, 'member/members_list.html', {'members': members})
+    page = paginate(request, members, ('id',))
+    return render(request, 'member/members_list.html', {'members': page.object_list, 'page_obj': page})
 
 @login_required
+@read_from_replica
+@versioned('fitness_classes', 'people')
 def fitness_class_list(request):
     user = request.user
 
+    fitness_classes = FitnessClass.objects.select_related('trainer__user')
     if user.is_superuser:
-        fitness_classes = FitnessClass.objects.all()
-    elif hasattr(user, "trainerprofile"):
-        fitness_classes = FitnessClass.objects.filter(trainer=user.trainerprofile)
+        fitness_classes = fitness_classes.all()
+    elif access_for(user).is_trainer:
+        fitness_classes = fitness_classes.filter(trainer_id=access_for(user).trainer_id)
     else:
-        fitness_classes = FitnessClass.objects.all()
+        fitness_classes = fitness_classes.all()
 
-    return render(request, 'class/fitness_class_list.html', {'fitness_classes': fitness_classes})
+    page = paginate(request, fitness_classes, ('id',))
+    return render(request, 'class/fitness_class_list.html', {'fitness_classes': page.object_list, 'page_obj': page})
 
 
 @login_required
+@read_from_replica
+@versioned('locations')
 def locations_list(request):
     locations = Location.objects.all()
-    return render(request, 'location/locations_list.html', {'locations': locations})
+    page = paginate(request, locations, ('id',))
+    return render(request, 'location/locations_list.html', {'locations': page.object_list, 'page_obj': page})
+# Columns schedule/schedule_list.html reads.
+SCHEDULE_LIST_FIELDS = (
+    'start_time', 'end_time', 'series_id',
+    'booked_count', 'attended_count', 'no_show_count',
+    'fitness_class__name', 'fitness_class__capacity',
+    'trainer__user__first_name', 'trainer__user__last_name',
+    'location__name',
+)
+
 @login_required
+@read_from_replica
+@versioned('schedules', 'fitness_classes', 'locations', 'people')
 def schedule_list(request):
     user = request.user
 
+    schedules = Schedule.objects.select_related('fitness_class', 'trainer__user', 'location').only(*SCHEDULE_LIST_FIELDS)
     if user.is_superuser:
-        schedules = Schedule.objects.all()
-    elif hasattr(user, "trainerprofile"):
-        schedules = Schedule.objects.filter(fitness_class__trainer=user.trainerprofile)
+        schedules = schedules.all()
+    elif access_for(user).is_trainer:
+        schedules = schedules.filter(fitness_class__trainer_id=access_for(user).trainer_id)
     else:
         return HttpResponseForbidden("You are not allowed to view schedules.")
 
-    return render(request, 'schedule/schedule_list.html', {'schedules': schedules})
+    page = paginate(request, schedules, ('start_time', 'id'))
+    return render(request, 'schedule/schedule_list.html', {'schedules': page.object_list, 'page_obj': page})
 
 
 @login_required
+@read_from_replica
+@versioned('bookings', 'schedules', 'fitness_classes', 'people')
 def bookings_list(request):
-    bookings = Booking.objects.all()
-    return render(request, 'booking/bookings_list.html', {'bookings': bookings})
+    bookings = Booking.objects.select_related('member__user', 'schedule__fitness_class', 'schedule__trainer__user')
+    page = paginate(request, bookings, ('-booked_at', '-id'))
+    return render(request, 'booking/bookings_list.html', {'bookings': page.object_list, 'page_obj': page})
 
 
 
 @login_required
+@read_from_replica
 def workoutlogs_list(request):
     user = request.user
 
     if user.is_superuser:
-        logs = WorkoutLog.objects.select_related("member").all()
+        logs = WorkoutLog.objects.select_related("member__user").all()
 
-    elif hasattr(user, "memberprofile"):
-        logs = WorkoutLog.objects.filter(member__user=user)
+    elif access_for(user).is_member:
+        logs = WorkoutLog.objects.select_related("member__user").filter(member_id=access_for(user).member_id)
 
     else:
         return HttpResponseForbidden("You are not allowed to view workout logs.")
 
-    return render(request, 'logs/workoutlogs_list.html', {'logs': logs})
+    page = paginate(request, logs, ('-date', '-id'))
+    return render(request, 'logs/workoutlogs_list.html', {'logs': page.object_list, 'page_obj': page})
+
+# NOTIFICATION VIEWS
+
+# INBOX
+@login_required
+@read_from_replica
+def notifications_inbox(request):
+    unread_only = bool(request.GET.get('unread'))
+    notifications = Notification.objects.filter(user=request.user)
+    if unread_only:
+        notifications = notifications.filter(is_read=False)
+    page = paginate(request, notifications, ('-created_at', '-id'))
+    context = {'notifications': page.object_list, 'page_obj': page, 'unread_only': unread_only}
+    return render(request, 'notification/inbox.html', context)
+
+# MARK READ
+@login_required
+@require_POST
+def mark_notification_read(request, pk):
+    notification = get_object_or_404(Notification, pk=pk, user=request.user)
+    if not notification.is_read:
+        notification.is_read = True
+        notification.save(update_fields=['is_read'])
+    return redirect('notifications_inbox')
+
+@login_required
+@require_POST
+def mark_all_notifications_read(request):
+    marked = Notification.objects.mark_all_read(request.user)
+    messages.success(request, f"Marked {marked} notification(s) as read.")
+    return redirect('notifications_inbox')
+
+# REPORTS
+
+def _report_day(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+# ATTENDANCE
+@login_required
+@read_from_replica
+def attendance_report(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden("Only staff can view attendance reports.")
+
+    last_day = _report_day(request.GET.get('end')) or timezone.localdate()
+    first_day = _report_day(request.GET.get('start')) or last_day - timedelta(days=29)
+    if first_day > last_day:
+        first_day, last_day = last_day, first_day
+
+    context = {
+        'start': first_day,
+        'end': last_day,
+        'classes': analytics.class_attendance(first_day, last_day),
+        'trainers': analytics.trainer_attendance(first_day, last_day),
+        'no_shows': analytics.member_no_shows(first_day, last_day),
+        'busiest_hours': analytics.busiest_hours(first_day, last_day),
+    }
+    return render(request, 'reports/attendance.html', context)
+
+# UTILIZATION
+def _weekday_rows(grid):
+    return list(zip(utilization.WEEKDAYS, grid))
+
+@login_required
+@read_from_replica
+@versioned(*utilization.COLLECTIONS)
+def utilization_report(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden("Only staff can view utilization reports.")
+
+    last_day = _report_day(request.GET.get('end')) or timezone.localdate()
+    first_day = _report_day(request.GET.get('start')) or last_day - timedelta(weeks=12, days=-1)
+    if first_day > last_day:
+        first_day, last_day = last_day, first_day
+
+    report = utilization.cached_report(first_day, last_day)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(report)
+
+    context = {
+        'report': report,
+        'start': first_day,
+        'end': last_day,
+        'overall': report['overall'] and _weekday_rows(report['overall']['grid']),
+        'locations': [
+            {**row, 'rows': _weekday_rows(row['grid']), 'room_rows': _weekday_rows(row['room_grid'])}
+            for row in report['locations']
+        ],
+        'trainers': [{**row, 'rows': _weekday_rows(row['grid'])} for row in report['trainers']],
+    }
+    return render(request, 'reports/utilization.html', context)
 
 def custom_permission_denied_view(request, exception=None):
     return render(request, "403.html", status=403)
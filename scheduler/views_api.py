@@ -1,56 +1,204 @@
 from datetime import timedelta
-from rest_framework import viewsets, status
+from django.db import router
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import permissions, serializers, viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.negotiation import BaseContentNegotiation
 from rest_framework.response import Response
-from .models import MemberProfile, TrainerProfile, FitnessClass, Booking, Schedule
-from .serializers import MemberSerializer, TrainerSerializer, FitnessClassSerializer, BookingSerializer, ScheduleSerializer
+from rest_framework.views import APIView
+from .models import MemberProfile, TrainerProfile, FitnessClass, Booking, Schedule, Notification
+from .serializers import MemberSerializer, TrainerSerializer, FitnessClassSerializer, BookingSerializer, ScheduleSerializer, ValuesProjection
+from .serializers import BookingBatchSerializer, NotificationSerializer
+from .reservations import ReservationError, book_batch, save_booking
+from .versions import conditional_response
+from .access import access_for
+from .replicas import ReplicaReadMixin
+from . import exports
+
+
+class ValuesListMixin:
+    """
+    Serve list() from a values() projection of the serializer's fields
+    instead of building model instances and running the serializer per row.
+    The browsable API keeps the normal path.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        projection = ValuesProjection.for_serializer(self.get_serializer_class())
+        queryset = projection.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(projection.render(page))
+        return Response(projection.render(queryset))
+
+
+class ConditionalListMixin:
+    """
+    ETag/Last-Modified on list(): a client polling an unchanged list gets a
+    304 after one query on the version table. Set ``version_collections``
+    to every collection the serializer reads.
+    """
+    version_collections = ()
+
+    def list(self, request, *args, **kwargs):
+        variant = (request.user.pk, request.accepted_renderer.format)
+        return conditional_response(
+            request, self.version_collections, variant,
+            lambda: super(ConditionalListMixin, self).list(request, *args, **kwargs),
+        )
 
 
 # MEMBER API
 
-class MemberViewSet(viewsets.ModelViewSet):
-    queryset = MemberProfile.objects.all()
+class MemberViewSet(ReplicaReadMixin, ValuesListMixin, viewsets.ModelViewSet):
+    queryset = MemberProfile.objects.select_related('user')
     serializer_class = MemberSerializer
 
 
 # TRAINER API
 
-class TrainerViewSet(viewsets.ModelViewSet):
-    queryset = TrainerProfile.objects.all()
+class TrainerViewSet(ReplicaReadMixin, ValuesListMixin, viewsets.ModelViewSet):
+    queryset = TrainerProfile.objects.select_related('user')
     serializer_class = TrainerSerializer
 
 # FITNESS CLASS API
 
-class FitnessClassViewSet(viewsets.ModelViewSet):
-    queryset = FitnessClass.objects.all()
+class FitnessClassViewSet(ReplicaReadMixin, ConditionalListMixin, ValuesListMixin, viewsets.ModelViewSet):
+    queryset = FitnessClass.objects.select_related('trainer__user')
     serializer_class = FitnessClassSerializer
+    version_collections = ('fitness_classes', 'people')
 
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'trainerprofile'):
-            return FitnessClass.objects.filter(trainer=user.trainerprofile)
+        access = access_for(self.request.user)
+        if access.is_trainer:
+            return self.queryset.filter(trainer_id=access.trainer_id)
         return super().get_queryset()
 
 
 # BOOKING API
 
-class BookingViewSet(viewsets.ModelViewSet):
-    queryset = Booking.objects.all()
+class BookingViewSet(ReplicaReadMixin, ConditionalListMixin, ValuesListMixin, viewsets.ModelViewSet):
+    queryset = Booking.objects.select_related('member__user', 'schedule__fitness_class')
     serializer_class = BookingSerializer
+    keyset_ordering = ('-booked_at', '-id')
+    version_collections = ('bookings', 'schedules', 'fitness_classes', 'people')
 
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'trainerprofile'):
-            return Booking.objects.filter(fitness_class__trainer=user.trainerprofile)
+        access = access_for(self.request.user)
+        if access.is_trainer:
+            return self.queryset.filter(schedule__fitness_class__trainer_id=access.trainer_id)
         return super().get_queryset()
 
+    def perform_create(self, serializer):
+        self._reserve(serializer, waitlist=True)
+
+    def perform_update(self, serializer):
+        self._reserve(serializer)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Book and cancel many at once:
+        {"create": [{"member": 1, "schedule": 2}, ...], "cancel": [booking ids]}.
+        Responds with a result per operation, in the same order.
+        """
+        serializer = BookingBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        created, cancelled = book_batch(
+            creates=[(item['member'], item['schedule']) for item in serializer.validated_data['create']],
+            cancels=serializer.validated_data['cancel'],
+        )
+        return Response({'create': created, 'cancel': cancelled})
+
+    def _reserve(self, serializer, waitlist=False):
+        booking = serializer.instance or Booking()
+        for attr, value in serializer.validated_data.items():
+            setattr(booking, attr, value)
+        try:
+            serializer.instance = save_booking(booking, waitlist=waitlist)
+        except ReservationError as e:
+            raise serializers.ValidationError({'schedule': [str(e)]})
+
 # SCHEDULE API
 
-class ScheduleViewSet(viewsets.ModelViewSet):
-    queryset = Schedule.objects.all()
+class ScheduleViewSet(ReplicaReadMixin, ConditionalListMixin, ValuesListMixin, viewsets.ModelViewSet):
+    queryset = Schedule.objects.select_related('fitness_class', 'trainer__user')
     serializer_class = ScheduleSerializer
+    keyset_ordering = ('start_time', 'id')
+    version_collections = ('schedules', 'fitness_classes', 'people')
 
     def get_queryset(self):
-        user = self.request.user
-        if hasattr(user, 'trainerprofile'):
-            return Schedule.objects.filter(trainer=user.trainerprofile)
+        access = access_for(self.request.user)
+        if access.is_trainer:
+            return self.queryset.filter(trainer_id=access.trainer_id)
         return super().get_queryset()
+
+
+# NOTIFICATION API
+
+class NotificationViewSet(ReplicaReadMixin, ValuesListMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = NotificationSerializer
+    keyset_ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(user=self.request.user)
+        if self.request.query_params.get('unread'):
+            queryset = queryset.filter(is_read=False)
+        return queryset
+
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        notification = self.get_object()
+        if not notification.is_read:
+            notification.is_read = True
+            notification.save(update_fields=['is_read'])
+        return Response(self.get_serializer(notification).data)
+
+    @action(detail=False, methods=['post'], url_path='read-all')
+    def read_all(self, request):
+        marked = Notification.objects.mark_all_read(request.user)
+        return Response({'marked': marked, 'unread': 0})
+
+
+# EXPORTS
+
+class URLFormatNegotiation(BaseContentNegotiation):
+    """The export format comes from the URL, whatever the Accept header says; errors render as JSON."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class ExportView(ReplicaReadMixin, APIView):
+    """
+    GET /api/exports/<bookings|schedules|workoutlogs>.<csv|jsonl>, with
+    optional ?start=, ?end= and ?since=; see exports.py. Staff only. The
+    X-Export-Until header is the ``since`` for the next incremental export,
+    a little before this one's end (exports.resume_point).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    content_negotiation_class = URLFormatNegotiation
+
+    def get(self, request, name, extension):
+        export = exports.EXPORTS.get(name)
+        if export is None or extension not in exports.FORMATS:
+            raise NotFound()
+        try:
+            filters = exports.parse_filters(request.query_params)
+        except ValueError as e:
+            raise serializers.ValidationError({'detail': [str(e)]})
+
+        until = timezone.now()
+        # Bound to the database chosen now: the rows are read after the view returns.
+        rows = exports.stream(export, extension, until=until, using=router.db_for_read(export.model), **filters)
+        response = StreamingHttpResponse(rows, content_type=exports.FORMATS[extension])
+        response['Content-Disposition'] = f'attachment; filename="{name}-{until:%Y%m%dT%H%M%S}.{extension}"'
+        response['X-Export-Until'] = exports.resume_point(until).isoformat()
+        return response
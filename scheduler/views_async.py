@@ -0,0 +1,183 @@
+"""
+Async versions of the hot read paths, and the live seat stream, for the
+ASGI worker mode described in safezone/asgi.py.
+
+They return what their sync counterparts do: the class list and location
+pages render the same templates, and the schedule and booking lists give
+the same JSON as the API's list(). The difference is that a request waiting
+on the database or the cache no longer holds a worker thread, so one ASGI
+worker keeps serving other requests meanwhile.
+
+Templates are rendered synchronously, so everything a page shows must be
+fetched before render(): with_user loads the user (and with it the session,
+which the messages framework reads), and querysets are evaluated through
+the async ORM.
+"""
+import json
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, render
+from django.views.decorators.http import require_safe
+
+from .access import access_for
+from .models import Booking, FitnessClass, Location, Schedule
+from .pagination import apaginate
+from .renderers import FastJSONRenderer
+from .replicas import read_from_replica
+from .seats import config as seat_stream_config, hub, snapshots
+from .serializers import BookingSerializer, ScheduleSerializer, ValuesProjection
+from .timetable import acached_week, week_from
+from .versions import aconditional_response, versioned
+
+
+def with_user(view):
+    """
+    Resolve request.user before an async view runs. The lazy request.user
+    would otherwise query the database synchronously the first time a
+    template or decorator touches it.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await request.auser()
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def _access(user):
+    return await sync_to_async(access_for)(user)
+
+
+# PAGES
+
+@login_required
+@read_from_replica
+@with_user
+@versioned('fitness_classes', 'people')
+async def fitness_class_list(request):
+    user = request.user
+
+    fitness_classes = FitnessClass.objects.select_related('trainer__user')
+    if not user.is_superuser:
+        access = await _access(user)
+        if access.is_trainer:
+            fitness_classes = fitness_classes.filter(trainer_id=access.trainer_id)
+
+    page = await apaginate(request, fitness_classes, ('id',))
+    return render(request, 'class/fitness_class_list.html', {'fitness_classes': page.object_list, 'page_obj': page})
+
+
+@login_required
+@read_from_replica
+@with_user
+async def location_detail(request, pk):
+    location = await aget_object_or_404(Location, pk=pk)
+    week = week_from(request.GET.get('week'))
+
+    context = {
+        'location': location,
+        'week': week,
+        'previous_week': week - timedelta(weeks=1),
+        'next_week': week + timedelta(weeks=1),
+        'timetable': await acached_week(location, week),
+    }
+    return render(request, 'location/location_detail.html', context)
+
+
+# API
+# Plain async views rather than viewsets: DRF's views are sync-only. They
+# authenticate by session, like the browsable API, and only serve JSON.
+
+async def _api_list(request, queryset, serializer_class, ordering, collections):
+    projection = ValuesProjection.for_serializer(serializer_class)
+
+    async def get_response():
+        page = await apaginate(request, projection.values(queryset), ordering)
+        data = {
+            'next': page.next_url and request.build_absolute_uri(page.next_url),
+            'previous': page.previous_url and request.build_absolute_uri(page.previous_url),
+            'results': projection.render(page.object_list),
+        }
+        return HttpResponse(FastJSONRenderer().render(data), content_type='application/json')
+
+    return await aconditional_response(request, collections, (request.user.pk, 'json'), get_response)
+
+
+@require_safe
+@read_from_replica
+@with_user
+async def schedule_list_api(request):
+    schedules = Schedule.objects.all()
+    access = await _access(request.user)
+    if access.is_trainer:
+        schedules = schedules.filter(trainer_id=access.trainer_id)
+    return await _api_list(
+        request, schedules, ScheduleSerializer, ('start_time', 'id'),
+        ('schedules', 'fitness_classes', 'people'),
+    )
+
+
+@require_safe
+@read_from_replica
+@with_user
+async def booking_list_api(request):
+    bookings = Booking.objects.all()
+    access = await _access(request.user)
+    if access.is_trainer:
+        bookings = bookings.filter(schedule__fitness_class__trainer_id=access.trainer_id)
+    return await _api_list(
+        request, bookings, BookingSerializer, ('-booked_at', '-id'),
+        ('bookings', 'schedules', 'fitness_classes', 'people'),
+    )
+
+
+# LIVE SEATS
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+@login_required
+@require_safe
+async def seat_stream(request):
+    """
+    Server-sent events with the seats of ``?schedule=<pk>`` (repeatable):
+    the current state of each first, then an event whenever a booking moves
+    it. Needs the ASGI server; see seats.py for how changes arrive.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the endless stream would hold a whole worker per client.
+        return HttpResponse("The seat stream needs the ASGI server, see safezone/asgi.py.", status=501)
+    options = seat_stream_config()
+    try:
+        schedule_ids = sorted({int(pk) for pk in request.GET.getlist('schedule')})
+    except ValueError:
+        return HttpResponseBadRequest("schedule must be a schedule id.")
+    if not schedule_ids or len(schedule_ids) > options['MAX_SCHEDULES']:
+        return HttpResponseBadRequest(f"Watch between 1 and {options['MAX_SCHEDULES']} schedules.")
+
+    async def events():
+        subscriber = hub.subscribe(schedule_ids)
+        try:
+            yield 'retry: 5000\n\n'
+            # Subscribed first, so no change can fall between this and the updates.
+            for event in (await sync_to_async(snapshots)(schedule_ids)).values():
+                yield _sse('seats', event)
+            while True:
+                updates = await subscriber.updates(options['KEEPALIVE_SECONDS'])
+                if not updates:
+                    yield ': keepalive\n\n'
+                for event in updates:
+                    yield _sse('seats', event)
+        finally:
+            hub.unsubscribe(subscriber)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response